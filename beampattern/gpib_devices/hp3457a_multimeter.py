@@ -1,4 +1,5 @@
 from beampattern.logging import logger
+from beampattern.utils.beampattern_exceptions import BeamPatternGeneralError
 from myGpib import Gpib, GpibError
 import time
 import types
@@ -6,36 +7,30 @@ import numpy
 
 logger.name = __name__
 
+READY = 0x10    # status byte: ready for instructions
+LINE_FREQ = 50.0   # Hz; the slower mains gives the longer NPLC integration
+
 class Multimeter(Gpib):
     """A Gpib helper class for interfacing with the HP3457A
     digital multimeter"""
     def __init__(self, name='hp3457a', pad=22, sad=0,
-                 asksleep=0.01):
+                 asksleep=0.01, poll_interval=0.02, burst_timeout=10.0):
         Gpib.__init__(self, name=name, pad=pad, sad=sad)
         self.asksleep = asksleep
+        self.poll_interval = poll_interval
+        self.burst_timeout = burst_timeout
+        self.nplc = 10
+        self.burst = False
+        self.burst_nrdgs = None
         self.idstr = self.idstring()
         logger.debug("Multimeter Id: %s" % self.idstr)
 
-    def readuntil(self, term=''):
+    def readuntil(self, term='\n'):
         """Read until termination character"""
-        mystr = ''
-        numterms = 0
         try:
-            s = self.read(len=1)
+            return self.readline(term).strip()
         except GpibError:
-            return mystr
-        if s == term:
-            numterms += 1
-        mystr += s
-        while numterms < 2:
-            try:
-                s = self.read(len=1)
-            except GpibError:
-                return mystr
-            if s == term:
-                numterms += 1
-            mystr += s
-        return mystr
+            return ''
 
     def askuntil(self, text):
         self.write(text)
@@ -58,18 +53,78 @@ class Multimeter(Gpib):
         #self.write('NRDGS 6,SYN')   #six readings ~ 1s total
         #self.write('TRIG HOLD')
 
-    def setup_ac(self, nplc=10, range=10.0, nrdgs=2, resolution=0.001):
+    def setup_ac(self, nplc=10, range=10.0, nrdgs=2, resolution=0.001,
+                 burst=False):
         """Setup for AC operations
         FIXEDZ 1 only for DC
         """
         self.nrdgs = nrdgs
+        self.nplc = nplc
         for command in ('FIXEDZ 1', 'ACV %s,%s' % (range, resolution),
                         'NPLC %s' % nplc, 'NRDGS %d,AUTO' % nrdgs,
                         'TRIG AUTO'):
             self.write(command)
             time.sleep(self.asksleep)
+        if burst:
+            self.setup_burst(nrdgs=nrdgs)
+
+    def setup_burst(self, nrdgs=2):
+        """
+        Burst mode: a single trigger takes nrdgs readings into
+        the reading memory, and they are recalled in one transfer
+        as 64 bit binary reals. The trigger is held between points
+        """
+        self.write('TRIG HOLD;END ALWAYS;MFORMAT DREAL;OFORMAT DREAL;NRDGS %d,AUTO' % nrdgs)
+        time.sleep(self.asksleep)
+        self.burst_nrdgs = nrdgs
+        self.burst = True
+
+    def take_readings_burst(self, nrdgs=2):
+        """
+        Clears the reading memory, triggers nrdgs readings into it
+        and recalls them with RMEM
+        """
+        if nrdgs != self.burst_nrdgs:
+            self.write('NRDGS %d,AUTO' % nrdgs)
+            self.burst_nrdgs = nrdgs
+        self.write('MEM FIFO;TRIG SGL')
+        self.wait_for_readings(nrdgs)
+        self.write('RMEM 1,%d' % nrdgs)
+        try:
+            data = self.read_exactly(8*nrdgs)
+        except GpibError:
+            raise BeamPatternGeneralError("take_readings_burst",
+                                          "Timed out reading %d readings from memory" % nrdgs)
+        volt = numpy.frombuffer(data, dtype='>f8')
+        logger.debug("Burst readings: %s" % volt)
+        return volt.mean(), volt.std()
+
+    def wait_for_readings(self, nrdgs):
+        """
+        Waits for a triggered burst of nrdgs readings to finish,
+        by serial polling the ready for instructions bit. The bit
+        may not have dropped yet when the first poll is answered,
+        so a set bit only counts once it has been seen clear, or
+        once the readings should have been integrated
+        """
+        expected = nrdgs*float(self.nplc)/LINE_FREQ
+        t0 = time.time()
+        busy = False
+        while True:
+            elapsed = time.time() - t0
+            if self.serial_poll() & READY:
+                if busy or elapsed >= expected:
+                    return elapsed
+            else:
+                busy = True
+            if elapsed > expected + self.burst_timeout:
+                raise BeamPatternGeneralError("take_readings_burst",
+                                              "Readings not finished after %.1f seconds" % elapsed)
+            time.sleep(self.poll_interval)
 
     def take_readings(self, nrdgs=2):
+        if self.burst:
+            return self.take_readings_burst(nrdgs=nrdgs)
         self.write('NRDGS %d,SYN' % nrdgs)
         time.sleep(self.asksleep)
         self.write('TRIG HOLD')
@@ -13,29 +13,16 @@ class Multimeter(Gpib):
                  asksleep=0.02):
         Gpib.__init__(self, name=name, pad=pad, sad=sad)
         self.asksleep = asksleep
+        self.burst = False
         #self.idstr = self.idstring()
         #logger.debug("Multimeter Id: %s" % self.idstr)
 
-    def readuntil(self, term=''):
+    def readuntil(self, term='\n'):
         """Read until termination character"""
-        mystr = ''
-        numterms = 0
         try:
-            s = self.read(len=1)
+            return self.readline(term).strip()
         except GpibError:
-            return mystr
-        if s == term:
-            numterms += 1
-        mystr += s
-        while numterms < 2:
-            try:
-                s = self.read(len=1)
-            except GpibError:
-                return mystr
-            if s == term:
-                numterms += 1
-            mystr += s
-        return mystr
+            return ''
 
     def askuntil(self, text):
         self.write(text)
@@ -55,7 +42,8 @@ class Multimeter(Gpib):
         #self.write('NRDGS 6,SYN')   #six readings ~ 1s total
         #self.write('TRIG HOLD')
 
-    def setup_ac(self, nplc=10.0, range=10.0, nrdgs=2, resolution=0.001):
+    def setup_ac(self, nplc=10.0, range=10.0, nrdgs=2, resolution=0.001,
+                 burst=False):
         """Setup for AC operations
         FIXEDZ 1 only for DC
         """
@@ -66,8 +54,32 @@ class Multimeter(Gpib):
         cmd += 'N5'  #5digits on
         self.write(cmd)
         time.sleep(self.asksleep)
+        if burst:
+            self.setup_burst()
+
+    def setup_burst(self):
+        """
+        Burst mode. The HP3478A has no reading memory, so the
+        readings of a point still come back one per trigger; burst
+        mode leaves the meter in single trigger mode between points
+        and reads each reading as soon as it is triggered, instead
+        of switching trigger modes and sleeping around every reading
+        """
+        self.write('T3')
+        time.sleep(self.asksleep)
+        self.burst = True
+
+    def take_readings_burst(self, nrdgs=2):
+        volt = numpy.zeros(nrdgs, dtype=float)
+        for i in range(nrdgs):
+            self.trigger()
+            volt[i] = float(self.read())
+        logger.debug("Burst readings: %s" % volt)
+        return volt.mean(), volt.std()
 
     def take_readings(self, nrdgs=2):
+        if self.burst:
+            return self.take_readings_burst(nrdgs=nrdgs)
         self.write('T3')  #single trigger mode
         time.sleep(self.asksleep)
         volt = numpy.zeros(nrdgs, dtype=float)
@@ -8,7 +8,18 @@ import struct
 import numpy
 import time
 
-from beampattern.utils.beampattern_exceptions import BeamPatternArgumentError
+from beampattern.utils.beampattern_exceptions import BeamPatternArgumentError, BeamPatternGeneralError
+from beampattern.logging import logger
+
+logger.name = __name__
+
+# Binary output formats: FORM2 and FORM3 are IEEE 32 and 64 bit
+# floats, FORM5 is 32 bit floats in PC byte order. Data comes as
+# a #A block whose 2 byte byte count is in the same byte order.
+# (count format, numpy dtype)
+BINARY_FORMATS = {'FORM2': ('>H', '>f4'),
+                  'FORM3': ('>H', '>f8'),
+                  'FORM5': ('<H', '<f4')}
 
 class Analyzer_8510c(Gpib):
     """
@@ -20,6 +31,12 @@ class Analyzer_8510c(Gpib):
         Gpib.__init__(self, name=name, pad=pad, sad=sad, 
                       timeout=timeout)
         self.numfrequencies = 0
+        self.measures = []        # S-parameters read at each point
+        self.measure = None       # the one currently selected
+        self.data_format = 'FORM3'
+        self.max_retries = 3      # retries of a failed sweep readout
+        self.sweep_timeout = 60.0 # seconds to wait for a sweep to complete
+        self.read_count = 0
         self.read_error_count = 0
 
     def set_cw_frequency_list(self, freqlist):
@@ -34,8 +51,8 @@ class Analyzer_8510c(Gpib):
             self.write('SADD; CENT %s GHz; SDON;' % (freq/1.e9))
         # remove duplicates; finish edits
         self.write('DUPD; EDITDONE;')
-        self.write('FORM5; OUTPFREL;')
-        self.freq_list = self.read_form5()
+        self.write('%s; OUTPFREL;' % self.data_format)
+        self.freq_list = list(self.read_block(self.data_format))
         
     def readuntil(self, term=''):
         """Read until no more characters"""
@@ -48,38 +65,61 @@ class Analyzer_8510c(Gpib):
                 readmore = False
         return mystr
 
-    def read_form5(self, size=None):
+    def read_block(self, form='FORM5'):
+        """
+        Reads one #A block of FORM2, FORM3 or FORM5 data and
+        returns its values as a float array. The block is read
+        over as many bus reads as it takes
+        """
+        if form not in BINARY_FORMATS:
+            raise BeamPatternArgumentError("form", "%s is not a binary data format" % form)
+        countfmt, dtype = BINARY_FORMATS[form]
+        header = self.read_exactly(4)
+        if header[:2] != '#A':
+            raise BeamPatternGeneralError("Analyzer_8510C", "%s data is corrupt" % form)
+        num_bytes = struct.unpack(countfmt, header[2:4])[0]
+        data = self.read_exactly(num_bytes)
+        return numpy.frombuffer(data, dtype=dtype).astype(float)
+
+    def read_form5(self):
         """
         Format 5 data is 4 byte floating point 
-        data
+        data. Returns None on a bad read
         """
-        #data = self.readuntil()
         try:
-            if size is None:
-                data = self.read()
-            else:
-                data = self.read(size)
-            if data[:2] != '#A':
-                raise BeamPatternArgumentError("Analyzer_8510C", 
-                                               "Form5 data is corrupt")
-            num_bytes = struct.unpack('H', data[2:4])[0]
-            print "num_bytes : %s; data available; %s" % (num_bytes, len(data[4:]))
-            if num_bytes != len(data[4:]):
-                return None
-            unpack_data = []
-            for i in range(num_bytes/4):
-                unpack_data.append(struct.unpack('f', data[4+i*4:8+i*4])[0])
-            return unpack_data
-        except GpibError:
+            return list(self.read_block('FORM5'))
+        except (GpibError, BeamPatternGeneralError):
             return None
+
+    def wait_complete(self):
+        """
+        Waits for the reply to an OPC? prefixed command, which
+        the analyzer sends once that command has completed
+        """
+        t0 = time.time()
+        while True:
+            try:
+                reply = self.read()
+                break
+            except GpibError:
+                # the bus timeout is shorter than a long sweep
+                if (time.time() - t0) > self.sweep_timeout:
+                    raise
+        if reply.strip() != '1':
+            raise BeamPatternGeneralError("Analyzer_8510C", "Unexpected OPC? reply %r" % reply)
         
     def initialize_vna(self, freq_list, measure='S22', avg_value = 32):
         """
         Setup the VNA with a requisite frequency list
-        and setup single parameter given by measure
+        and setup the parameter given by measure, or the first
+        of a list of parameters to be read by get_multi_data
         """
+        if isinstance(measure, basestring):
+            measure = [measure]
+        self.measures = list(measure)
         self.set_cw_frequency_list(freq_list)
-        self.write('%s;' % measure)
+        self.measure = self.measures[0]
+        self.write('%s;' % self.measure)
         self.write('REIP;')
         time.sleep(0.5);
         self.write('SINC; SING; AUTO; CONT;')
@@ -93,19 +133,54 @@ class Analyzer_8510c(Gpib):
         self.write('ATTP1 0; ATTP2 0;')
         print ("Wrote atten pos")
 
-    def get_freq_data(self):        
-        read_again = True
-        while(read_again):
-            self.write('FORM5; SING; OUTPDATA;')
-            time.sleep(0.5)
-            # 4*2 for 4bytes times real+imag, +4 for #A and counts
-            size = len(self.freq_list)*4*2 + 4
-            data = self.read_form5(size)
-            if data is not None:
-                read_again = False
-            else:
+    def get_freq_data(self, measure=None):
+        """
+        Takes a single sweep and returns the complex data at each
+        list frequency, of measure if given or else of the current
+        parameter. The sweep is waited on with OPC? and the
+        data read in data_format. A failed readout is counted in
+        read_error_count and retried up to max_retries times
+        """
+        npoints = len(self.freq_list)
+        select = ''
+        if measure is not None and measure != self.measure:
+            select = '%s; ' % measure
+        for attempt in range(self.max_retries + 1):
+            try:
+                # drop anything left from an earlier failed readout
+                self.reader.clear()
+                self.write('%s%s; OPC?; SING;' % (select, self.data_format))
+                if select:
+                    self.measure = measure
+                    select = ''
+                self.wait_complete()
+                self.write('OUTPDATA;')
+                data = self.read_block(self.data_format)
+                if len(data) != 2*npoints:
+                    raise BeamPatternGeneralError("Analyzer_8510C", "Got %d values for %d frequencies" % \
+                                                  (len(data), npoints))
+                self.read_count += 1
+                return data[0::2] + 1j*data[1::2]
+            except (GpibError, BeamPatternGeneralError), e:
                 self.read_error_count += 1
-        data = numpy.array(data)
-        numrows = len(data)/2
-        data.shape = (numrows, 2)
-        return data[:,0] + 1j*data[:,1]
+                logger.warning("VNA readout failed (%s); %d of %d readouts failed" % \
+                               (e, self.read_error_count, self.read_count + self.read_error_count))
+                self.clear()
+        raise BeamPatternGeneralError("Analyzer_8510C", "No data after %d attempts" % (self.max_retries + 1))
+
+    def get_multi_data(self):
+        """
+        Sweeps each of the measures set up by initialize_vna and
+        returns the complex data as an array of shape
+        (nmeasures, nfrequencies). The parameters are taken
+        starting from the one currently selected, so alternate
+        calls run through them in opposite directions and the
+        first needs no switch
+        """
+        order = range(len(self.measures))
+        if self.measure != self.measures[0]:
+            order.reverse()
+        data = numpy.zeros((len(self.measures), len(self.freq_list)), dtype='complex')
+        for m in order:
+            data[m] = self.get_freq_data(self.measures[m])
+        return data
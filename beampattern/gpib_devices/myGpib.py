@@ -1,5 +1,8 @@
 #!/usr/bin/env python
 import gpib
+import struct
+from beampattern.utils.timing import phase
+from beampattern.utils.buffered_reader import BufferedReader
 
 RQS = (1<<11)
 SRQ = (1<<12)
@@ -53,6 +56,8 @@ class Gpib:
             self.eot = True
         else:
             self.eot = False
+        # bus reads end at EOI, so a chunk is one message at most
+        self.reader = BufferedReader(self._recv)
         if self._own:
             self.get_status()
             
@@ -81,14 +86,30 @@ class Gpib:
     def write(self,text):
         if self.eot:
             text += "\n"
-        gpib.write(self.id, text)
+        with phase('io'):
+            gpib.write(self.id, text)
         
     def writebin(self,text,len):
-        gpib.writebin(self.id,text,len)
+        with phase('io'):
+            gpib.writebin(self.id,text,len)
+
+    def _recv(self, size):
+        with phase('io'):
+            return gpib.read(self.id, size)
 
     def read(self,len=512):
-        self.res = gpib.read(self.id,len)
+        self.res = self.reader.read(len)
         return self.res.replace('\n','').replace('\r','')
+
+    def readline(self, term='\n'):
+        """Read up to and including the termination characters"""
+        self.res = self.reader.read_until(term)
+        return self.res
+
+    def read_exactly(self, len):
+        """Read len bytes, over as many bus reads as it takes"""
+        self.res = self.reader.read_exactly(len)
+        return self.res
     
     def ask(self, text,readlen=512):
         "Send a write and then do a read"
@@ -96,10 +117,11 @@ class Gpib:
         return self.read(len=readlen)
 
     def readbin(self,len=512):
-        self.res = gpib.readbin(self.id,len)
+        self.res = self.reader.read(len)
         return self.res
 
     def clear(self):
+        self.reader.clear()
         gpib.clear(self.id)
         
     def interface_clear(self):
@@ -116,8 +138,18 @@ class Gpib:
     #    self.spb = gpib.rsp(self.id)
     #    return self.spb
 
+    def serial_poll(self):
+        """Returns the status byte of the device, as an int"""
+        with phase('io'):
+            spb = gpib.serial_poll(self.id)
+        if isinstance(spb, str):
+            spb = struct.unpack('B', spb)[0]
+        self.spb = spb
+        return self.spb
+
     def trigger(self):
-        gpib.trigger(self.id)
+        with phase('io'):
+            gpib.trigger(self.id)
         
     #def ren(self,val):
     #    gpib.ren(self.id,val)
@@ -12,11 +12,13 @@ import time
 import gpib
 import struct
 
+from beampattern.utils.unidex_motion import UnidexMotion
+from beampattern.utils.timing import phase
 from beampattern.logging import logger
 
 logger.name = __name__
 
-class Unidex11(Gpib):
+class Unidex11(UnidexMotion, Gpib):
     """
     A GPIB helper class for interfacing with the Unidex 11
     motion controller
@@ -30,6 +32,10 @@ class Unidex11(Gpib):
         self.pos_el = 0.0
         self.limits = (-180.0, 180.0) # az and el position limits
         self.max_feedrate = 20000  #to be safe
+        self.expected_move_time = None
+        self.az_vel = 0.0          # actual velocity of last az move in deg/s
+        self.el_vel = 0.0
+        self.on_motion = None      # called as on_motion(pos_az, pos_el, settled)
         
     def reset(self):
         """
@@ -47,23 +53,21 @@ class Unidex11(Gpib):
         if axis not in ('X', 'Y', 'x', 'y'):
             logger.error("Only X & Y axes can be homed")
             return
+        self._notify_motion(False)
         self.write('I H %s *' % axis.upper())
+        self.expected_move_time = None
         if axis.upper() == 'X':
             self.pos_az = 0.0
         if axis.upper() == 'Y':
             self.pos_el = 0.0
 
-    def command_in_progress(self):
-        """
-        Returns True if some command is
-        in progress
-        """
-        i = gpib.serial_poll(self.id)
-        motion = struct.unpack('b', i)[0] & 0x20
-        if motion:
-            return True
-        else:
-            return False
+    def status_byte(self):
+        """Serial poll status byte of the controller"""
+        with phase('io'):
+            i = gpib.serial_poll(self.id)
+        if isinstance(i, str):
+            i = struct.unpack('B', i)[0]
+        return i
 
     def _set_position(self, axis, feedrate, numsteps):
         """
@@ -74,14 +78,10 @@ class Unidex11(Gpib):
             logger.error("Only X & Y axes can be moved")
             return
         self.write('I %s F%d D%d *' % (axis.upper(), feedrate, numsteps))
-        time.sleep(0.25)
-        # count = 0
-        # while self.command_in_progress():
-        #     time.sleep(0.5)
-        #     count += 1
-        #     if count % 4 == 0:
-        #         print "Command in progress, Time = %.2f seconds" % (count*0.5)
-        # time.sleep(0.5)
+        if feedrate > 0:
+            self.expected_move_time = abs(numsteps)/float(feedrate)
+        else:
+            self.expected_move_time = 0.0
         logger.debug("Position set")
             
     def set_azimuth(self, az_command, az_vel):
@@ -97,6 +97,8 @@ class Unidex11(Gpib):
         feedrate = int(abs(az_vel)/self.step_size_az)
         if feedrate > self.max_feedrate:
             feedrate = self.max_feedrate
+        self.az_vel = feedrate*self.step_size_az
+        self._notify_motion(False)
         self._set_position('X', feedrate, numsteps)
         self.pos_az = az_command
 
@@ -113,6 +115,8 @@ class Unidex11(Gpib):
         feedrate = int(abs(el_vel)/self.step_size_el)
         if feedrate > self.max_feedrate:
             feedrate = self.max_feedrate
+        self.el_vel = feedrate*self.step_size_el
+        self._notify_motion(False)
         self._set_position('Y', feedrate, numsteps)
         self.pos_el = el_command
 
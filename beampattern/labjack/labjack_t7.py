@@ -1,8 +1,23 @@
 from labjack import ljm
 from beampattern.utils.beampattern_exceptions import BeamPatternArgumentError
+from beampattern.utils.timing import phase, settle
+
+FIO_MASK = 0xff
+DIO_LINES = 23  # FIO0-7, EIO0-7, CIO0-3, MIO0-2
+
+def channel_select_states(nchannels=8):
+    """
+    FIO states that select each of nchannels multiplexed channels:
+    the channel's line pulled low and the others held high
+    """
+    allhigh = (1 << nchannels) - 1
+    return [allhigh & ~(1 << channel) for channel in range(nchannels)]
 
 class LabJackT7(object):
-    def __init__(self, debug=True):
+    def __init__(self, debug=True, settle_time=0.050):
+        self.settle_time = settle_time  # seconds after a change of the lines
+        self.states = channel_select_states()
+        self.state = None               # last state written, None if unknown
         self.handle = ljm.openS("ANY", "ANY", "ANY")
         info = ljm.getHandleInfo(self.handle)
         if debug:
@@ -15,6 +30,39 @@ class LabJackT7(object):
             raise BeamPatternArgumentError("LabJack T7", "channel should be >= 0 and <8")
         if level not in (0, 1):
             raise BeamPatternArgumentError("LabJack T7", "level should be 0 or 1")
-        ljm.eWriteName(self.handle, 'FIO%1d' % channel, level)
+        with phase('io'):
+            ljm.eWriteName(self.handle, 'FIO%1d' % channel, level)
+        self.state = None
+
+    def digital_state(self, state, mask=FIO_MASK):
+        """
+        Sets all the digital lines in mask to the bits of state in
+        one write; lines outside the mask are left alone
+        """
+        with phase('io'):
+            if mask == FIO_MASK:
+                ljm.eWriteName(self.handle, 'FIO_STATE', state & FIO_MASK)
+            else:
+                inhibit = ((1 << DIO_LINES) - 1) & ~mask
+                ljm.eWriteNames(self.handle, 3, ['DIO_INHIBIT', 'DIO_DIRECTION', 'DIO_STATE'],
+                                [inhibit, mask, state & mask])
+        if mask == FIO_MASK:
+            self.state = state & FIO_MASK
+        else:
+            self.state = None
+
+    def select_channel(self, channel):
+        """
+        Switches to channel using the precomputed states, then
+        waits settle_time. Does nothing if already selected.
+        Returns True if the lines were switched
+        """
+        if channel not in range(len(self.states)):
+            raise BeamPatternArgumentError("LabJack T7", "channel should be >= 0 and <%d" % len(self.states))
+        if self.states[channel] == self.state:
+            return False
+        self.digital_state(self.states[channel])
+        settle(self.settle_time)
+        return True
 
             
@@ -0,0 +1,152 @@
+"""
+Pieces of the map loops shared by the map engines: the
+checkpoint journal handling, the stage move callback, the
+on-the-fly sweep and, for the detector (voltage) maps, the
+loop order choice and the tune, read and done callbacks handed
+to the scan loops of beampattern.map.scan_planning.
+"""
+
+import time
+import numpy
+
+from beampattern.map import scan_planning
+from beampattern.utils import timing
+from beampattern.utils.checkpoint import MapJournal, journal_filename
+from beampattern.utils.beampattern_exceptions import BeamPatternGeneralError
+from beampattern.logging import logger
+
+logger.name = __name__
+
+
+def stage_mover(uni, velocity, azimuths=None, elevations=None):
+    """
+    Returns move(j), which takes the stage to azimuths[j] and
+    then elevations[j] at velocity, for whichever of the two
+    position lists are given, and waits for each move
+    """
+    def move(j):
+        if azimuths is not None:
+            uni.set_azimuth(azimuths[j], velocity)
+            wait = uni.wait_for_motion()
+            logger.info("Stage got to %.3f degrees az in %.2f seconds" % (azimuths[j], wait))
+        if elevations is not None:
+            uni.set_elevation(elevations[j], velocity)
+            wait = uni.wait_for_motion()
+            logger.info("Stage got to %.3f degrees el in %.2f seconds" % (elevations[j], wait))
+    return move
+
+
+def otf_sweep(uni, x_start, x_end, velocity, sample):
+    """
+    Slews the stage from x_start to x_end in azimuth at velocity
+    while calling sample() as fast as it will go. Returns the
+    azimuth reconstructed from the commanded trajectory and
+    the value of every sample
+    """
+    uni.set_azimuth(x_end, velocity)
+    t_start = time.time()
+    az_vel = uni.az_vel
+    duration = uni.expected_move_time
+    times = []
+    values = []
+    while (time.time() - t_start) < duration:
+        t0 = time.time()
+        val = sample()
+        times.append(0.5*(t0 + time.time()))
+        values.append(val)
+    uni.wait_for_motion()
+    positions = scan_planning.otf_positions(times, t_start, x_start, x_end, az_vel)
+    return positions, numpy.array(values)
+
+
+class JournaledMapMixin(object):
+    """
+    Checkpoint journal of a map engine, kept next to
+    self.filename when the general checkpoint option is on
+    """
+    def _open_journal(self, resume=False):
+        """
+        Opens the map journal, and loads it if resuming an
+        interrupted map
+        """
+        if self.general.checkpoint or resume:
+            self.journal = MapJournal(journal_filename(self.filename),
+                                      fsync_interval=self.general.fsync_interval)
+        else:
+            self.journal = MapJournal(None)
+        if resume:
+            self.journal.load()
+
+    def resume_map(self):
+        """Continues the interrupted map recorded in the journal"""
+        if self.journal.start is None:
+            raise BeamPatternGeneralError("resume_map", "No journal loaded to resume from")
+        kwargs = dict([(str(key), val) for key, val in self.journal.start['kwargs'].items()])
+        getattr(self, self.journal.start['method'])(**kwargs)
+
+
+class DetectorMapMixin(JournaledMapMixin):
+    """
+    Scan helpers of the detector map engines (AzimuthMap and
+    BeamMap), which tune self.syn over self.synth.freq (GHz) and
+    read the detector with take_readings
+    """
+    def prepare_map(self, adjust_boresight, measure_ac_offset):
+        """
+        Measures the voltage offset and the boresight power levels
+        for a map, unless they are in the journal of a resumed map
+        """
+        if measure_ac_offset:
+            if not self.journal.restore_state(self, ('offset', 'offset_std')):
+                self.measure_offset()
+                self.journal.save_state(offset=self.offset, offset_std=self.offset_std)
+        if adjust_boresight:
+            if not self.journal.restore_state(self, ('rfpower',)):
+                self.check_boresight_power()
+                self.journal.save_state(rfpower=self.rfpower)
+
+    def choose_loop_order(self, positions, velocity, settle):
+        """
+        Returns the map loop order, 'position' or 'frequency', see
+        choose_loop_order in scan_planning. settle is the time the
+        map loop waits after a retune.
+        """
+        return scan_planning.choose_loop_order(self.synth.loop_order, positions,
+                                               self.synth.freq,
+                                               lambda freq: self.syn.set_freq(freq*1e9),
+                                               velocity, self.unidex.move_overhead,
+                                               settle)
+
+    def _scan_callbacks(self, section, describe, plot, key=None,
+                        adjust_boresight=False, settle=0.2):
+        """
+        Returns the tune(i), read(i, j) and done(i, j) callbacks of a
+        scan over the map frequencies. Readings are journaled under
+        section, by key(j) (by j if key is None); describe(j) gives
+        position j for the log and plot(i, j, vmean) updates the
+        live plot.
+        """
+        if key is None:
+            key = lambda j: j
+
+        def tune(i):
+            freq = self.synth.freq[i]
+            self.syn.set_freq(freq*1e9)
+            timing.settle(0.1)
+            if adjust_boresight:
+                self.syn.set_power_level(self.rfpower[i])
+                logger.info("For Freq: %s GHz, adjusted power level to: %s dBm" % (freq, self.rfpower[i]))
+            timing.settle(settle)
+
+        def read(i, j):
+            vmean, vstd = self.take_readings(nrdgs=self.nrdgs)
+            self.journal.point(section, key(j), i, (vmean, vstd))
+            logger.info("%s, Freq: %.3f, Voltage: %.6g +/- %.6g" % (describe(j), self.synth.freq[i], vmean, vstd))
+            with timing.phase('plot'):
+                plot(i, j, vmean)
+            return vmean, vstd
+
+        def done(i, j):
+            return self.journal.get(section, key(j), i)
+
+        return tune, read, done
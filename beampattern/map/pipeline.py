@@ -0,0 +1,74 @@
+"""
+Pipelined map loop. The serial map loops wait on one thing at a
+time: the stage move, then the synthesizer (or detector channel)
+settling, then each reading, then the file write and plot. Here
+the move to the next position and the setup of its first
+measurement are started on worker threads the moment the last
+reading at the current position is in, and the finished row is
+written and plotted while they run.
+
+The overlap uses the threads of beampattern.utils.background; the
+instruments must be safe to drive from more than one thread, as
+the Prologix session is.
+"""
+
+from beampattern.utils.background import Worker
+from beampattern.utils import timing
+from beampattern.logging import logger
+
+logger.name = __name__
+
+
+def pipelined_scan(npos, nset, prepare, move, read, emit, done=None):
+    """
+    Run a position-outer scan over npos positions with nset
+    measurements (frequencies, or frequency and channel pairs) at
+    each. At position j, measurement k is set up with prepare(k)
+    and taken with read(k, j); once all are taken emit(j, row) is
+    called in the calling thread with the row of read values.
+    move(j) and the first prepare() of the next position run on
+    the stage and source worker threads while the current row is
+    emitted. No reading is taken while the stage is moving.
+    If given, done(k, j) returns the value of a point that was
+    already taken (when resuming a map) or None; such points are
+    not measured again and positions with none left to measure
+    are not visited.
+    """
+    todo = []
+    for j in range(npos):
+        if done is None:
+            todo.append(range(nset))
+        else:
+            todo.append([k for k in range(nset) if done(k, j) is None])
+    active = [j for j in range(npos) if todo[j]]
+    stage = Worker(name='stage')
+    source = Worker(name='source')
+    moving = None
+    preparing = None
+    try:
+        if active:
+            moving = stage.submit(move, active[0])
+            preparing = source.submit(prepare, todo[active[0]][0])
+        for j in range(npos):
+            row = [None]*nset
+            if done is not None:
+                for k in range(nset):
+                    row[k] = done(k, j)
+            if todo[j]:
+                with timing.phase('motion'):
+                    moving.result()
+                for n, k in enumerate(todo[j]):
+                    if n == 0:
+                        with timing.phase('settle'):
+                            preparing.result()
+                    else:
+                        prepare(k)
+                    row[k] = read(k, j)
+                later = active[active.index(j)+1:]
+                if later:
+                    moving = stage.submit(move, later[0])
+                    preparing = source.submit(prepare, todo[later[0]][0])
+            emit(j, row)
+    finally:
+        stage.stop()
+        source.stop()
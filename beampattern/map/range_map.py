@@ -3,9 +3,15 @@ from beampattern.gpib_devices.unidex11 import Unidex11
 from beampattern.gpib_devices.hp83620a import HP83620A
 from beampattern.gpib_devices.hp3478a_multimeter import Multimeter
 from beampattern.serial import Fluke
+from beampattern.map.scan_planning import position_grid, bin_samples
+from beampattern.map.scan_planning import frequency_outer_scan, scan_start
+from beampattern.map.scan_planning import adaptive_scan, db_levels
+from beampattern.map.map_common import DetectorMapMixin, stage_mover, otf_sweep
 from beampattern.utils.beampattern_exceptions import BeamPatternGeneralError, BeamPatternArgumentError
+from beampattern.utils import timing
+from beampattern.utils.live_plot import LivePlotter
+from beampattern.utils.mapfile import MapWriter
 from beampattern.logging import logger
-import matplotlib.pyplot as plt
 
 import sys, os
 import time
@@ -19,14 +25,14 @@ class ConfigObj(object):
         pass
 
 
-class AzimuthMap(object):
+class AzimuthMap(DetectorMapMixin):
     """
     Given a config object dictionary cfg, and a filename to
     write output data to and a datetime_str, this class
     check for correct configuration and does a map
     """
     def __init__(self, cfg, filename, datetime_str, cfgfile, 
-                 debug=True):
+                 debug=True, resume=False):
         self.plot_symbols = ['o', 's', 'v', '^', '<', '>',
                              '1', '2', '3', '4', 'p', '*',
                              'h', 'H', '+', 'x', 'D', 'd']
@@ -43,6 +49,7 @@ class AzimuthMap(object):
         if not self.check_map_azimuth_parameters():
             logger.error("Map Parameters Malformed")
             raise BeamPatternGeneralError("AzimuthMap", "Map Parameters Malformed")
+        self._open_journal(resume)
 
     def _get_config_parameters(self):
         for key, val in self.cfg.items():
@@ -68,14 +75,24 @@ class AzimuthMap(object):
         if self.devices.use_unidex:
             try:
                 self.uni = Unidex11()
-                time.sleep(2.0)
-                self.uni.reset()
-                time.sleep(2.0)
-                self.uni.home(axis='Y')
-                time.sleep(10.0)
-                self.uni.home(axis='X')
-                time.sleep(10.0)
-                logger.info("Unidex 11 available, reset and homed")
+                self.uni.poll_interval = self.unidex.poll_interval
+                self.uni.motion_margin = self.unidex.motion_margin
+                self.uni.home_timeout = self.unidex.home_timeout
+                if self.journal.stage is not None:
+                    # resuming, and the stage stopped at a known position
+                    self.uni.pos_az, self.uni.pos_el = self.journal.stage
+                    logger.info("Unidex 11 available, stage at az %.3f el %.3f from journal" % \
+                                self.journal.stage)
+                else:
+                    time.sleep(2.0)
+                    self.uni.reset()
+                    time.sleep(2.0)
+                    self.uni.home(axis='Y')
+                    self.uni.wait_for_motion()
+                    self.uni.home(axis='X')
+                    self.uni.wait_for_motion()
+                    logger.info("Unidex 11 available, reset and homed")
+                self.uni.on_motion = self.journal.motion
             except:
                 logger.error("Unidex11 Not available")
                 raise BeamPatternGeneralError("open_devices", "Unidex11 Not available")
@@ -90,7 +107,8 @@ class AzimuthMap(object):
                 self.multimeter.setup_ac(nplc=self.multi.nplc,
                                          range=self.multi.range,
                                          nrdgs=self.multi.nrdgs,
-                                         resolution=self.multi.resolution)
+                                         resolution=self.multi.resolution,
+                                         burst=self.multi.burst)
                 self.nrdgs = self.multi.nrdgs
                 print self.nrdgs, self.multi.nplc, self.multi.range, self.multi.nrdgs, self.multi.resolution
             except:
@@ -124,13 +142,15 @@ class AzimuthMap(object):
     def take_readings(self, nrdgs=2):
         if self.devices.use_multi:
             try:
-                vmean, vstd = self.multimeter.take_readings(nrdgs=nrdgs)
+                with timing.phase('detector'):
+                    vmean, vstd = self.multimeter.take_readings(nrdgs=nrdgs)
                 return vmean, vstd
             except:
                 raise BeamPatternGeneralError("take_readings", "Cannot read HP voltmeter")
         else:
             try:
-                vmean, vstd = self.flukemeter.measure(nrdgs=nrdgs)
+                with timing.phase('detector'):
+                    vmean, vstd = self.flukemeter.measure(nrdgs=nrdgs)
                 return vmean, vstd
             except:
                 raise BeamPatternGeneralError("take_readings", "Cannot read Fluke voltmeter")
@@ -197,8 +217,7 @@ class AzimuthMap(object):
             #not already at home
             logger.info("Go to home position")
             self.uni.home(axis='X')
-            logger.info("Waiting 10 seconds to be sure")
-            time.sleep(10.0)
+            self.uni.wait_for_motion()
         self.rfpower = []
         for freq in self.synth.freq:
             self.syn.set_freq(freq*1e9)
@@ -226,8 +245,7 @@ class AzimuthMap(object):
         """
         logger.info("Go to home position")
         self.uni.home(axis='X')
-        logger.info("Waiting 10 seconds to be sure")
-        time.sleep(10.0)
+        self.uni.wait_for_motion()
         logger.info("Measuring zero point offset, turning off source")
         self.syn.output_off()
         time.sleep(3.0)
@@ -239,7 +257,7 @@ class AzimuthMap(object):
         logger.info("Turning synth source back on")
         time.sleep(0.3)
         
-    def make_header(self, adjust_boresight=False):
+    def make_header(self, adjust_boresight=False, otf=False, adaptive=None):
         hdr = ""
         hdr += "# Beammap Timestamp: %s\n" % self.datetime_str
         hdr += "# Configfile: %s\n" % self.cfgfile
@@ -250,6 +268,10 @@ class AzimuthMap(object):
                (self.azimuth.xmin, self.azimuth.xmax, self.azimuth.xinc)
         hdr += "# Map Velocity: %.2f deg/s; Slew speed: %.2f deg/s\n" % \
                (self.azimuth.xmap_vel, self.azimuth.xslew_vel)
+        if otf:
+            hdr += "# On-the-fly map: values are mean and std of readings binned in xinc cells\n"
+        if adaptive is not None:
+            hdr += "# Adaptive map: %d positions in %d passes; xinc_min: %.3f deg\n" % adaptive
         hdr += "# Multimeter settings: NPLC: %s; nrdgs: %d; range: %s; res: %.5g\n" % \
                (self.multi.nplc, self.multi.nrdgs, self.multi.range, self.multi.resolution)
         if self.devices.use_fluke:
@@ -267,21 +289,65 @@ class AzimuthMap(object):
             hdr += "# Data columns:\n"
             hdr += "# Az"
             for freq in self.synth.freq:
-                if self.nrdgs > 1:
+                if self.nrdgs > 1 or otf:
                     hdr += ",f%.1fGHz,f%.1fGHz std" % (freq, freq)
                 else:
                     hdr += ",f%.1fGHz" % freq
             hdr += "\n"
         return hdr
 
+    def open_map_file(self, header, adjust_boresight=False):
+        """Returns a MapWriter for the map in the configured output format"""
+        metadata = {'freq': self.synth.freq,
+                    'offset': self.offset,
+                    'offset_std': self.offset_std}
+        if adjust_boresight:
+            metadata['rfpower'] = self.rfpower
+        return MapWriter(self.filename, header, output_format=self.general.output_format,
+                         columns=('mean', 'std'), config=self.cfg, metadata=metadata)
+
+    def start_plotter(self, ylim=(-0.5, 10.0)):
+        """Starts the live plot of detector voltage against azimuth"""
+        labels = ['%.3f GHz' % freq for freq in self.synth.freq]
+        return LivePlotter(labels, (self.azimuth.xmin, self.azimuth.xmax), ylim,
+                           symbols=self.plot_symbols, figsize=self.plot.figsize,
+                           refresh=self.plot.refresh,
+                           enabled=self.plot.live).start()
+
+    def _make_map_frequency_outer(self, fp, azimuths, adjust_boresight=False):
+        """
+        Frequency-outer map loop. The synthesizer is tuned once per
+        frequency and the stage swept across the map for it, in
+        alternating directions. Each row is written as soon as the
+        last sweep has taken it, so the file fills while the map
+        runs and keeps the position-outer layout.
+        """
+        tune, read, done = self._scan_callbacks('map', lambda j: "Az: %.2f" % azimuths[j],
+                                                lambda i, j, v: self.plotter.add(i, azimuths[j], v),
+                                                adjust_boresight=adjust_boresight)
+        move = stage_mover(self.uni, self.azimuth.xmap_vel, azimuths=azimuths)
+        def emit(j, row):
+            fp.begin_row(azimuths[j])
+            for vmean, vstd in row:
+                if self.nrdgs > 1:
+                    fp.add(vmean-self.offset, vstd)
+                else:
+                    fp.add(vmean-self.offset, 0.0)
+            fp.end_row()
+
+        frequency_outer_scan(len(azimuths), len(self.synth.freq),
+                             tune, move, read, done=done, emit=emit)
+
     def make_map(self, adjust_boresight=False, measure_ac_offset=True,
                  all_offset=False):
-        if measure_ac_offset:
-            self.measure_offset()
-        if adjust_boresight:
-            self.check_boresight_power()            
-        self.uni.home(axis='X')
-        time.sleep(10.0)
+        resuming = self.journal.begin(self.filename, self.datetime_str, self.cfgfile, 'make_map',
+                                      adjust_boresight=adjust_boresight,
+                                      measure_ac_offset=measure_ac_offset,
+                                      all_offset=all_offset)
+        self.prepare_map(adjust_boresight, measure_ac_offset)
+        if not resuming:
+            self.uni.home(axis='X')
+            self.uni.wait_for_motion()
         azimuths = []
         if all_offset:
             self.syn.output_off()            
@@ -291,45 +357,202 @@ class AzimuthMap(object):
                 x = self.azimuth.xmax
             azimuths.append(x)
         azimuths = numpy.array(azimuths)
-        wait = (abs(azimuths[0]-self.uni.pos_az)/self.azimuth.xslew_vel) + 1.0
-        self.uni.set_azimuth(azimuths[0], self.azimuth.xslew_vel)
-        logger.info("Sleeping for %.2f seconds while stage gets to start of map" % wait)
-        time.sleep(wait)
+        order = self.choose_loop_order(azimuths, self.azimuth.xmap_vel, 0.3)
+        if not resuming:
+            start = scan_start(len(azimuths), len(self.synth.freq), order)
+            self.uni.set_azimuth(azimuths[start], self.azimuth.xslew_vel)
+            wait = self.uni.wait_for_motion()
+            logger.info("Stage got to start of map in %.2f seconds" % wait)
 
-        fp = open(self.filename, 'w')
-        header = self.make_header(adjust_boresight=adjust_boresight)
-        fp.write(header)
-        plt.ion()
-        plt.plot([self.azimuth.xmin, self.azimuth.xmax], [0, 0], 'r-')
-        plt.xlim(self.azimuth.xmin, self.azimuth.xmax)
-        plt.ylim(-0.5, 10.0)
-        plt.draw()
-        for az in azimuths:
-            wait = (abs(az-self.uni.pos_az)/self.azimuth.xmap_vel) + 1.0
-            self.uni.set_azimuth(az, self.azimuth.xmap_vel)
-            logger.info("Sleeping for %.2f seconds while stage gets to %.1f degrees" % (wait, az))
-            time.sleep(wait)
-            fp.write("%.3f" % az)
-            for i, freq in enumerate(self.synth.freq):
-                self.syn.set_freq(freq*1e9)
-                time.sleep(0.1)
-                if adjust_boresight:
-                    self.syn.set_power_level(self.rfpower[i])
-                    logger.info("For Freq: %s GHz, adjusted power level to: %s dBm" % (freq, self.rfpower[i]))
-                time.sleep(0.2)
-                vmean, vstd = self.take_readings(nrdgs=self.nrdgs)
-                logger.info("Az: %.2f, Freq: %.3f, Voltage: %.6g +/- %.6g" % (az, freq, vmean, vstd))
+        fp = self.open_map_file(self.make_header(adjust_boresight=adjust_boresight),
+                                adjust_boresight=adjust_boresight)
+        self.plotter = self.start_plotter()
+        if order == 'frequency':
+            self._make_map_frequency_outer(fp, azimuths, adjust_boresight=adjust_boresight)
+        else:
+            for j, az in enumerate(azimuths):
+                if not self.journal.row_done('map', j, len(self.synth.freq)):
+                    self.uni.set_azimuth(az, self.azimuth.xmap_vel)
+                    wait = self.uni.wait_for_motion()
+                    logger.info("Stage got to %.1f degrees in %.2f seconds" % (az, wait))
+                fp.begin_row(az)
+                for i, freq in enumerate(self.synth.freq):
+                    saved = self.journal.get('map', j, i)
+                    if saved is None:
+                        self.syn.set_freq(freq*1e9)
+                        timing.settle(0.1)
+                        if adjust_boresight:
+                            self.syn.set_power_level(self.rfpower[i])
+                            logger.info("For Freq: %s GHz, adjusted power level to: %s dBm" % (freq, self.rfpower[i]))
+                        timing.settle(0.2)
+                        vmean, vstd = self.take_readings(nrdgs=self.nrdgs)
+                        self.journal.point('map', j, i, (vmean, vstd))
+                    else:
+                        vmean, vstd = saved
+                    logger.info("Az: %.2f, Freq: %.3f, Voltage: %.6g +/- %.6g" % (az, freq, vmean, vstd))
+                    if self.nrdgs > 1:
+                        fp.add(vmean-self.offset, vstd)
+                    else:
+                        fp.add(vmean-self.offset, 0.0)
+                    with timing.phase('plot'):
+                        self.plotter.add(i, az, vmean)
+                fp.end_row()
+                         
+        self.uni.home(axis='X')
+        self.uni.wait_for_motion()
+        logger.info("Map Completed, Saving data file %s" % self.filename)
+        fp.close()
+        self.journal.finish()
+        self.plotter.finish()
+
+    def _take_positions(self, azimuths, adjust_boresight=False):
+        """
+        Measures every frequency at each of azimuths, in the order
+        given, and returns the (vmean, vstd) readings as [j][i].
+        Readings are journaled by azimuth, since the positions of an
+        adaptive map are not known in advance
+        """
+        tune, read, done = self._scan_callbacks('adaptive', lambda j: "Az: %.3f" % azimuths[j],
+                                                lambda i, j, v: self.plotter.add(i, azimuths[j], v),
+                                                key=lambda j: azimuths[j],
+                                                adjust_boresight=adjust_boresight)
+        move = stage_mover(self.uni, self.azimuth.xmap_vel, azimuths=azimuths)
+
+        nfreq = len(self.synth.freq)
+        if self.choose_loop_order(azimuths, self.azimuth.xmap_vel, 0.3) == 'frequency':
+            return frequency_outer_scan(len(azimuths), nfreq, tune, move, read, done=done)
+        results = []
+        for j in range(len(azimuths)):
+            if not self.journal.row_done('adaptive', azimuths[j], nfreq):
+                move(j)
+            row = []
+            for i in range(nfreq):
+                reading = done(i, j)
+                if reading is None:
+                    tune(i)
+                    reading = read(i, j)
+                row.append(reading)
+            results.append(row)
+        return results
+
+    def make_adaptive_map(self, adjust_boresight=False, measure_ac_offset=True):
+        """
+        Adaptive map. A coarse pass on the xinc grid is followed by
+        passes that add points halfway across the intervals where the
+        beam level (in dB, down to the dynamic_range floor) changes
+        or curves the most, i.e. the main lobe and the nulls, until
+        no interval needs splitting, xinc_min is reached or the point
+        or time budget is spent. The data file holds the sorted
+        positions in the usual layout.
+        """
+        resuming = self.journal.begin(self.filename, self.datetime_str, self.cfgfile,
+                                      'make_adaptive_map', adjust_boresight=adjust_boresight,
+                                      measure_ac_offset=measure_ac_offset)
+        self.prepare_map(adjust_boresight, measure_ac_offset)
+        if not resuming:
+            self.uni.home(axis='X')
+            self.uni.wait_for_motion()
+        coarse = position_grid(self.azimuth.xmin, self.azimuth.xmax, self.azimuth.xinc)
+        if not resuming:
+            self.uni.set_azimuth(coarse[0], self.azimuth.xslew_vel)
+            wait = self.uni.wait_for_motion()
+            logger.info("Stage got to start of map in %.2f seconds" % wait)
+
+        def levels(values):
+            # values is (npos, nfreq, 2) of vmean, vstd
+            return db_levels(values[:, :, 0] - self.offset, self.azimuth.dynamic_range)
+
+        self.plotter = self.start_plotter()
+        azimuths, values, npasses = adaptive_scan(coarse,
+                                                  lambda azs: self._take_positions(azs, adjust_boresight),
+                                                  levels, self.azimuth.xinc_min,
+                                                  self.azimuth.refine_threshold,
+                                                  max_points=self.azimuth.max_points,
+                                                  max_time=self.azimuth.max_time)
+        logger.info("Adaptive map took %d positions in %d passes (%d on the coarse grid)" % \
+                    (len(azimuths), npasses, len(coarse)))
+        fp = self.open_map_file(self.make_header(adjust_boresight=adjust_boresight,
+                                                 adaptive=(len(azimuths), npasses,
+                                                           self.azimuth.xinc_min)),
+                                adjust_boresight=adjust_boresight)
+        for j, az in enumerate(azimuths):
+            fp.begin_row(az)
+            for vmean, vstd in values[j]:
                 if self.nrdgs > 1:
-                    fp.write(",%.6g,%.6g" % (vmean-self.offset, vstd))
+                    fp.add(vmean-self.offset, vstd)
                 else:
-                    fp.write(",%.6g,%.6g" % (vmean-self.offset, 0.0))
-                plt.plot(az, vmean, self.plot_symbols[i])
-                plt.draw()
-            fp.write('\n')
-                         
-        time.sleep(10.0)
+                    fp.add(vmean-self.offset, 0.0)
+            fp.end_row()
         self.uni.home(axis='X')
+        self.uni.wait_for_motion()
         logger.info("Map Completed, Saving data file %s" % self.filename)
         fp.close()
+        self.journal.finish()
+        self.plotter.finish()
+
+    def _otf_sample(self):
+        vmean, vstd = self.take_readings(nrdgs=1)
+        return vmean
 
-                
+    def make_otf_map(self, adjust_boresight=False, measure_ac_offset=True):
+        """
+        On-the-fly map. For each frequency the stage is slewed once
+        across xmin..xmax at xmap_vel while the meter is read as fast
+        as it will go. The azimuth of each reading is reconstructed
+        from the commanded trajectory and the readings are binned
+        into the xinc grid. Successive frequencies slew in opposite
+        directions so there is no slew back between them.
+        """
+        if measure_ac_offset:
+            self.measure_offset()
+        if adjust_boresight:
+            self.check_boresight_power()
+        self.uni.home(axis='X')
+        self.uni.wait_for_motion()
+        azimuths = position_grid(self.azimuth.xmin, self.azimuth.xmax,
+                                 self.azimuth.xinc)
+        # run in and out by half a cell so the end cells are fully sampled
+        half = self.azimuth.xinc/2.0
+        ends = (max(self.azimuth.xmin - half, self.uni.limits[0]),
+                min(self.azimuth.xmax + half, self.uni.limits[1]))
+        self.uni.set_azimuth(ends[0], self.azimuth.xslew_vel)
+        wait = self.uni.wait_for_motion()
+        logger.info("Stage got to start of map in %.2f seconds" % wait)
+
+        vmean = numpy.zeros((len(azimuths), len(self.synth.freq)))
+        vstd = numpy.zeros((len(azimuths), len(self.synth.freq)))
+        self.plotter = self.start_plotter()
+        for i, freq in enumerate(self.synth.freq):
+            self.syn.set_freq(freq*1e9)
+            timing.settle(0.1)
+            if adjust_boresight:
+                self.syn.set_power_level(self.rfpower[i])
+                logger.info("For Freq: %s GHz, adjusted power level to: %s dBm" % (freq, self.rfpower[i]))
+            timing.settle(0.2)
+            x_start = self.uni.pos_az
+            if x_start == ends[0]:
+                x_end = ends[1]
+            else:
+                x_end = ends[0]
+            positions, values = otf_sweep(self.uni, x_start, x_end,
+                                          self.azimuth.xmap_vel, self._otf_sample)
+            mean, std, count = bin_samples(positions, values, azimuths)
+            logger.info("Freq: %.3f, %d readings filled %d of %d cells" % \
+                        (freq, len(values), (count > 0).sum(), len(azimuths)))
+            vmean[:, i] = mean
+            vstd[:, i] = std
+            with timing.phase('plot'):
+                self.plotter.set_line(i, azimuths, mean)
+
+        self.uni.home(axis='X')
+        fp = self.open_map_file(self.make_header(adjust_boresight=adjust_boresight, otf=True),
+                                adjust_boresight=adjust_boresight)
+        for j, az in enumerate(azimuths):
+            fp.begin_row(az)
+            for i, freq in enumerate(self.synth.freq):
+                fp.add(vmean[j, i]-self.offset, vstd[j, i])
+            fp.end_row()
+        self.uni.wait_for_motion()
+        logger.info("Map Completed, Saving data file %s" % self.filename)
+        fp.close()
+        self.plotter.finish()
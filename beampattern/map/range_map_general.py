@@ -3,9 +3,14 @@ from beampattern.gpib_devices.unidex11 import Unidex11
 from beampattern.gpib_devices.hp83620a import HP83620A
 from beampattern.gpib_devices.hp3478a_multimeter import Multimeter
 from beampattern.serial import Fluke
+from beampattern.map.scan_planning import frequency_outer_scan, measure_retune, \
+     scan_start, position_grid, plan_raster
+from beampattern.map.map_common import DetectorMapMixin, stage_mover
 from beampattern.utils.beampattern_exceptions import BeamPatternGeneralError, BeamPatternArgumentError
+from beampattern.utils import timing
+from beampattern.utils.live_plot import LivePlotter
+from beampattern.utils.mapfile import MapWriter
 from beampattern.logging import logger
-import matplotlib.pyplot as plt
 
 import sys, os
 import time
@@ -19,14 +24,14 @@ class ConfigObj(object):
         pass
 
 
-class BeamMap(object):
+class BeamMap(DetectorMapMixin):
     """
     Given a config object dictionary cfg, and a filename to
     write output data to and a datetime_str, this class
     check for correct configuration and does a map
     """
     def __init__(self, cfg, filename, datetime_str, cfgfile, 
-                 debug=True):
+                 debug=True, resume=False):
         self.plot_symbols = ['o', 's', 'v', '^', '<', '>',
                              '1', '2', '3', '4', 'p', '*',
                              'h', 'H', '+', 'x', 'D', 'd']
@@ -43,6 +48,7 @@ class BeamMap(object):
         if not self.check_map_parameters():
             logger.error("Map Parameters Malformed")
             raise BeamPatternGeneralError("BeamMap", "Map Parameters Malformed")
+        self._open_journal(resume)
 
     def _get_config_parameters(self):
         for key, val in self.cfg.items():
@@ -74,14 +80,24 @@ class BeamMap(object):
         if self.devices.use_unidex:
             try:
                 self.uni = Unidex11()
-                time.sleep(2.0)
-                self.uni.reset()
-                time.sleep(2.0)
-                self.uni.home(axis='Y')
-                time.sleep(10.0)
-                self.uni.home(axis='X')
-                time.sleep(10.0)
-                logger.info("Unidex 11 available, reset and homed")
+                self.uni.poll_interval = self.unidex.poll_interval
+                self.uni.motion_margin = self.unidex.motion_margin
+                self.uni.home_timeout = self.unidex.home_timeout
+                if self.journal.stage is not None:
+                    # resuming, and the stage stopped at a known position
+                    self.uni.pos_az, self.uni.pos_el = self.journal.stage
+                    logger.info("Unidex 11 available, stage at az %.3f el %.3f from journal" % \
+                                self.journal.stage)
+                else:
+                    time.sleep(2.0)
+                    self.uni.reset()
+                    time.sleep(2.0)
+                    self.uni.home(axis='Y')
+                    self.uni.wait_for_motion()
+                    self.uni.home(axis='X')
+                    self.uni.wait_for_motion()
+                    logger.info("Unidex 11 available, reset and homed")
+                self.uni.on_motion = self.journal.motion
             except:
                 logger.error("Unidex11 Not available")
                 raise BeamPatternGeneralError("open_devices", "Unidex11 Not available")
@@ -96,7 +112,8 @@ class BeamMap(object):
                 self.multimeter.setup_ac(nplc=self.multi.nplc,
                                          range=self.multi.range,
                                          nrdgs=self.multi.nrdgs,
-                                         resolution=self.multi.resolution)
+                                         resolution=self.multi.resolution,
+                                         burst=self.multi.burst)
                 self.nrdgs = self.multi.nrdgs
                 print self.nrdgs, self.multi.nplc, self.multi.range, self.multi.nrdgs, self.multi.resolution
             except:
@@ -130,13 +147,15 @@ class BeamMap(object):
     def take_readings(self, nrdgs=2):
         if self.devices.use_multi:
             try:
-                vmean, vstd = self.multimeter.take_readings(nrdgs=nrdgs)
+                with timing.phase('detector'):
+                    vmean, vstd = self.multimeter.take_readings(nrdgs=nrdgs)
                 return vmean, vstd
             except:
                 raise BeamPatternGeneralError("take_readings", "Cannot read HP voltmeter")
         else:
             try:
-                vmean, vstd = self.flukemeter.measure(nrdgs=nrdgs)
+                with timing.phase('detector'):
+                    vmean, vstd = self.flukemeter.measure(nrdgs=nrdgs)
                 return vmean, vstd
             except:
                 raise BeamPatternGeneralError("take_readings", "Cannot read Fluke voltmeter")
@@ -203,11 +222,9 @@ class BeamMap(object):
             #not already at home
             logger.info("Go to home position")
             self.uni.home(axis='X')
-            logger.info("Waiting 10 seconds to be sure")
-            time.sleep(10.0)
+            self.uni.wait_for_motion()
             self.uni.home(axis='Y')
-            logger.info("Waiting 10 seconds to be sure")
-            time.sleep(10.0)
+            self.uni.wait_for_motion()
         self.rfpower = []
         for freq in self.synth.freq:
             self.syn.set_freq(freq*1e9)
@@ -235,11 +252,9 @@ class BeamMap(object):
         """
         logger.info("Go to home position")
         self.uni.home(axis='X')
-        logger.info("Waiting 10 seconds to be sure")
-        time.sleep(10.0)
+        self.uni.wait_for_motion()
         self.uni.home(axis='Y')
-        logger.info("Waiting 10 seconds to be sure")
-        time.sleep(10.0)
+        self.uni.wait_for_motion()
         logger.info("Measuring zero point offset, turning off source")
         self.syn.output_off()
         time.sleep(3.0)
@@ -251,7 +266,7 @@ class BeamMap(object):
         logger.info("Turning synth source back on")
         time.sleep(0.3)
         
-    def make_header(self, adjust_boresight=False, azel='az'):
+    def make_header(self, adjust_boresight=False, azel='az', scan_info=None):
         hdr = ""
         hdr += "# Beammap Timestamp: %s\n" % self.datetime_str
         hdr += "# Configfile: %s\n" % self.cfgfile
@@ -270,6 +285,8 @@ class BeamMap(object):
             hdr += "# Fluke device: %s; nrdgs: %d\n" % \
                    (self.fluke.device, self.fluke.nrdgs)
         hdr += "# Voltage offset: %.5g +/- %.5g\n" % (self.offset, self.offset_std)
+        if scan_info is not None:
+            hdr += "# %s\n" % scan_info
         if self.devices.use_synth:
             hdr += "# Synthesizer Multiplier: %.1f\n" % (self.synth.mult)
             hdr += "# Frequenies (GHz): %s\n" % (self.synth.freq)
@@ -291,11 +308,58 @@ class BeamMap(object):
             hdr += "\n"
         return hdr
 
-    def make_cross_scan(self, adjust_boresight=False, measure_ac_offset=True):
-        if measure_ac_offset:
-            self.measure_offset()
+    def open_map_file(self, filename, header, posfmt='%.3f', adjust_boresight=False,
+                      metadata=None):
+        """Returns a MapWriter for a scan in the configured output format"""
+        metadata = dict(metadata or {})
+        metadata.update({'freq': self.synth.freq,
+                         'offset': self.offset,
+                         'offset_std': self.offset_std})
         if adjust_boresight:
-            self.check_boresight_power()            
+            metadata['rfpower'] = self.rfpower
+        return MapWriter(filename, header, output_format=self.general.output_format,
+                         columns=('mean', 'std'), posfmt=posfmt, config=self.cfg,
+                         metadata=metadata)
+
+    def start_plotter(self, xlim, ylim=(-0.5, 10.0), title=None):
+        """Starts the live plot of detector voltage against position"""
+        labels = ['%.3f GHz' % freq for freq in self.synth.freq]
+        return LivePlotter(labels, xlim, ylim, symbols=self.plot_symbols,
+                           title=title, figsize=self.plot.figsize,
+                           refresh=self.plot.refresh,
+                           enabled=self.plot.live).start()
+
+    def _scan_frequency_outer(self, fp, section, npos, move, rowpos, plotx,
+                              settle=0.2, adjust_boresight=False):
+        """
+        Frequency-outer scan loop shared by the cross and diagonal
+        scans. section names the scan in the journal, move(j) takes
+        the stage to the j'th position, rowpos(j) returns its
+        position columns and plotx holds the abscissa for the live
+        plot. Each row is written as soon as the last sweep has
+        taken it, in the position-outer layout.
+        """
+        tune, read, done = self._scan_callbacks(section, lambda j: "Pos: %s" % (fp.posfmt % rowpos(j)),
+                                                lambda i, j, v: self.plotter.add(i, plotx[j], v),
+                                                adjust_boresight=adjust_boresight,
+                                                settle=settle)
+        def emit(j, row):
+            fp.begin_row(*rowpos(j))
+            for vmean, vstd in row:
+                if self.nrdgs > 1:
+                    fp.add(vmean, vstd)
+                else:
+                    fp.add(vmean, 0.0)
+            fp.end_row()
+
+        frequency_outer_scan(npos, len(self.synth.freq),
+                             tune, move, read, done=done, emit=emit)
+
+    def make_cross_scan(self, adjust_boresight=False, measure_ac_offset=True):
+        resuming = self.journal.begin(self.filename, self.datetime_str, self.cfgfile,
+                                      'make_cross_scan', adjust_boresight=adjust_boresight,
+                                      measure_ac_offset=measure_ac_offset)
+        self.prepare_map(adjust_boresight, measure_ac_offset)
         #self.uni.home(axis='X')
         #time.sleep(10.0)
         azimuths = []
@@ -313,105 +377,123 @@ class BeamMap(object):
             elevations.append(y)
         elevations = numpy.array(elevations)
         logger.info("Starting with Azimuth Scan")
-        wait = (abs(azimuths[0]-self.uni.pos_az)/self.azimuth.xslew_vel) + 1.0
-        self.uni.set_azimuth(azimuths[0], self.azimuth.xslew_vel)
-        logger.info("Sleeping for %.2f seconds while stage gets to start of map" % wait)
-        time.sleep(wait)
+        order = self.choose_loop_order(azimuths, self.azimuth.xmap_vel, 0.4)
+        if not resuming:
+            start = scan_start(len(azimuths), len(self.synth.freq), order)
+            self.uni.set_azimuth(azimuths[start], self.azimuth.xslew_vel)
+            wait = self.uni.wait_for_motion()
+            logger.info("Stage got to start of map in %.2f seconds" % wait)
         base, ext = os.path.splitext(self.filename)
         if len(azimuths) > 0:
             az_filename = base+'_az'+ext
-            fp = open(az_filename, 'w')
-            header = self.make_header(adjust_boresight=adjust_boresight)
-            fp.write(header)
-            plt.ion()
-            plt.plot([self.azimuth.xmin, self.azimuth.xmax], [0, 0], 'r-')
-            plt.xlim(self.azimuth.xmin, self.azimuth.xmax)
-            plt.ylim(-0.5, 10.0)
-            plt.draw()
-
-            for az in azimuths:
-                wait = (abs(az-self.uni.pos_az)/self.azimuth.xmap_vel) + 1.0
-                self.uni.set_azimuth(az, self.azimuth.xmap_vel)
-                logger.info("Sleeping for %.2f seconds while stage gets to %.1f degrees" % (wait, az))
-                time.sleep(wait)
-                fp.write("%.3f" % az)
-                for i, freq in enumerate(self.synth.freq):
-                    self.syn.set_freq(freq*1e9)
-                    time.sleep(0.1)
-                    if adjust_boresight:
-                        self.syn.set_power_level(self.rfpower[i])
-                        logger.info("For Freq: %s GHz, adjusted power level to: %s dBm" % (freq, self.rfpower[i]))
-                    time.sleep(0.4)
-                    vmean, vstd = self.take_readings(nrdgs=self.nrdgs)
-                    logger.info("Az: %.2f, Freq: %.3f, Voltage: %.6g +/- %.6g" % (az, freq, vmean, vstd))
-                    #if vmean >= vstd:
-                    #    dt = numpy.sqrt(vmean**2-self.offset**2)
-                    #else:
-                    #    dt = numpy.nan
-                    dt = vmean
-                    if self.nrdgs > 1:
-                        fp.write(",%.6g,%.6g" % (dt, vstd))
-                    else:
-                        fp.write(",%.6g,%.6g" % (dt, 0.0))
-                    plt.plot(az, vmean, self.plot_symbols[i])
-                    plt.draw()
-                fp.write('\n')
+            fp = self.open_map_file(az_filename, self.make_header(adjust_boresight=adjust_boresight),
+                                    adjust_boresight=adjust_boresight)
+            self.plotter = self.start_plotter((self.azimuth.xmin, self.azimuth.xmax),
+                                              title='Azimuth')
+
+            if order == 'frequency':
+                move = stage_mover(self.uni, self.azimuth.xmap_vel, azimuths=azimuths)
+                self._scan_frequency_outer(fp, 'az', len(azimuths), move,
+                                           lambda j: (azimuths[j],), azimuths,
+                                           settle=0.4, adjust_boresight=adjust_boresight)
+            else:
+                for j, az in enumerate(azimuths):
+                    if not self.journal.row_done('az', j, len(self.synth.freq)):
+                        self.uni.set_azimuth(az, self.azimuth.xmap_vel)
+                        wait = self.uni.wait_for_motion()
+                        logger.info("Stage got to %.1f degrees in %.2f seconds" % (az, wait))
+                    fp.begin_row(az)
+                    for i, freq in enumerate(self.synth.freq):
+                        saved = self.journal.get('az', j, i)
+                        if saved is None:
+                            self.syn.set_freq(freq*1e9)
+                            timing.settle(0.1)
+                            if adjust_boresight:
+                                self.syn.set_power_level(self.rfpower[i])
+                                logger.info("For Freq: %s GHz, adjusted power level to: %s dBm" % (freq, self.rfpower[i]))
+                            timing.settle(0.4)
+                            vmean, vstd = self.take_readings(nrdgs=self.nrdgs)
+                            self.journal.point('az', j, i, (vmean, vstd))
+                        else:
+                            vmean, vstd = saved
+                        logger.info("Az: %.2f, Freq: %.3f, Voltage: %.6g +/- %.6g" % (az, freq, vmean, vstd))
+                        #if vmean >= vstd:
+                        #    dt = numpy.sqrt(vmean**2-self.offset**2)
+                        #else:
+                        #    dt = numpy.nan
+                        dt = vmean
+                        if self.nrdgs > 1:
+                            fp.add(dt, vstd)
+                        else:
+                            fp.add(dt, 0.0)
+                        with timing.phase('plot'):
+                            self.plotter.add(i, az, vmean)
+                    fp.end_row()
 
-            time.sleep(10.0)
             self.uni.home(axis='X')
+            self.uni.wait_for_motion()
             logger.info("Azimuth Map Completed, Saving data file %s" % az_filename)
             fp.close()
+            self.plotter.finish()
 
         if len(elevations) > 0:
             el_filename = base+'_el'+ext
-            fp = open(el_filename, 'w')
-            header = self.make_header(adjust_boresight=adjust_boresight, azel='el')
-            fp.write(header)
-            plt.ion()
-            plt.figure()
-            plt.plot([self.elevation.ymin, self.elevation.ymax], [0, 0], 'r-')
-            plt.xlim(self.elevation.ymin, self.elevation.ymax)
-            plt.ylim(-0.5, 10.0)
-            plt.draw()
-            for el in elevations:
-                wait = (abs(el-self.uni.pos_el)/self.azimuth.xmap_vel) + 1.0
-                self.uni.set_elevation(el, self.azimuth.xmap_vel)
-                logger.info("Sleeping for %.2f seconds while stage gets to %.1f degrees" % (wait, el))
-                time.sleep(wait)
-                fp.write("%.3f" % el)
-                for i, freq in enumerate(self.synth.freq):
-                    self.syn.set_freq(freq*1e9)
-                    time.sleep(0.1)
-                    if adjust_boresight:
-                        self.syn.set_power_level(self.rfpower[i])
-                        logger.info("For Freq: %s GHz, adjusted power level to: %s dBm" % (freq, self.rfpower[i]))
-                    time.sleep(0.2)
-                    vmean, vstd = self.take_readings(nrdgs=self.nrdgs)
-                    logger.info("El: %.2f, Freq: %.3f, Voltage: %.6g +/- %.6g" % (el, freq, vmean, vstd))
-                    #if vmean >= vstd:
-                    #    dt = numpy.sqrt(vmean**2-self.offset**2)
-                    #else:
-                    #    dt = numpy.nan
-                    dt = vmean
-                    if self.nrdgs > 1:
-                        fp.write(",%.6g,%.6g" % (dt, vstd))
-                    else:
-                        fp.write(",%.6g,%.6g" % (dt, 0.0))
-                    plt.plot(el, vmean, self.plot_symbols[i])
-                    plt.draw()
-                fp.write('\n')
+            fp = self.open_map_file(el_filename, self.make_header(adjust_boresight=adjust_boresight, azel='el'),
+                                    adjust_boresight=adjust_boresight)
+            self.plotter = self.start_plotter((self.elevation.ymin, self.elevation.ymax),
+                                              title='Elevation')
+            if self.choose_loop_order(elevations, self.azimuth.xmap_vel, 0.2) == 'frequency':
+                move = stage_mover(self.uni, self.azimuth.xmap_vel, elevations=elevations)
+                self._scan_frequency_outer(fp, 'el', len(elevations), move,
+                                           lambda j: (elevations[j],), elevations,
+                                           settle=0.2, adjust_boresight=adjust_boresight)
+            else:
+                for j, el in enumerate(elevations):
+                    if not self.journal.row_done('el', j, len(self.synth.freq)):
+                        self.uni.set_elevation(el, self.azimuth.xmap_vel)
+                        wait = self.uni.wait_for_motion()
+                        logger.info("Stage got to %.1f degrees in %.2f seconds" % (el, wait))
+                    fp.begin_row(el)
+                    for i, freq in enumerate(self.synth.freq):
+                        saved = self.journal.get('el', j, i)
+                        if saved is None:
+                            self.syn.set_freq(freq*1e9)
+                            timing.settle(0.1)
+                            if adjust_boresight:
+                                self.syn.set_power_level(self.rfpower[i])
+                                logger.info("For Freq: %s GHz, adjusted power level to: %s dBm" % (freq, self.rfpower[i]))
+                            timing.settle(0.2)
+                            vmean, vstd = self.take_readings(nrdgs=self.nrdgs)
+                            self.journal.point('el', j, i, (vmean, vstd))
+                        else:
+                            vmean, vstd = saved
+                        logger.info("El: %.2f, Freq: %.3f, Voltage: %.6g +/- %.6g" % (el, freq, vmean, vstd))
+                        #if vmean >= vstd:
+                        #    dt = numpy.sqrt(vmean**2-self.offset**2)
+                        #else:
+                        #    dt = numpy.nan
+                        dt = vmean
+                        if self.nrdgs > 1:
+                            fp.add(dt, vstd)
+                        else:
+                            fp.add(dt, 0.0)
+                        with timing.phase('plot'):
+                            self.plotter.add(i, el, vmean)
+                    fp.end_row()
 
-            time.sleep(10.0)
             self.uni.home(axis='Y')
+            self.uni.wait_for_motion()
             logger.info("Elevation Map Completed, Saving data file %s" % el_filename)
             fp.close()
+            self.plotter.finish()
+        self.journal.finish()
             
             
     def make_diagonal_scan(self, adjust_boresight=False, measure_ac_offset=True):
-        if measure_ac_offset:
-            self.measure_offset()
-        if adjust_boresight:
-            self.check_boresight_power()            
+        resuming = self.journal.begin(self.filename, self.datetime_str, self.cfgfile,
+                                      'make_diagonal_scan', adjust_boresight=adjust_boresight,
+                                      measure_ac_offset=measure_ac_offset)
+        self.prepare_map(adjust_boresight, measure_ac_offset)
         #self.uni.home(axis='X')
         #time.sleep(10.0)
         azimuths = []
@@ -428,66 +510,238 @@ class BeamMap(object):
             #    y = self.elevation.ymax
             elevations.append(y)
         elevations = numpy.array(elevations)
-        wait = (abs(azimuths[0]-self.uni.pos_az)/self.azimuth.xslew_vel) + 1.0
-        self.uni.set_azimuth(azimuths[0], self.azimuth.xslew_vel)
-        logger.info("Sleeping for %.2f seconds while stage gets to az start of map" % wait)
-        time.sleep(wait)
-        wait = (abs(elevations[0]-self.uni.pos_el)/self.azimuth.xslew_vel) + 1.0
-        self.uni.set_elevation(elevations[0], self.azimuth.xslew_vel)
+        # stage path length, with both axes moving one after the other
+        path = numpy.concatenate(([0.0], numpy.cumsum(numpy.abs(numpy.diff(azimuths)) +
+                                                      numpy.abs(numpy.diff(elevations)))))
+        order = self.choose_loop_order(path, self.azimuth.xmap_vel, 0.2)
+        if not resuming:
+            start = scan_start(len(azimuths), len(self.synth.freq), order)
+            self.uni.set_azimuth(azimuths[start], self.azimuth.xslew_vel)
+            wait = self.uni.wait_for_motion()
+            logger.info("Stage got to az start of map in %.2f seconds" % wait)
+            self.uni.set_elevation(elevations[start], self.azimuth.xslew_vel)
+            wait = self.uni.wait_for_motion()
+            logger.info("Stage got to el start of map in %.2f seconds" % wait)
         diags = numpy.sqrt(azimuths**2 + elevations**2)
         ind = numpy.where(azimuths<0.0)
         diags[ind] = -diags[ind]
         base, ext = os.path.splitext(self.filename)
         if len(azimuths) > 0 and len(elevations) > 0:
             filename = base+'_diagonal'+ext
-            fp = open(filename, 'w')
-            header = self.make_header(adjust_boresight=adjust_boresight, azel='diag')
-            fp.write(header)
-            plt.ion()
-            plt.plot([diags[0], diags[-1]], [0, 0], 'r-')
-            plt.xlim(diags[0], diags[-1])
-            plt.ylim(-0.5, 10.0)
-            plt.draw()
-
-            for i, az in enumerate(azimuths):
-                el = elevations[i]
-                diag = diags[i]
-                wait = (abs(az-self.uni.pos_az)/self.azimuth.xmap_vel) + 1.0
-                self.uni.set_azimuth(az, self.azimuth.xmap_vel)
-                logger.info("Sleeping for %.2f seconds while stage gets to %.1f degrees az" % (wait, az))
-                time.sleep(wait)
-                wait = (abs(el-self.uni.pos_el)/self.azimuth.xmap_vel) + 1.0
-                self.uni.set_elevation(el, self.azimuth.xmap_vel)
-                logger.info("Sleeping for %.2f seconds while stage gets to %.1f degrees el" % (wait, el))
-                time.sleep(wait)
-                fp.write("%.3f, %.3f" % (az, el))
-                for i, freq in enumerate(self.synth.freq):
-                    self.syn.set_freq(freq*1e9)
-                    time.sleep(0.1)
-                    if adjust_boresight:
-                        self.syn.set_power_level(self.rfpower[i])
-                        logger.info("For Freq: %s GHz, adjusted power level to: %s dBm" % (freq, self.rfpower[i]))
-                    time.sleep(0.2)
-                    vmean, vstd = self.take_readings(nrdgs=self.nrdgs)
-                    logger.info("Az: %.2f, El: %.2f, Freq: %.3f, Voltage: %.6g +/- %.6g" % (az, el, freq, vmean, vstd))
-                    #if vmean >= vstd:
-                    #    dt = numpy.sqrt(vmean**2-self.offset**2)
-                    #else:
-                    #    dt = numpy.nan
-                    dt = vmean
-                    if self.nrdgs > 1:
-                        fp.write(",%.6g,%.6g" % (dt, vstd))
-                    else:
-                        fp.write(",%.6g,%.6g" % (dt, 0.0))
-                    plt.plot(diag, vmean, self.plot_symbols[i])
-                    plt.draw()
-                fp.write('\n')
+            fp = self.open_map_file(filename, self.make_header(adjust_boresight=adjust_boresight, azel='diag'),
+                                    posfmt='%.3f, %.3f', adjust_boresight=adjust_boresight)
+            self.plotter = self.start_plotter((diags[0], diags[-1]), title='Diagonal')
+
+            if order == 'frequency':
+                move = stage_mover(self.uni, self.azimuth.xmap_vel,
+                                   azimuths=azimuths, elevations=elevations)
+                self._scan_frequency_outer(fp, 'diag', len(azimuths), move,
+                                           lambda j: (azimuths[j], elevations[j]), diags,
+                                           settle=0.2, adjust_boresight=adjust_boresight)
+            else:
+                for j, az in enumerate(azimuths):
+                    el = elevations[j]
+                    diag = diags[j]
+                    if not self.journal.row_done('diag', j, len(self.synth.freq)):
+                        self.uni.set_azimuth(az, self.azimuth.xmap_vel)
+                        wait = self.uni.wait_for_motion()
+                        logger.info("Stage got to %.1f degrees az in %.2f seconds" % (az, wait))
+                        self.uni.set_elevation(el, self.azimuth.xmap_vel)
+                        wait = self.uni.wait_for_motion()
+                        logger.info("Stage got to %.1f degrees el in %.2f seconds" % (el, wait))
+                    fp.begin_row(az, el)
+                    for i, freq in enumerate(self.synth.freq):
+                        saved = self.journal.get('diag', j, i)
+                        if saved is None:
+                            self.syn.set_freq(freq*1e9)
+                            timing.settle(0.1)
+                            if adjust_boresight:
+                                self.syn.set_power_level(self.rfpower[i])
+                                logger.info("For Freq: %s GHz, adjusted power level to: %s dBm" % (freq, self.rfpower[i]))
+                            timing.settle(0.2)
+                            vmean, vstd = self.take_readings(nrdgs=self.nrdgs)
+                            self.journal.point('diag', j, i, (vmean, vstd))
+                        else:
+                            vmean, vstd = saved
+                        logger.info("Az: %.2f, El: %.2f, Freq: %.3f, Voltage: %.6g +/- %.6g" % (az, el, freq, vmean, vstd))
+                        #if vmean >= vstd:
+                        #    dt = numpy.sqrt(vmean**2-self.offset**2)
+                        #else:
+                        #    dt = numpy.nan
+                        dt = vmean
+                        if self.nrdgs > 1:
+                            fp.add(dt, vstd)
+                        else:
+                            fp.add(dt, 0.0)
+                        with timing.phase('plot'):
+                            self.plotter.add(i, diag, vmean)
+                    fp.end_row()
 
-            time.sleep(10.0)
             self.uni.home(axis='X')
-            self.uni.home(axis='Y')            
+            self.uni.wait_for_motion()
+            self.uni.home(axis='Y')
+            self.uni.wait_for_motion()
             logger.info("Diagonal Map Completed, Saving data file %s" % filename)
             fp.close()
+            self.plotter.finish()
+        self.journal.finish()
 
             
             
+
+    def choose_raster_plan(self, azimuths, elevations, velocity, settle):
+        """
+        Plans the raster scan over azimuths x elevations with
+        plan_raster, allowing for the slower elevation feedrate
+        limit of the stage. With loop_order auto, the retune cost
+        is measured as in choose_loop_order and both loop orders
+        are costed. Returns (loop_order, inner, rows)
+        """
+        az_vel = min(velocity, self.uni.max_feedrate*self.uni.step_size_az)
+        el_vel = min(velocity, self.uni.max_feedrate*self.uni.step_size_el)
+        nfreq = len(self.synth.freq)
+        order = self.synth.loop_order
+        if order == 'auto':
+            retune = measure_retune(lambda freq: self.syn.set_freq(freq*1e9),
+                                    self.synth.freq, settle)
+            orders = ('position', 'frequency')
+        else:
+            retune = 0.0
+            orders = (order,)
+        best = None
+        for order in orders:
+            inner, rows, cost = plan_raster(azimuths, elevations, az_vel, el_vel,
+                                            self.unidex.move_overhead, nfreq=nfreq,
+                                            retune_time=retune, loop_order=order)
+            logger.info("Raster with %s loop order, inner axis %s: estimated %.1f s" % \
+                        (order, inner, cost))
+            if best is None or cost < best[3]:
+                best = (order, inner, rows, cost)
+        return best[:3]
+
+    def _move_stage(self, az, el, velocity):
+        """Moves whichever axes are not already at (az, el)"""
+        if az != self.uni.pos_az:
+            self.uni.set_azimuth(az, velocity)
+            wait = self.uni.wait_for_motion()
+            logger.info("Stage got to %.1f degrees az in %.2f seconds" % (az, wait))
+        if el != self.uni.pos_el:
+            self.uni.set_elevation(el, velocity)
+            wait = self.uni.wait_for_motion()
+            logger.info("Stage got to %.1f degrees el in %.2f seconds" % (el, wait))
+
+    def make_raster_map(self, adjust_boresight=False, measure_ac_offset=True):
+        """
+        Full 2-D map over the azimuth x elevation grid, scanned as
+        a serpentine raster. Each row of the data file is one grid
+        point (az, el followed by the frequencies); read_cube in
+        beampattern.utils.mapfile returns the map as an
+        (el, az, freq) cube
+        """
+        resuming = self.journal.begin(self.filename, self.datetime_str, self.cfgfile,
+                                      'make_raster_map', adjust_boresight=adjust_boresight,
+                                      measure_ac_offset=measure_ac_offset)
+        self.prepare_map(adjust_boresight, measure_ac_offset)
+        azimuths = position_grid(self.azimuth.xmin, self.azimuth.xmax, self.azimuth.xinc)
+        elevations = position_grid(self.elevation.ymin, self.elevation.ymax, self.elevation.yinc)
+        naz, nel = len(azimuths), len(elevations)
+        nfreq = len(self.synth.freq)
+        settle = 0.2
+        velocity = self.azimuth.xmap_vel
+        order, inner, rows = self.choose_raster_plan(azimuths, elevations, velocity, settle)
+        if inner == 'az':
+            inner_pos, outer_pos = azimuths, elevations
+        else:
+            inner_pos, outer_pos = elevations, azimuths
+
+        def grid_index(k, jin):
+            # (el index, az index) of row k, inner index jin
+            if inner == 'az':
+                return rows[k][0], jin
+            return jin, rows[k][0]
+
+        first_el, first_az = grid_index(0, rows[0][1][0])
+        if not resuming:
+            self.uni.set_azimuth(azimuths[first_az], self.azimuth.xslew_vel)
+            wait = self.uni.wait_for_motion()
+            logger.info("Stage got to az start of map in %.2f seconds" % wait)
+            self.uni.set_elevation(elevations[first_el], self.azimuth.xslew_vel)
+            wait = self.uni.wait_for_motion()
+            logger.info("Stage got to el start of map in %.2f seconds" % wait)
+
+        base, ext = os.path.splitext(self.filename)
+        filename = base+'_raster'+ext
+        scan_info = "Raster scan: %d el x %d az points; inner axis: %s; loop order: %s" % \
+                    (nel, naz, inner, order)
+        fp = self.open_map_file(filename, self.make_header(adjust_boresight=adjust_boresight,
+                                                           azel='raster', scan_info=scan_info),
+                                posfmt='%.3f, %.3f', adjust_boresight=adjust_boresight,
+                                metadata={'azimuths': azimuths, 'elevations': elevations})
+        self.plotter = self.start_plotter((inner_pos.min(), inner_pos.max()),
+                                          title='Raster (%s cuts)' % inner.title())
+
+        for k, (jout, order_in) in enumerate(rows):
+            # the live plot shows the cut currently being taken
+            cutx = [[] for freq in self.synth.freq]
+            cuty = [[] for freq in self.synth.freq]
+
+            def point(jin):
+                jel, jaz = grid_index(k, jin)
+                return jel*naz + jaz, azimuths[jaz], elevations[jel]
+
+            def plot(i, jin, vmean):
+                cutx[i].append(inner_pos[jin])
+                cuty[i].append(vmean)
+                self.plotter.set_line(i, cutx[i], cuty[i])
+
+            tune, read, done = self._scan_callbacks('raster',
+                                                    lambda jin: "Az: %.2f, El: %.2f" % point(jin)[1:],
+                                                    plot, key=lambda jin: point(jin)[0],
+                                                    adjust_boresight=adjust_boresight,
+                                                    settle=settle)
+
+            def move(jin):
+                j, az, el = point(jin)
+                self._move_stage(az, el, velocity)
+
+            values = {}
+            if order == 'frequency':
+                results = frequency_outer_scan(len(order_in), nfreq, tune,
+                                               lambda kin: move(order_in[kin]),
+                                               lambda i, kin: read(i, order_in[kin]),
+                                               done=lambda i, kin: done(i, order_in[kin]))
+                for kin, jin in enumerate(order_in):
+                    values[jin] = results[kin]
+            else:
+                for jin in order_in:
+                    if not self.journal.row_done('raster', point(jin)[0], nfreq):
+                        move(jin)
+                    values[jin] = []
+                    for i in range(nfreq):
+                        reading = done(i, jin)
+                        if reading is None:
+                            tune(i)
+                            reading = read(i, jin)
+                        values[jin].append(reading)
+            # rows of the file are in increasing inner position
+            for jin in range(len(inner_pos)):
+                j, az, el = point(jin)
+                fp.begin_row(az, el)
+                for vmean, vstd in values[jin]:
+                    if self.nrdgs > 1:
+                        fp.add(vmean, vstd)
+                    else:
+                        fp.add(vmean, 0.0)
+                fp.end_row()
+            fp.flush()
+            logger.info("Raster row %d of %d done (%s = %.2f)" % \
+                        (k+1, len(rows), 'El' if inner == 'az' else 'Az', outer_pos[jout]))
+
+        self.uni.home(axis='X')
+        self.uni.wait_for_motion()
+        self.uni.home(axis='Y')
+        self.uni.wait_for_motion()
+        logger.info("Raster Map Completed, Saving data file %s" % filename)
+        fp.close()
+        self.plotter.finish()
+        self.journal.finish()
@@ -2,8 +2,10 @@
 from beampattern.gpib_devices.unidex11 import Unidex11
 from beampattern.gpib_devices.hp8510c import Analyzer_8510c
 from beampattern.utils.beampattern_exceptions import BeamPatternGeneralError, BeamPatternArgumentError
+from beampattern.utils import timing
+from beampattern.utils.live_plot import LivePlotter
+from beampattern.utils.mapfile import MapWriter
 from beampattern.logging import logger
-import matplotlib.pyplot as plt
 
 import sys, os
 import time
@@ -55,6 +57,10 @@ class AzimuthPhaseMap(object):
         if self.azimuth.xmax > 180.0:
             logger.error("xmax is set to %s, and is greater than 180 degrees. Please fix" % self.azimuth.xmax)
             return False
+        for meas in self.vna.meas:
+            if meas not in ('S11', 'S12', 'S21', 'S22'):
+                logger.error("meas %s is not an S-parameter. Please fix" % meas)
+                return False
         return True
 
     def open_devices(self):
@@ -65,10 +71,13 @@ class AzimuthPhaseMap(object):
         if self.devices.use_unidex:
             try:
                 self.uni = Unidex11()
+                self.uni.poll_interval = self.unidex.poll_interval
+                self.uni.motion_margin = self.unidex.motion_margin
+                self.uni.home_timeout = self.unidex.home_timeout
                 self.uni.reset()
                 time.sleep(2.0)
                 self.uni.home(axis='X')
-                time.sleep(10.0)
+                self.uni.wait_for_motion()
                 logger.info("Unidex 11 available, reset and homed")
             except:
                 logger.error("Unidex11 Not available")
@@ -76,6 +85,8 @@ class AzimuthPhaseMap(object):
         if self.devices.use_vna:
             try:
                 self.an = Analyzer_8510c()
+                self.an.data_format = self.vna.data_format
+                self.an.max_retries = self.vna.max_retries
                 logger.info("HP8510C vector network analyzer initialized")
                 time.sleep(0.5)
                 self.freq_list = numpy.array(self.vna.freq)*1e9
@@ -91,7 +102,8 @@ class AzimuthPhaseMap(object):
     def take_readings(self):
         if self.devices.use_vna:
             try:
-                data = self.an.get_freq_data()
+                with timing.phase('detector'):
+                    data = self.an.get_multi_data()
                 return data
             except:
                 raise BeamPatternGeneralError("take_readings", "Cannot read VNA")
@@ -110,12 +122,12 @@ class AzimuthPhaseMap(object):
                (self.azimuth.xmap_vel, self.azimuth.xslew_vel)
         if self.devices.use_vna:
             hdr += "# Freq_list: %s; measure: %s\n" % \
-                (self.freq_list/1e9, self.vna.meas)
+                (self.freq_list/1e9, ', '.join(self.vna.meas))
         return hdr
 
     def make_map(self):
         self.uni.home(axis='X')
-        time.sleep(10.0)
+        self.uni.wait_for_motion()
         azimuths = []
         for x in numpy.arange(self.azimuth.xmin, self.azimuth.xmax + self.azimuth.xinc,
                               self.azimuth.xinc):
@@ -123,36 +135,49 @@ class AzimuthPhaseMap(object):
                 x = self.azimuth.xmax
             azimuths.append(x)
         azimuths = numpy.array(azimuths)
-        wait = (abs(azimuths[0]-self.uni.pos_az)/self.azimuth.xslew_vel) + 1.0
         self.uni.set_azimuth(azimuths[0], self.azimuth.xslew_vel)
-        logger.info("Sleeping for %.2f seconds while stage gets to start of map" % wait)
-        time.sleep(wait)
+        wait = self.uni.wait_for_motion()
+        logger.info("Stage got to start of map in %.2f seconds" % wait)
 
-        fp = open(self.filename, 'w')
-        header = self.make_header()
-        fp.write(header)
-        plt.ion()
-        plt.plot([self.azimuth.xmin, self.azimuth.xmax], [0, 0], 'r-')
-        plt.xlim(self.azimuth.xmin, self.azimuth.xmax)
-        plt.ylim(-0.001, 0.007)
-        plt.draw()
+        fp = MapWriter(self.filename, self.make_header(),
+                       output_format=self.general.output_format,
+                       columns=('real', 'imag'), config=self.cfg,
+                       metadata={'freq': self.freq_list/1e9,
+                                 'measure': self.vna.meas})
+        # one column group (and plot line) per parameter and frequency
+        labels = []
+        for meas in self.vna.meas:
+            for freq in self.freq_list:
+                if len(self.vna.meas) > 1:
+                    labels.append('%s %.3f GHz' % (meas, freq/1e9))
+                else:
+                    labels.append('%.3f GHz' % (freq/1e9))
+        plotter = LivePlotter(labels, (self.azimuth.xmin, self.azimuth.xmax),
+                              (-0.001, 0.007), symbols=self.plot_symbols,
+                              figsize=self.plot.figsize, refresh=self.plot.refresh,
+                              enabled=self.plot.live).start()
         for az in azimuths:
-            wait = (abs(az-self.uni.pos_az)/self.azimuth.xmap_vel) + 1.0
             self.uni.set_azimuth(az, self.azimuth.xmap_vel)
-            logger.info("Sleeping for %.2f seconds while stage gets to %.1f degrees" % (wait, az))
-            time.sleep(wait)
-            fp.write("%.3f" % az)
+            wait = self.uni.wait_for_motion()
+            logger.info("Stage got to %.1f degrees in %.2f seconds" % (az, wait))
+            fp.begin_row(az)
             data = self.take_readings()
-            for i in range(len(self.freq_list)):
-                fp.write(",%.6g,%.6g" % (data[i].real, data[i].imag))
-                logger.info("Az: %.2f, Freq: %.3f, Voltage: %.6g +1j* %.6g" % (az, self.freq_list[i]/1e9, data[i].real, data[i].imag))
-                plt.plot(az, numpy.abs(data[i]), self.plot_symbols[i])
-                plt.draw()
-            fp.write('\n')
+            nfreq = len(self.freq_list)
+            for m, meas in enumerate(self.vna.meas):
+                for i in range(nfreq):
+                    val = data[m, i]
+                    fp.add(val.real, val.imag)
+                    logger.info("Az: %.2f, %s, Freq: %.3f, Voltage: %.6g +1j* %.6g" % (az, meas, self.freq_list[i]/1e9, val.real, val.imag))
+                    with timing.phase('plot'):
+                        plotter.add(m*nfreq + i, az, numpy.abs(val))
+            fp.end_row()
                          
-        time.sleep(10.0)
         self.uni.home(axis='X')
+        self.uni.wait_for_motion()
         logger.info("Map Completed, Saving data file %s" % self.filename)
+        logger.info("VNA sweeps read: %d; failed readouts retried: %d" % \
+                    (self.an.read_count, self.an.read_error_count))
         fp.close()
+        plotter.finish()
 
                 
@@ -3,9 +3,18 @@ from beampattern.prologix_gpib.hp83620a import HP83620A
 from beampattern.prologix_gpib.prologix_gpib import PrologixGPIB
 from beampattern.prologix_gpib.vector_voltmeter import VectorVoltmeter
 from beampattern.labjack.labjack_t7 import LabJackT7
+from beampattern.map.scan_planning import position_grid, bin_samples
+from beampattern.map.scan_planning import frequency_outer_scan, measure_retune, scan_start
+from beampattern.map.scan_planning import channel_sequence, estimate_channel_costs
+from beampattern.map.scan_planning import adaptive_scan, db_levels
+from beampattern.map.pipeline import pipelined_scan
+from beampattern.map import scan_planning
+from beampattern.map.map_common import JournaledMapMixin, stage_mover, otf_sweep
 from beampattern.utils.beampattern_exceptions import BeamPatternGeneralError, BeamPatternArgumentError
+from beampattern.utils import timing
+from beampattern.utils.live_plot import LivePlotter
+from beampattern.utils.mapfile import MapWriter
 from beampattern.logging import logger
-import matplotlib.pyplot as plt
 
 import sys, os
 import time
@@ -19,14 +28,14 @@ class ConfigObj(object):
         pass
 
 
-class AzimuthVectorMap(object):
+class AzimuthVectorMap(JournaledMapMixin):
     """
     Given a config object dictionary cfg, and a filename to
     write output data to and a datetime_str, this class
     check for correct configuration and does a map
     """
     def __init__(self, cfg, filename, datetime_str, cfgfile,
-                 digital=False):
+                 digital=False, resume=False):
         self.plot_symbols = ['o', 's', 'v', '^', '<', '>',
                              '1', '2', '3', '4', 'p', '*',
                              'h', 'H', '+', 'x', 'D', 'd', '|', '_'] * 5 # lots of symbols
@@ -42,9 +51,10 @@ class AzimuthVectorMap(object):
         if not self.check_map_azimuth_parameters():
             logger.error("Map Parameters Malformed")
             raise BeamPatternGeneralError("AzimuthMap", "Map Parameters Malformed")
+        self._open_journal(resume)
         self.digital = digital
         if self.digital:
-            self.labjack = LabJackT7()
+            self.labjack = LabJackT7(settle_time=self.dio.settle)
             
     def _get_config_parameters(self):
         for key, val in self.cfg.items():
@@ -72,11 +82,21 @@ class AzimuthVectorMap(object):
         if self.devices.use_unidex:
             try:
                 self.uni = Unidex11(self.prologix)
-                self.uni.reset()
-                time.sleep(2.0)
-                self.uni.home(axis='X')
-                time.sleep(10.0)
-                logger.info("Unidex 11 available, reset and homed")
+                self.uni.poll_interval = self.unidex.poll_interval
+                self.uni.motion_margin = self.unidex.motion_margin
+                self.uni.home_timeout = self.unidex.home_timeout
+                if self.journal.stage is not None:
+                    # resuming, and the stage stopped at a known position
+                    self.uni.pos_az, self.uni.pos_el = self.journal.stage
+                    logger.info("Unidex 11 available, stage at az %.3f el %.3f from journal" % \
+                                self.journal.stage)
+                else:
+                    self.uni.reset()
+                    time.sleep(2.0)
+                    self.uni.home(axis='X')
+                    self.uni.wait_for_motion()
+                    logger.info("Unidex 11 available, reset and homed")
+                self.uni.on_motion = self.journal.motion
             except:
                 logger.error("Unidex11 Not available")
                 raise BeamPatternGeneralError("open_devices", "Unidex11 Not available")
@@ -85,6 +105,7 @@ class AzimuthVectorMap(object):
                 self.vv = VectorVoltmeter(self.prologix)
                 logger.info("Vector voltmeter initialized")
                 self.average = self.vector_voltmeter.avg_value
+                self.vv.block = self.vector_voltmeter.block
                 time.sleep(0.5)
             except:
                 logger.error("Vector Voltmeter not available")
@@ -93,13 +114,14 @@ class AzimuthVectorMap(object):
     def take_readings(self):
         if self.devices.use_vv:
             try:
-                data = self.vv.measure_transmission_single(average=self.average)
+                with timing.phase('detector'):
+                    data = self.vv.measure_transmission_single(average=self.average)
                 return data
             except:
                 raise BeamPatternGeneralError("take_readings", "Cannot read Vector Voltmeter")
             
         
-    def make_header(self):
+    def make_header(self, adaptive=None):
         hdr = ""
         hdr += "# Beammap Timestamp: %s\n" % self.datetime_str
         hdr += "# Configfile: %s\n" % self.cfgfile
@@ -114,6 +136,8 @@ class AzimuthVectorMap(object):
         for freq in self.freq_list:
             freqtxt += '%.2f ' % (freq/1e9)
         hdr += "# Freq_list: %s\n" % freqtxt
+        if adaptive is not None:
+            hdr += "# Adaptive map: %d positions in %d passes; xinc_min: %.3f deg\n" % adaptive
         return hdr
 
     def make_digital_header(self):
@@ -133,14 +157,15 @@ class AzimuthVectorMap(object):
         hdr += "# Freq_list: %s\n" % freqtxt
         return hdr
     
-    def make_digital_map(self):
+    def make_digital_map(self, pipeline=False):
         """
         Same as make_map, but in this case
         goes through a sequence of all 8 digital inputs and pulls it low and takes 
-        measurement at each frequency
+        measurement at each frequency. With pipeline the map is
+        taken by pipelined_scan
         """
         self.uni.home(axis='X')
-        time.sleep(10.0)
+        self.uni.wait_for_motion()
         azimuths = []
         for x in numpy.arange(self.azimuth.xmin, self.azimuth.xmax + self.azimuth.xinc,
                               self.azimuth.xinc):
@@ -148,50 +173,228 @@ class AzimuthVectorMap(object):
                 x = self.azimuth.xmax
             azimuths.append(x)
         azimuths = numpy.array(azimuths)
-        wait = (abs(azimuths[0]-self.uni.pos_az)/self.azimuth.xslew_vel) + 1.0
         self.uni.set_azimuth(azimuths[0], self.azimuth.xslew_vel)
-        logger.info("Sleeping for %.2f seconds while stage gets to start of map" % wait)
-        time.sleep(wait)
-
-        fp = open(self.filename, 'w')
-        header = self.make_digital_header()
-        fp.write(header)
-        plt.ion()
-        plt.plot([self.azimuth.xmin, self.azimuth.xmax], [0, 0], 'r-')
-        plt.xlim(self.azimuth.xmin, self.azimuth.xmax)
-        plt.ylim(-0.5, 6)
-        plt.draw()
-        for az in azimuths:
-            wait = (abs(az-self.uni.pos_az)/self.azimuth.xmap_vel) + 1.0
-            self.uni.set_azimuth(az, self.azimuth.xmap_vel)
-            logger.info("Sleeping for %.2f seconds while stage gets to %.1f degrees" % (wait, az))
-            time.sleep(wait)
-            fp.write("%.3f" % az)
-            #data = self.take_readings()
-            for i, freq in enumerate(self.freq_list):
-                self.syn.set_freq(freq)
-                for dig_channel in range(8):
-                    for dig in range(8):
-                        if dig != dig_channel:
-                            self.labjack.digital_output(dig, 1)
-                            time.sleep(0.050)
-                    self.labjack.digital_output(dig_channel, 0)
-                    time.sleep(0.050)
-                    ratio, phase = self.vv.measure_vector_averaged_transmission(self.average)
-                    fp.write(",%.6g,%.6g" % (ratio, phase))
-                    logger.info("Az: %.2f, Freq: %.3f, Ratio: %g; Phase: %g" % (az, freq/1e9, ratio, phase))
-                    plt.plot(az, ratio, self.plot_symbols[i])
-                    plt.draw()
-            fp.write('\n')
+        wait = self.uni.wait_for_motion()
+        logger.info("Stage got to start of map in %.2f seconds" % wait)
+
+        fp = self.open_map_file(self.make_digital_header(), channels=range(8))
+        self.plotter = self.start_plotter()
+        self.tuned = None
+        sequence = channel_sequence(len(self.freq_list), 8, self.choose_channel_order())
+        if pipeline:
+            self._make_digital_map_pipelined(fp, azimuths, sequence)
+        else:
+            for az in azimuths:
+                self.uni.set_azimuth(az, self.azimuth.xmap_vel)
+                wait = self.uni.wait_for_motion()
+                logger.info("Stage got to %.1f degrees in %.2f seconds" % (az, wait))
+                row = [None]*len(sequence)
+                for i, dig_channel in sequence:
+                    self._digital_setup(i, dig_channel)
+                    with timing.phase('detector'):
+                        ratio, phase = self.vv.measure_vector_averaged_transmission(self.average)
+                    row[8*i + dig_channel] = (ratio, phase)
+                    logger.info("Az: %.2f, Freq: %.3f, Channel: %d, Ratio: %g; Phase: %g" % \
+                                (az, self.freq_list[i]/1e9, dig_channel, ratio, phase))
+                    with timing.phase('plot'):
+                        self.plotter.add(i, az, ratio)
+                # columns are always frequency major, whatever the order taken
+                fp.begin_row(az)
+                for ratio, phase in row:
+                    fp.add(ratio, phase)
+                fp.end_row()
                          
-        time.sleep(10.0)
         self.uni.home(axis='X')
+        self.uni.wait_for_motion()
         logger.info("Map Completed, Saving data file %s" % self.filename)
         fp.close()
+        self.plotter.finish()
 
-    def make_map(self):
-        self.uni.home(axis='X')
-        time.sleep(10.0)
+    def choose_channel_order(self):
+        """
+        Returns the channel_sequence order of a digital map,
+        'frequency' or 'channel'. When the configured loop_order is
+        auto, a retune (plus the synthesizer settle time) and a
+        channel switch (plus the line settle time) are timed and
+        the cheaper order picked
+        """
+        order = self.dio.loop_order
+        if order != 'auto':
+            return order
+        retune = measure_retune(self.syn.set_freq, self.freq_list, 0.050)
+        self.tuned = 0
+        t0 = time.time()
+        self.labjack.digital_state(self.labjack.states[0])
+        switch = time.time() - t0 + self.labjack.settle_time
+        freq_cost, chan_cost = estimate_channel_costs(len(self.freq_list), 8, retune, switch)
+        if chan_cost < freq_cost:
+            order = 'channel'
+        else:
+            order = 'frequency'
+        logger.info("Retune %.3f s, channel switch %.3f s; estimated %.2f s per position frequency first, "
+                    "%.2f s channel first. Using %s order" % (retune, switch, freq_cost, chan_cost, order))
+        return order
+
+    def _digital_setup(self, i, dig_channel):
+        """
+        Tunes to frequency i, unless already there, and selects
+        dig_channel. A retune that is not followed by a channel
+        switch (and its settle) gets the synthesizer settle time
+        """
+        retuned = self.tuned != i
+        if retuned:
+            self.syn.set_freq(self.freq_list[i])
+            self.tuned = i
+        if not self.labjack.select_channel(dig_channel) and retuned:
+            timing.settle(0.050)
+
+    def _make_digital_map_pipelined(self, fp, azimuths, sequence):
+        """
+        Digital map loop run by pipelined_scan. Each frequency and
+        digital channel pair of sequence is one measurement, so the
+        stage move, the retune and the line settling for the first
+        of the next position overlap the write and plot of this one
+        """
+        def prepare(n):
+            self._digital_setup(*sequence[n])
+
+        def move(j):
+            self.uni.set_azimuth(azimuths[j], self.azimuth.xmap_vel)
+            wait = self.uni.wait_for_motion()
+            logger.info("Stage got to %.1f degrees in %.2f seconds" % (azimuths[j], wait))
+
+        def read(k, j):
+            with timing.phase('detector'):
+                return self.vv.measure_vector_averaged_transmission(self.average)
+
+        def emit(j, row):
+            az = azimuths[j]
+            columns = [None]*len(sequence)
+            for (i, dig_channel), (ratio, phase) in zip(sequence, row):
+                columns[8*i + dig_channel] = (ratio, phase)
+                logger.info("Az: %.2f, Freq: %.3f, Channel: %d, Ratio: %g; Phase: %g" % \
+                            (az, self.freq_list[i]/1e9, dig_channel, ratio, phase))
+                with timing.phase('plot'):
+                    self.plotter.add(i, az, ratio)
+            fp.begin_row(az)
+            for ratio, phase in columns:
+                fp.add(ratio, phase)
+            fp.end_row()
+
+        pipelined_scan(len(azimuths), len(sequence), prepare, move, read, emit)
+
+    def open_map_file(self, header, channels=None):
+        """
+        Returns a MapWriter for the map in the configured output
+        format. channels lists the digital channels measured at each
+        frequency, if any
+        """
+        metadata = {'freq': self.freq_list/1e9}
+        if channels is not None:
+            metadata['channels'] = channels
+        return MapWriter(self.filename, header, output_format=self.general.output_format,
+                         columns=('ratio', 'phase'), config=self.cfg, metadata=metadata)
+
+    def start_plotter(self, ylim=(-0.5, 6)):
+        """Starts the live plot of amplitude ratio against azimuth"""
+        labels = ['%.3f GHz' % (freq/1e9) for freq in self.freq_list]
+        return LivePlotter(labels, (self.azimuth.xmin, self.azimuth.xmax), ylim,
+                           symbols=self.plot_symbols, figsize=self.plot.figsize,
+                           refresh=self.plot.refresh,
+                           enabled=self.plot.live).start()
+
+    def choose_loop_order(self, positions, velocity, settle):
+        """
+        Returns the map loop order, 'position' or 'frequency', see
+        choose_loop_order in scan_planning. settle is the time the
+        map loop waits after a retune.
+        """
+        return scan_planning.choose_loop_order(self.synthesizer.loop_order, positions,
+                                               self.freq_list, self.syn.set_freq,
+                                               velocity, self.unidex.move_overhead,
+                                               settle)
+
+    def _scan_callbacks(self, section, azimuths, key=None, report=True):
+        """
+        Returns the tune(i), read(i, j) and done(i, j) callbacks of a
+        scan over the map frequencies at azimuths. Readings are
+        journaled under section, by key(j) (by j if key is None);
+        with report each reading is logged and plotted as it is
+        taken.
+        """
+        if key is None:
+            key = lambda j: j
+
+        def tune(i):
+            self.syn.set_freq(self.freq_list[i])
+            timing.settle(0.050)
+
+        def read(i, j):
+            with timing.phase('detector'):
+                ratio, phase = self.vv.measure_vector_averaged_transmission(self.average)
+            self.journal.point(section, key(j), i, (ratio, phase))
+            if report:
+                logger.info("Az: %.3f, Freq: %.3f, Ratio: %g; Phase: %g" % (azimuths[j], self.freq_list[i]/1e9, ratio, phase))
+                with timing.phase('plot'):
+                    self.plotter.add(i, azimuths[j], ratio)
+            return ratio, phase
+
+        def done(i, j):
+            return self.journal.get(section, key(j), i)
+
+        return tune, read, done
+
+    def _make_map_frequency_outer(self, fp, azimuths):
+        """
+        Frequency-outer map loop. The synthesizer is tuned once per
+        frequency and the stage swept across the map for it, in
+        alternating directions. Each row is written as soon as the
+        last sweep has taken it, so the file fills while the map
+        runs and keeps the position-outer layout.
+        """
+        tune, read, done = self._scan_callbacks('map', azimuths)
+        move = stage_mover(self.uni, self.azimuth.xmap_vel, azimuths=azimuths)
+        def emit(j, row):
+            fp.begin_row(azimuths[j])
+            for ratio, phase in row:
+                fp.add(ratio, phase)
+            fp.end_row()
+
+        frequency_outer_scan(len(azimuths), len(self.freq_list),
+                             tune, move, read, done=done, emit=emit)
+
+    def _make_map_pipelined(self, fp, azimuths):
+        """
+        Position-outer map loop run by pipelined_scan: the move to
+        the next azimuth and the retune to its first frequency
+        overlap the write and plot of the row just taken
+        """
+        tune, read, done = self._scan_callbacks('map', azimuths, report=False)
+        move = stage_mover(self.uni, self.azimuth.xmap_vel, azimuths=azimuths)
+
+        def emit(j, row):
+            fp.begin_row(azimuths[j])
+            for i, (ratio, phase) in enumerate(row):
+                fp.add(ratio, phase)
+                logger.info("Az: %.2f, Freq: %.3f, Ratio: %g; Phase: %g" % (azimuths[j], self.freq_list[i]/1e9, ratio, phase))
+                with timing.phase('plot'):
+                    self.plotter.add(i, azimuths[j], ratio)
+            fp.end_row()
+
+        pipelined_scan(len(azimuths), len(self.freq_list), tune, move, read, emit, done=done)
+
+    def make_map(self, pipeline=False):
+        """
+        Position-outer (or frequency-outer, see choose_loop_order)
+        map. With pipeline the position-outer loop is taken by
+        pipelined_scan, overlapping each move with the file write
+        and plot of the previous row
+        """
+        resuming = self.journal.begin(self.filename, self.datetime_str, self.cfgfile, 'make_map',
+                                      pipeline=pipeline)
+        if not resuming:
+            self.uni.home(axis='X')
+            self.uni.wait_for_motion()
         azimuths = []
         for x in numpy.arange(self.azimuth.xmin, self.azimuth.xmax + self.azimuth.xinc,
                               self.azimuth.xinc):
@@ -199,56 +402,195 @@ class AzimuthVectorMap(object):
                 x = self.azimuth.xmax
             azimuths.append(x)
         azimuths = numpy.array(azimuths)
-        wait = (abs(azimuths[0]-self.uni.pos_az)/self.azimuth.xslew_vel) + 1.0
-        self.uni.set_azimuth(azimuths[0], self.azimuth.xslew_vel)
-        logger.info("Sleeping for %.2f seconds while stage gets to start of map" % wait)
-        time.sleep(wait)
-
-        fp = open(self.filename, 'w')
-        header = self.make_header()
-        fp.write(header)
-        plt.ion()
-        plt.plot([self.azimuth.xmin, self.azimuth.xmax], [0, 0], 'r-')
-        plt.xlim(self.azimuth.xmin, self.azimuth.xmax)
-        plt.ylim(-0.5, 6)
-        plt.draw()
-        for az in azimuths:
-            wait = (abs(az-self.uni.pos_az)/self.azimuth.xmap_vel) + 1.0
-            self.uni.set_azimuth(az, self.azimuth.xmap_vel)
-            logger.info("Sleeping for %.2f seconds while stage gets to %.1f degrees" % (wait, az))
-            time.sleep(wait)
-            fp.write("%.3f" % az)
-            #data = self.take_readings()
-            for i, freq in enumerate(self.freq_list):
-                self.syn.set_freq(freq)
-                time.sleep(0.050)
-                ratio, phase = self.vv.measure_vector_averaged_transmission(self.average)
-                fp.write(",%.6g,%.6g" % (ratio, phase))
-                logger.info("Az: %.2f, Freq: %.3f, Ratio: %g; Phase: %g" % (az, freq/1e9, ratio, phase))
-                plt.plot(az, ratio, self.plot_symbols[i])
-                plt.draw()
-            fp.write('\n')
+        order = self.choose_loop_order(azimuths, self.azimuth.xmap_vel, 0.050)
+        if not resuming:
+            start = scan_start(len(azimuths), len(self.freq_list), order)
+            self.uni.set_azimuth(azimuths[start], self.azimuth.xslew_vel)
+            wait = self.uni.wait_for_motion()
+            logger.info("Stage got to start of map in %.2f seconds" % wait)
+
+        fp = self.open_map_file(self.make_header())
+        self.plotter = self.start_plotter()
+        if order == 'frequency':
+            self._make_map_frequency_outer(fp, azimuths)
+        elif pipeline:
+            self._make_map_pipelined(fp, azimuths)
+        else:
+            for j, az in enumerate(azimuths):
+                if not self.journal.row_done('map', j, len(self.freq_list)):
+                    self.uni.set_azimuth(az, self.azimuth.xmap_vel)
+                    wait = self.uni.wait_for_motion()
+                    logger.info("Stage got to %.1f degrees in %.2f seconds" % (az, wait))
+                fp.begin_row(az)
+                #data = self.take_readings()
+                for i, freq in enumerate(self.freq_list):
+                    saved = self.journal.get('map', j, i)
+                    if saved is None:
+                        self.syn.set_freq(freq)
+                        timing.settle(0.050)
+                        with timing.phase('detector'):
+                            ratio, phase = self.vv.measure_vector_averaged_transmission(self.average)
+                        self.journal.point('map', j, i, (ratio, phase))
+                    else:
+                        ratio, phase = saved
+                    fp.add(ratio, phase)
+                    logger.info("Az: %.2f, Freq: %.3f, Ratio: %g; Phase: %g" % (az, freq/1e9, ratio, phase))
+                    with timing.phase('plot'):
+                        self.plotter.add(i, az, ratio)
+                fp.end_row()
                          
-        time.sleep(10.0)
         self.uni.home(axis='X')
+        self.uni.wait_for_motion()
         logger.info("Map Completed, Saving data file %s" % self.filename)
         fp.close()
+        self.journal.finish()
+        self.plotter.finish()
         
+    def _take_positions(self, azimuths):
+        """
+        Measures every frequency at each of azimuths, in the order
+        given, and returns the (ratio, phase) readings as [j][i].
+        Readings are journaled by azimuth, since the positions of an
+        adaptive map are not known in advance
+        """
+        tune, read, done = self._scan_callbacks('adaptive', azimuths,
+                                                key=lambda j: azimuths[j])
+        move = stage_mover(self.uni, self.azimuth.xmap_vel, azimuths=azimuths)
+
+        nfreq = len(self.freq_list)
+        if self.choose_loop_order(azimuths, self.azimuth.xmap_vel, 0.050) == 'frequency':
+            return frequency_outer_scan(len(azimuths), nfreq, tune, move, read, done=done)
+        results = []
+        for j in range(len(azimuths)):
+            if not self.journal.row_done('adaptive', azimuths[j], nfreq):
+                move(j)
+            row = []
+            for i in range(nfreq):
+                reading = done(i, j)
+                if reading is None:
+                    tune(i)
+                    reading = read(i, j)
+                row.append(reading)
+            results.append(row)
+        return results
+
+    def make_adaptive_map(self):
+        """
+        Adaptive map. A coarse pass on the xinc grid is followed by
+        passes that add points halfway across the intervals where the
+        amplitude ratio (in dB, down to the dynamic_range floor)
+        changes or curves the most, until no interval needs
+        splitting, xinc_min is reached or the point or time budget
+        is spent. The data file holds the sorted positions in the
+        usual layout.
+        """
+        resuming = self.journal.begin(self.filename, self.datetime_str, self.cfgfile,
+                                      'make_adaptive_map')
+        if not resuming:
+            self.uni.home(axis='X')
+            self.uni.wait_for_motion()
+        coarse = position_grid(self.azimuth.xmin, self.azimuth.xmax, self.azimuth.xinc)
+        if not resuming:
+            self.uni.set_azimuth(coarse[0], self.azimuth.xslew_vel)
+            wait = self.uni.wait_for_motion()
+            logger.info("Stage got to start of map in %.2f seconds" % wait)
+
+        def levels(values):
+            # values is (npos, nfreq, 2) of ratio, phase
+            return db_levels(values[:, :, 0], self.azimuth.dynamic_range, amplitude=True)
+
+        self.plotter = self.start_plotter()
+        azimuths, values, npasses = adaptive_scan(coarse, self._take_positions, levels,
+                                                  self.azimuth.xinc_min,
+                                                  self.azimuth.refine_threshold,
+                                                  max_points=self.azimuth.max_points,
+                                                  max_time=self.azimuth.max_time)
+        logger.info("Adaptive map took %d positions in %d passes (%d on the coarse grid)" % \
+                    (len(azimuths), npasses, len(coarse)))
+        fp = self.open_map_file(self.make_header(adaptive=(len(azimuths), npasses,
+                                                           self.azimuth.xinc_min)))
+        for j, az in enumerate(azimuths):
+            fp.begin_row(az)
+            for ratio, phase in values[j]:
+                fp.add(ratio, phase)
+            fp.end_row()
+        self.uni.home(axis='X')
+        self.uni.wait_for_motion()
+        logger.info("Map Completed, Saving data file %s" % self.filename)
+        fp.close()
+        self.journal.finish()
+        self.plotter.finish()
+
+    def _otf_sample(self):
+        with timing.phase('detector'):
+            ratio, phase = self.vv.measure_transmission_single(average=self.average)
+        return ratio * numpy.exp(1j*numpy.radians(phase))
+
+    def make_otf_map(self):
+        """
+        On-the-fly map. For each frequency the stage is slewed once
+        across xmin..xmax at xmap_vel while the vector voltmeter is
+        read as fast as it will go. Readings are binned into the
+        xinc grid as complex vectors, so the ratio and phase written
+        out are those of the vector mean in each cell.
+        """
+        self.uni.home(axis='X')
+        self.uni.wait_for_motion()
+        azimuths = position_grid(self.azimuth.xmin, self.azimuth.xmax,
+                                 self.azimuth.xinc)
+        half = self.azimuth.xinc/2.0
+        ends = (max(self.azimuth.xmin - half, self.uni.limits[0]),
+                min(self.azimuth.xmax + half, self.uni.limits[1]))
+        self.uni.set_azimuth(ends[0], self.azimuth.xslew_vel)
+        wait = self.uni.wait_for_motion()
+        logger.info("Stage got to start of map in %.2f seconds" % wait)
+
+        cmplx = numpy.zeros((len(azimuths), len(self.freq_list)), dtype='complex')
+        self.plotter = self.start_plotter()
+        for i, freq in enumerate(self.freq_list):
+            self.syn.set_freq(freq)
+            timing.settle(0.050)
+            x_start = self.uni.pos_az
+            if x_start == ends[0]:
+                x_end = ends[1]
+            else:
+                x_end = ends[0]
+            positions, values = otf_sweep(self.uni, x_start, x_end,
+                                          self.azimuth.xmap_vel, self._otf_sample)
+            mean, std, count = bin_samples(positions, values, azimuths)
+            logger.info("Freq: %.3f, %d readings filled %d of %d cells" % \
+                        (freq/1e9, len(values), (count > 0).sum(), len(azimuths)))
+            cmplx[:, i] = mean
+            with timing.phase('plot'):
+                self.plotter.set_line(i, azimuths, numpy.abs(mean))
+
+        self.uni.home(axis='X')
+        fp = self.open_map_file(self.make_header())
+        for j, az in enumerate(azimuths):
+            fp.begin_row(az)
+            for i, freq in enumerate(self.freq_list):
+                fp.add(numpy.abs(cmplx[j, i]), numpy.degrees(numpy.angle(cmplx[j, i])))
+            fp.end_row()
+        self.uni.wait_for_motion()
+        logger.info("Map Completed, Saving data file %s" % self.filename)
+        fp.close()
+        self.plotter.finish()
+
     def take_zero_offsets(self):
         #self.uni.home(axis='X')
         #time.sleep(5.0)
-        fp = open(self.filename, 'w')
-        header = self.make_header()
-        fp.write(header)
+        fp = self.open_map_file(self.make_header())
         for i, freq in enumerate(self.freq_list):
             self.syn.set_freq(freq)
-            time.sleep(0.050)
-            ratio, phase = self.vv.measure_vector_averaged_transmission(self.average)
-            fp.write(",%.6g,%.6g" % (ratio, phase))
+            timing.settle(0.050)
+            with timing.phase('detector'):
+                ratio, phase = self.vv.measure_vector_averaged_transmission(self.average)
+            fp.begin_row()
+            fp.add(ratio, phase)
             logger.info("Freq: %.3f, Ratio: %g; Phase: %g" % (freq/1e9, ratio, phase))
             #plt.plot(az, ratio, self.plot_symbols[i])
             #plt.draw()
-            fp.write('\n')
+            fp.end_row()
                          
         #time.sleep(10.0)
         #self.uni.home(axis='X')
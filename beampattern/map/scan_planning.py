@@ -0,0 +1,400 @@
+"""
+Helpers for planning map scans and reducing the samples
+taken during them. These are numpy functions that do not talk to
+any hardware themselves (the map engines pass in callables for
+that), so they can be shared by all the map engines.
+"""
+
+import time
+import numpy
+
+from beampattern.logging import logger
+
+logger.name = __name__
+
+
+def position_grid(pmin, pmax, pinc, clip=True):
+    """
+    Returns the array of map positions from pmin to pmax
+    in steps of pinc. If clip is True the last position is
+    clipped to pmax, the same way the map loops always have.
+    """
+    positions = []
+    for p in numpy.arange(pmin, pmax + pinc, pinc):
+        if clip and p > pmax:
+            p = pmax
+        positions.append(p)
+    return numpy.array(positions)
+
+
+def otf_positions(times, t_start, x_start, x_end, velocity):
+    """
+    Reconstruct stage positions for samples taken at host times
+    during an on-the-fly slew that was commanded at t_start
+    from x_start to x_end at velocity (deg/s). Positions are
+    clipped to the commanded range.
+    """
+    times = numpy.asarray(times, dtype=float)
+    if x_end >= x_start:
+        direction = 1.0
+    else:
+        direction = -1.0
+    pos = x_start + direction*velocity*(times - t_start)
+    return numpy.clip(pos, min(x_start, x_end), max(x_start, x_end))
+
+
+def bin_samples(positions, values, grid):
+    """
+    Bin samples at arbitrary positions into the cells of a
+    sorted position grid. Cell edges sit halfway between grid
+    points. Values may be real or complex.
+    Returns (mean, std, count) arrays of the same length as grid.
+    Cells with no samples have a mean and std of nan.
+    """
+    grid = numpy.asarray(grid, dtype=float)
+    positions = numpy.asarray(positions, dtype=float)
+    values = numpy.asarray(values)
+    n = len(grid)
+    if n > 1:
+        mids = 0.5*(grid[1:] + grid[:-1])
+        edges = numpy.concatenate(([grid[0] - (mids[0] - grid[0])],
+                                   mids,
+                                   [grid[-1] + (grid[-1] - mids[-1])]))
+    else:
+        edges = numpy.array([grid[0] - 0.5, grid[0] + 0.5])
+    idx = numpy.searchsorted(edges, positions, side='right') - 1
+    valid = (idx >= 0) & (idx < n)
+    idx = idx[valid]
+    values = values[valid]
+    count = numpy.bincount(idx, minlength=n)
+    if numpy.iscomplexobj(values):
+        total = numpy.bincount(idx, weights=values.real, minlength=n) + \
+                1j*numpy.bincount(idx, weights=values.imag, minlength=n)
+    else:
+        total = numpy.bincount(idx, weights=values, minlength=n)
+    sqtotal = numpy.bincount(idx, weights=numpy.abs(values)**2, minlength=n)
+    with numpy.errstate(invalid='ignore', divide='ignore'):
+        mean = total/count
+        var = sqtotal/count - numpy.abs(mean)**2
+    std = numpy.sqrt(numpy.clip(var, 0.0, None))
+    empty = count == 0
+    mean[empty] = numpy.nan
+    std[empty] = numpy.nan
+    return mean, std, count
+
+
+def serpentine_indices(npos, nsweeps):
+    """
+    Returns a list of nsweeps index arrays over npos positions,
+    alternating in direction so that each sweep starts where the
+    last one ended.
+    """
+    forward = numpy.arange(npos)
+    sweeps = []
+    for k in range(nsweeps):
+        if k % 2 == 0:
+            sweeps.append(forward)
+        else:
+            sweeps.append(forward[::-1])
+    return sweeps
+
+
+def estimate_loop_costs(positions, nfreq, velocity, move_overhead,
+                        retune_time):
+    """
+    Estimate the stage and synthesizer time (seconds) spent by the
+    two possible map loop orders over the given positions.
+    move_overhead is the fixed cost of a move beyond
+    distance/velocity and retune_time the cost of a frequency
+    change including its settle time.
+    Returns (position_outer, frequency_outer) costs.
+    """
+    positions = numpy.asarray(positions, dtype=float)
+    steps = numpy.abs(numpy.diff(positions))
+    sweep = steps.sum()/velocity + len(steps)*move_overhead
+    position_outer = sweep + len(positions)*nfreq*retune_time
+    frequency_outer = nfreq*sweep + nfreq*retune_time
+    return position_outer, frequency_outer
+
+
+def measure_retune(retune, freqs, settle):
+    """
+    Time (seconds) of a frequency change: retune(freqs[0]) is
+    timed and the settle time the map loop waits after a retune
+    is added
+    """
+    t0 = time.time()
+    retune(freqs[0])
+    return time.time() - t0 + settle
+
+
+def choose_loop_order(loop_order, positions, freqs, retune, velocity,
+                      move_overhead, settle):
+    """
+    Returns the map loop order, 'position' or 'frequency'. A
+    configured loop_order other than auto is returned as is. With
+    auto the cost of a retune to freqs[0] is measured (see
+    measure_retune) and the estimate_loop_costs of the two orders
+    over positions compared.
+    """
+    if loop_order != 'auto':
+        return loop_order
+    retune_time = measure_retune(retune, freqs, settle)
+    pos_cost, freq_cost = estimate_loop_costs(positions, len(freqs), velocity,
+                                              move_overhead, retune_time)
+    if freq_cost < pos_cost:
+        order = 'frequency'
+    else:
+        order = 'position'
+    logger.info("Estimated position-outer: %.1f s; frequency-outer: %.1f s. Using %s loop order" % \
+                (pos_cost, freq_cost, order))
+    return order
+
+
+def channel_sequence(nfreq, nchan, order='frequency'):
+    """
+    Returns the (frequency, channel) index pairs of a multiplexed
+    measurement in the order they are taken. 'frequency' order
+    runs through the channels at each frequency in turn, 'channel'
+    order through the frequencies on each channel. The inner loop
+    alternates direction, so each pass starts on the frequency or
+    channel the last one ended on.
+    """
+    if order == 'frequency':
+        return [(i, ch) for i, sweep in enumerate(serpentine_indices(nchan, nfreq))
+                for ch in sweep]
+    return [(i, ch) for ch, sweep in enumerate(serpentine_indices(nfreq, nchan))
+            for i in sweep]
+
+
+def estimate_channel_costs(nfreq, nchan, retune_time, switch_time):
+    """
+    Estimate the retune and channel switch time (seconds) spent at
+    each map position by the two orders of channel_sequence, given
+    the cost of a frequency change and of a channel switch, each
+    including its settle time.
+    Returns (frequency_order, channel_order) costs.
+    """
+    frequency_order = nfreq*retune_time + (nfreq*(nchan - 1) + 1)*switch_time
+    channel_order = nchan*switch_time + (nchan*(nfreq - 1) + 1)*retune_time
+    return frequency_order, channel_order
+
+
+def frequency_outer_scan(npos, nfreq, tune, move, read, done=None, emit=None):
+    """
+    Run a frequency-outer scan. For each frequency index i,
+    tune(i) is called once and then the stage is swept across all
+    npos positions, alternating direction between frequencies, with
+    move(j) followed by read(i, j) at each position j.
+    If given, done(i, j) returns the value of a point that was
+    already taken (when resuming a map) or None; such points are
+    not measured again and frequencies with none left to measure
+    are not tuned.
+    If given, emit(j, row) is called with the row of values of
+    position j as soon as the last sweep completes it, so rows can
+    be written while the scan runs. The last sweep then always runs
+    forward, so rows are emitted in order; with an even nfreq this
+    makes the first sweep start at the far end.
+    Returns a list of rows indexed [j][i] holding the value read(i, j)
+    returned, so the caller can write rows in the usual layout.
+    """
+    results = [[None]*nfreq for j in range(npos)]
+    sweeps = serpentine_indices(npos, nfreq)
+    if emit is not None and nfreq % 2 == 0:
+        sweeps = [sweep[::-1] for sweep in sweeps]
+    for i, sweep in enumerate(sweeps):
+        tuned = False
+        for j in sweep:
+            if done is not None:
+                results[j][i] = done(i, j)
+            if results[j][i] is None:
+                if not tuned:
+                    tune(i)
+                    tuned = True
+                move(j)
+                results[j][i] = read(i, j)
+            if emit is not None and i == nfreq - 1:
+                emit(j, results[j])
+    return results
+
+
+def scan_start(npos, nfreq, loop_order):
+    """
+    Index of the position a map starts at: the far end for a
+    frequency-outer scan over an even number of frequencies,
+    whose first sweep runs backwards when its rows are emitted
+    as it goes (see frequency_outer_scan), else the first position
+    """
+    if loop_order == 'frequency' and nfreq % 2 == 0:
+        return npos - 1
+    return 0
+
+
+def _sweep_time(positions, velocity, move_overhead):
+    """Stage time (seconds) of stepping through positions in order"""
+    steps = numpy.abs(numpy.diff(numpy.asarray(positions, dtype=float)))
+    return steps.sum()/velocity + len(steps)*move_overhead
+
+
+def plan_raster(azimuths, elevations, az_vel, el_vel, move_overhead,
+                nfreq=1, retune_time=0.0, loop_order='position'):
+    """
+    Plan a boustrophedon (serpentine) raster over the full
+    azimuths x elevations grid. One axis is stepped within a row
+    (the inner axis) and the other once between rows; each row
+    starts at the end the previous one finished, so the stage
+    never slews back. With loop_order 'position' all nfreq
+    frequencies are taken at each point; with 'frequency' each row
+    is swept once per frequency (alternating direction), so an even
+    nfreq leaves the stage back at the start of the row.
+    Both choices of inner axis are costed, counting stage time on
+    both axes plus retune_time per frequency change, and the
+    cheaper is returned as (inner, rows, cost): inner is 'az' or
+    'el' and rows a list of (outer index, inner index array) in
+    scan order, the inner indices in the direction of the row's
+    first sweep.
+    """
+    axes = {'az': (numpy.asarray(azimuths, dtype=float), az_vel),
+            'el': (numpy.asarray(elevations, dtype=float), el_vel)}
+    if loop_order == 'frequency':
+        sweeps = nfreq
+    else:
+        sweeps = 1
+    best = None
+    for inner, outer in (('az', 'el'), ('el', 'az')):
+        inner_pos, inner_vel = axes[inner]
+        outer_pos, outer_vel = axes[outer]
+        nrows = len(outer_pos)
+        cost = nrows*sweeps*_sweep_time(inner_pos, inner_vel, move_overhead) + \
+               _sweep_time(outer_pos, outer_vel, move_overhead)
+        if loop_order == 'frequency':
+            cost += nrows*nfreq*retune_time
+        else:
+            cost += nrows*len(inner_pos)*nfreq*retune_time
+        if best is None or cost < best[2]:
+            forward = numpy.arange(len(inner_pos))
+            rows = []
+            for k in range(nrows):
+                if sweeps % 2 == 1 and k % 2 == 1:
+                    rows.append((k, forward[::-1]))
+                else:
+                    rows.append((k, forward))
+            best = (inner, rows, cost)
+    return best
+
+
+def cell_widths(positions):
+    """
+    Widths of the cells around sorted positions, with cell edges
+    halfway between neighbours and the end cells as wide as their
+    inner half. For an evenly spaced grid every width is the step.
+    """
+    positions = numpy.asarray(positions, dtype=float)
+    if len(positions) < 2:
+        return numpy.ones(len(positions))
+    gaps = numpy.diff(positions)
+    widths = numpy.empty(len(positions))
+    widths[1:-1] = 0.5*(gaps[1:] + gaps[:-1])
+    widths[0] = gaps[0]
+    widths[-1] = gaps[-1]
+    return widths
+
+
+def db_levels(values, dynamic_range, amplitude=False):
+    """
+    Converts measured beam values (npos, nseries) to dB below the
+    peak of each series, floored at -dynamic_range so that noise on
+    the sidelobe floor does not look like structure. Values are
+    taken as power (a square law detector voltage) unless amplitude
+    is True.
+    """
+    values = numpy.abs(numpy.asarray(values, dtype=float))
+    if values.ndim == 1:
+        values = values[:, numpy.newaxis]
+    peak = values.max(axis=0)
+    peak[peak <= 0] = 1.0
+    if amplitude:
+        scale = 20.0
+    else:
+        scale = 10.0
+    floor = 10**(-dynamic_range/scale)
+    return scale*numpy.log10(numpy.clip(values/peak, floor, None))
+
+
+def refine_positions(positions, levels, min_step, threshold, max_new=None):
+    """
+    Chooses where to add points to a sorted 1-D scan. Each interval
+    is scored by the change in level (dB) across it plus the larger
+    curvature (second difference, dB) at its ends; the score of a
+    point is the largest over the series (columns) of levels. The
+    midpoints of intervals scoring above threshold are returned,
+    best first and at most max_new of them. Intervals narrower than
+    2*min_step are not split, so refinement always terminates.
+    """
+    positions = numpy.asarray(positions, dtype=float)
+    levels = numpy.asarray(levels, dtype=float)
+    if levels.ndim == 1:
+        levels = levels[:, numpy.newaxis]
+    if len(positions) < 2:
+        return numpy.array([])
+    step = numpy.abs(numpy.diff(levels, axis=0)).max(axis=1)
+    curv = numpy.zeros(len(positions))
+    if len(positions) > 2:
+        curv[1:-1] = numpy.abs(levels[2:] - 2*levels[1:-1] + levels[:-2]).max(axis=1)
+    score = step + numpy.maximum(curv[1:], curv[:-1])
+    score[numpy.diff(positions) < 2*min_step] = -numpy.inf
+    order = numpy.argsort(-score, kind='mergesort')
+    order = order[score[order] > threshold]
+    if max_new is not None:
+        order = order[:max(max_new, 0)]
+    return 0.5*(positions[order] + positions[order + 1])
+
+
+def adaptive_scan(coarse, take, levels, min_step, threshold,
+                  max_points=0, max_time=0.0):
+    """
+    Coarse to fine 1-D scan. take(positions) measures positions in
+    the order given and returns their values; levels(values) turns
+    the array of values at the sorted positions into dB levels for
+    refine_positions. After the coarse pass, each pass measures the
+    midpoints refine_positions picks, starting from the end nearest
+    the last position measured, until nothing needs refining or the
+    budget is spent: at most max_points positions in all, and no
+    pass expected (from the time per point so far) to run past
+    max_time seconds. A budget of 0 is no limit; the coarse pass is
+    always taken.
+    Returns (positions, values, npasses) sorted by position.
+    """
+    t0 = time.time()
+    measured = {}
+    pending = [float(p) for p in coarse]
+    npasses = 0
+    last = None
+    while pending:
+        if last is not None and abs(pending[-1] - last) < abs(pending[0] - last):
+            pending.reverse()
+        for pos, val in zip(pending, take(pending)):
+            measured[pos] = val
+        last = pending[-1]
+        npasses += 1
+        positions = sorted(measured)
+        values = numpy.array([measured[p] for p in positions])
+        max_new = None
+        if max_points > 0:
+            max_new = max_points - len(positions)
+        if max_time > 0:
+            elapsed = time.time() - t0
+            if elapsed >= max_time:
+                # budget spent: stop refining
+                by_time = 0
+            elif elapsed > 0:
+                by_time = max(int((max_time - elapsed)/(elapsed/len(positions))), 0)
+            else:
+                # too quick to time, nothing to estimate from
+                by_time = None
+            if by_time is not None and (max_new is None or by_time < max_new):
+                max_new = by_time
+        pending = sorted([float(p) for p in
+                          refine_positions(positions, levels(values), min_step,
+                                           threshold, max_new=max_new)])
+    return numpy.array(positions), values, npasses
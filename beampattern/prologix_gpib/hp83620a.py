@@ -11,12 +11,12 @@ class HP83620A(PrologixGPIB):
         self.idstr = self.idstring()        
 
     def write(self, msg):
-        self.prologix.set_gpib_address(self.gpib_address)        
-        self.prologix.write(msg)
+        with self.prologix.transaction(self.gpib_address):
+            self.prologix.write(msg)
 
     def ask(self, msg, readlen=128):
-        self.prologix.set_gpib_address(self.gpib_address)        
-        return self.prologix.ask(msg, readlen=readlen)
+        with self.prologix.transaction(self.gpib_address):
+            return self.prologix.ask(msg, readlen=readlen)
 
     def idstring(self):
         """returns ID String"""
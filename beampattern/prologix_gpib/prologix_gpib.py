@@ -1,31 +1,174 @@
 import socket
 import time
+import threading
+from contextlib import contextmanager
+from beampattern.utils.timing import phase
+from beampattern.utils.buffered_reader import BufferedReader
+from beampattern.utils.background import Worker
+
+# Address of the Prologix GPIB-ETHERNET controller on the range network
+DEFAULT_HOST = "192.168.2.100"
+DEFAULT_PORT = 1234
 
 class PrologixGPIB(object):
     """
     A GPIB Base class for the Prologix Ethernet based
-    GPIB device
+    GPIB device.
+
+    The controller is one session shared by the instruments on
+    the bus and may be used from several threads. The bus lock
+    makes each address select plus command/reply exchange atomic,
+    and each instrument has its own lock so a driver can hold it
+    over a longer sequence while other instruments still get the
+    bus between its exchanges. submit() runs driver calls on a
+    worker thread per instrument.
     """
-    def __init__(self, host="192.168.2.100",
-                 port=1234):
+    def __init__(self, host=None, port=None, timeout=10.0):
+        if host is None:
+            host = DEFAULT_HOST
+        if port is None:
+            port = DEFAULT_PORT
         self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.settimeout(timeout)
+        # commands are short and each one is waited on, so don't
+        # let Nagle hold them back
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
         self.sock.connect((host, port))
+        # replies from every instrument on the controller come back
+        # on the one socket, so they share the reader
+        self.reader = BufferedReader(self._recv)
+        # controller state as last set, None until we set it
+        self.address = None
+        self.auto = None
+        # commands queued by write() inside batch()
+        self.pending = []
+        self.batching = 0
+        self.lock = threading.RLock()
+        self.device_locks = {}
+        self.workers = {}
+
+    def _recv(self, size):
+        try:
+            return self.sock.recv(size)
+        except socket.timeout:
+            return ''
+
+    def _send(self, *lines):
+        """
+        Queue newline terminated lines, sending everything queued
+        unless inside batch()
+        """
+        self.pending.extend(lines)
+        if not self.batching:
+            self.flush()
+
+    def flush(self):
+        """Send the queued commands in one packet"""
+        if self.pending:
+            data = ''.join(['%s\n' % line for line in self.pending])
+            self.pending = []
+            with phase('io'):
+                self.sock.sendall(data)
+
+    @contextmanager
+    def batch(self):
+        """
+        Commands written inside the with block are sent together
+        when it ends (or when a reply is read). Holds the bus,
+        so take any instrument lock (device()) before it
+        """
+        with self.lock:
+            self.batching += 1
+            try:
+                yield self
+            finally:
+                self.batching -= 1
+                if not self.batching:
+                    self.flush()
+
+    def device_lock(self, gpib_address):
+        with self.lock:
+            if gpib_address not in self.device_locks:
+                self.device_locks[gpib_address] = threading.RLock()
+            return self.device_locks[gpib_address]
+
+    @contextmanager
+    def device(self, gpib_address):
+        """
+        Holds the instrument at gpib_address, but not the bus,
+        for the with block
+        """
+        with self.device_lock(gpib_address):
+            yield self
+
+    @contextmanager
+    def transaction(self, gpib_address):
+        """
+        Holds the instrument and the bus with gpib_address
+        selected; writes in the block are batched
+        """
+        with self.device(gpib_address):
+            with self.batch():
+                self.set_gpib_address(gpib_address)
+                yield self
+
+    def submit(self, gpib_address, fn, *args, **kwargs):
+        """
+        Runs fn(*args, **kwargs) on the worker thread of the
+        instrument at gpib_address, returning a Future
+        """
+        with self.lock:
+            if gpib_address not in self.workers:
+                self.workers[gpib_address] = Worker(name='gpib%d' % gpib_address)
+            worker = self.workers[gpib_address]
+        return worker.submit(fn, *args, **kwargs)
 
     def set_gpib_address(self, gpib_address):
-        self.sock.send('++addr %d\n' % gpib_address)
-        # put in auto 0 mode
-        self.sock.send('++auto 0\n')
+        """
+        Address gpib_address in auto 0 mode, only sending the
+        controller commands that change something
+        """
+        with self.lock:
+            lines = []
+            if gpib_address != self.address:
+                lines.append('++addr %d' % gpib_address)
+                self.address = gpib_address
+            if self.auto != 0:
+                # put in auto 0 mode
+                lines.append('++auto 0')
+                self.auto = 0
+            if lines:
+                self._send(*lines)
+
+    def ask_raw(self, msg):
+        """
+        Send and receive a newline terminated reply, which may hold
+        definite length binary blocks. Returns the reply without
+        its terminator
+        """
+        with self.lock:
+            self.pending.extend([msg, '++read eoi'])
+            self.flush()
+            with phase('io'):
+                return self.reader.read_message('\n')[:-1]
 
     def ask(self, msg, readlen=128):
         """Send and receive something"""
-        self.sock.send('%s\n' % msg)
-        self.sock.send('++read eoi\n')
-        ret = self.sock.recv(readlen)
-        return ret.strip()
+        return self.ask_raw(msg).strip()
+
+    def serial_poll(self, gpib_address):
+        """Serial poll the device and return its status byte"""
+        with self.lock:
+            self.pending.append('++spoll %d' % gpib_address)
+            self.flush()
+            with phase('io'):
+                ret = self.reader.read_until('\n')
+        return int(ret.strip())
 
     def write(self, msg):
         """Send something"""
-        self.sock.send('%s\n' % msg)
+        with self.lock:
+            self._send(msg)
 
     def idstring(self):
         """returns ID String"""
@@ -33,5 +176,9 @@ class PrologixGPIB(object):
         return ids        
 
     def close(self):
-        self.sock.close()
+        for worker in self.workers.values():
+            worker.stop()
+        with self.lock:
+            self.flush()
+            self.sock.close()
         
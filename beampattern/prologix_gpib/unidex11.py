@@ -2,8 +2,13 @@ import socket
 import time
 import struct
 from prologix_gpib import PrologixGPIB
+from beampattern.utils.unidex_motion import UnidexMotion
+from beampattern.utils.timing import phase
+from beampattern.logging import logger
 
-class Unidex11(PrologixGPIB):
+logger.name = __name__
+
+class Unidex11(UnidexMotion, PrologixGPIB):
     def __init__(self, prologix, gpib_address=2):
         self.prologix = prologix
         self.gpib_address = gpib_address
@@ -15,14 +20,18 @@ class Unidex11(PrologixGPIB):
         self.pos_el = 0.0
         self.limits = (-180.0, 180.0) # az and el position limits
         self.max_feedrate = 20000  #to be safe
+        self.expected_move_time = None
+        self.az_vel = 0.0          # actual velocity of last az move in deg/s
+        self.el_vel = 0.0
+        self.on_motion = None      # called as on_motion(pos_az, pos_el, settled)
 
     def write(self, msg):
-        self.prologix.set_gpib_address(self.gpib_address)        
-        self.prologix.write(msg)
+        with self.prologix.transaction(self.gpib_address):
+            self.prologix.write(msg)
 
     def ask(self, msg, readlen=128):
-        self.prologix.set_gpib_address(self.gpib_address)        
-        return self.prologix.ask(msg, readlen=readlen)
+        with self.prologix.transaction(self.gpib_address):
+            return self.prologix.ask(msg, readlen=readlen)
 
     def reset(self):
         self.write('C')
@@ -37,24 +46,18 @@ class Unidex11(PrologixGPIB):
         if axis not in ('X', 'Y', 'x', 'y'):
             logger.error("Only X & Y axes can be homed")
             return
+        self._notify_motion(False)
         self.write('I H %s *' % axis.upper())
+        self.expected_move_time = None
         if axis.upper() == 'X':
             self.pos_az = 0.0
         if axis.upper() == 'Y':
             self.pos_el = 0.0
 
-    # def command_in_progress(self):
-    #     """
-    #     Returns True if some command is
-    #     in progress
-    #     """
-    #     i = gpib.serial_poll(self.id)
-    #     motion = struct.unpack('b', i)[0] & 0x20
-    #     if motion:
-    #         return True
-    #     else:
-    #         return False
-    
+    def status_byte(self):
+        """Serial poll status byte of the controller"""
+        return self.prologix.serial_poll(self.gpib_address)
+
     def _set_position(self, axis, feedrate, numsteps):
         """
         Given a feedrate and number of steps
@@ -64,15 +67,11 @@ class Unidex11(PrologixGPIB):
             logger.error("Only X & Y axes can be moved")
             return
         self.write('I %s F%d D%d *' % (axis.upper(), feedrate, numsteps))
-        time.sleep(0.25)
-        # count = 0
-        # while self.command_in_progress():
-        #     time.sleep(0.5)
-        #     count += 1
-        #     if count % 4 == 0:
-        #         print "Command in progress, Time = %.2f seconds" % (count*0.5)
-        # time.sleep(0.5)
-        print "Position set"
+        if feedrate > 0:
+            self.expected_move_time = abs(numsteps)/float(feedrate)
+        else:
+            self.expected_move_time = 0.0
+        logger.debug("Position set")
         
     def set_azimuth(self, az_command, az_vel):
         """
@@ -87,21 +86,25 @@ class Unidex11(PrologixGPIB):
         feedrate = int(abs(az_vel)/self.step_size_az)
         if feedrate > self.max_feedrate:
             feedrate = self.max_feedrate
+        self.az_vel = feedrate*self.step_size_az
+        self._notify_motion(False)
         self._set_position('X', feedrate, numsteps)
         self.pos_az = az_command
         
-        def set_elevation(self, el_command, el_vel):
-            """
-            moves the stage in elevation to requested angle 
-            with velocity given in degrees/second.
-            Feedrate is calculated from this el_vel
-            """
-            if el_command < self.limits[0] or el_command > self.limits[1]:
-                logger.error("Exceeds range of drive")
-                return
-            numsteps = int((el_command-self.pos_el)/self.step_size_el)
-            feedrate = int(abs(el_vel)/self.step_size_el)
-            if feedrate > self.max_feedrate:
-                feedrate = self.max_feedrate
-            self._set_position('Y', feedrate, numsteps)
-            self.pos_el = el_command
+    def set_elevation(self, el_command, el_vel):
+        """
+        moves the stage in elevation to requested angle 
+        with velocity given in degrees/second.
+        Feedrate is calculated from this el_vel
+        """
+        if el_command < self.limits[0] or el_command > self.limits[1]:
+            logger.error("Exceeds range of drive")
+            return
+        numsteps = int((el_command-self.pos_el)/self.step_size_el)
+        feedrate = int(abs(el_vel)/self.step_size_el)
+        if feedrate > self.max_feedrate:
+            feedrate = self.max_feedrate
+        self.el_vel = feedrate*self.step_size_el
+        self._notify_motion(False)
+        self._set_position('Y', feedrate, numsteps)
+        self.pos_el = el_command
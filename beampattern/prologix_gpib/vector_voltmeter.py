@@ -2,24 +2,81 @@ import socket
 import time
 import struct
 from prologix_gpib import PrologixGPIB
+from beampattern.utils.buffered_reader import definite_blocks
+from beampattern.utils.beampattern_exceptions import BeamPatternGeneralError
 import numpy
 
+# an FP64 value: the definite block header '#18' and a big-endian double
+FP64_BLOCK = numpy.dtype([('header', 'S3'), ('value', '>f8')])
+
+def fp64_values(reply):
+    """
+    Decodes a reply of SYST:FORM FP64 values to a float array.
+    A reply of back to back '#18' blocks is decoded in one go
+    """
+    if len(reply) % FP64_BLOCK.itemsize == 0:
+        blocks = numpy.frombuffer(reply, dtype=FP64_BLOCK)
+        if (blocks['header'] == '#18').all():
+            return blocks['value'].astype(float)
+    return numpy.array([struct.unpack('>d', block)[0] for block in definite_blocks(reply)])
+
 class VectorVoltmeter(object):
     def __init__(self, prologix, gpib_address=15):
         self.prologix = prologix
         self.gpib_address = gpib_address
+        self.block = False   # take averaged readings as one triggered block
         self.prologix.set_gpib_address(self.gpib_address)
         self.idstr = self.idstring()
 
     def write(self, msg, initgpib=True):
-        if initgpib:
-            self.prologix.set_gpib_address(self.gpib_address)
-        self.prologix.write(msg)
+        # initgpib is kept for old callers; the address is always
+        # selected, which costs nothing when it is already current
+        with self.prologix.transaction(self.gpib_address):
+            self.prologix.write(msg)
 
     def ask(self, msg, readlen=128, initgpib=True):
-        if initgpib:
-            self.prologix.set_gpib_address(self.gpib_address)        
-        return self.prologix.ask(msg, readlen=readlen)
+        with self.prologix.transaction(self.gpib_address):
+            return self.prologix.ask(msg, readlen=readlen)
+
+    def ask_transmission(self):
+        """
+        MEAS? TRAN, returning (ratio, phase). With SYST:FORM FP64
+        these come back as two definite length blocks of one
+        big-endian double each
+        """
+        with self.prologix.transaction(self.gpib_address):
+            reply = self.prologix.ask_raw('MEAS? TRAN')
+        ratio, phase = fp64_values(reply)
+        return ratio, phase
+
+    def measure_block(self, nrdgs, samples=False):
+        """
+        Takes nrdgs single readings with one bus trigger and one
+        fetch, returning (ratio, phase, sem) of their vector mean,
+        where sem is the standard error of the mean in ratio
+        units, plus the complex readings if samples is True
+        """
+        with self.prologix.transaction(self.gpib_address):
+            self.write('SYST:FORM FP64')
+            self.write('AVER:COUN 1')
+            self.write('SAMP:COUN %d' % nrdgs)
+            self.write('INIT')
+            self.write('*TRG')
+            reply = self.prologix.ask_raw('FETC? TRAN')
+        values = fp64_values(reply)
+        if len(values) != 2*nrdgs:
+            raise BeamPatternGeneralError("VectorVoltmeter", "Got %d values for %d readings" % \
+                                          (len(values), nrdgs))
+        cmplx = values[0::2] * numpy.exp(1j*numpy.radians(values[1::2]))
+        mean = cmplx.mean()
+        if nrdgs > 1:
+            sem = numpy.sqrt((numpy.abs(cmplx - mean)**2).sum()/(nrdgs - 1)/nrdgs)
+        else:
+            sem = 0.0
+        ret = (numpy.abs(mean), numpy.degrees(numpy.angle(mean)), sem)
+        if samples:
+            ret = ret + (cmplx,)
+        return ret
 
     def idstring(self):
         """returns ID String"""
@@ -32,35 +89,38 @@ class VectorVoltmeter(object):
         meas = []
         t0 = time.time()
         while (time.time() - t0) < timelen:
-            str = self.ask('MEAS? TRAN', initgpib=False)
-            ratio = struct.unpack('>d', str[3:11])[0]
-            phase = struct.unpack('>d', str[14:])[0]
+            ratio, phase = self.ask_transmission()
             meas.append((ratio, phase))
             time.sleep(sleep)
             #print ratio, phase
         return meas
 
     def measure_transmission_single(self, average=3):
-        self.write('SYST:FORM FP64', initgpib=False)
-        self.write("AVER:COUN %d" % average, initgpib=False)
-        str = self.ask('MEAS? TRAN', initgpib=False)
-        ratio = struct.unpack('>d', str[3:11])[0]
-        phase = struct.unpack('>d', str[14:])[0]
+        # the settings go out in the same packet as the query
+        with self.prologix.transaction(self.gpib_address):
+            self.write('SYST:FORM FP64')
+            self.write("AVER:COUN %d" % average)
+            ratio, phase = self.ask_transmission()
         return ratio, phase
 
     def _measure_vector_averaged_transmission(self, average=10):
-        self.write('SYST:FORM FP64')
         cmplx = numpy.zeros(average, dtype='complex')
-        for i in range(average):
-            self.write("AVER:COUN 1", initgpib=False)
-            str = self.ask('MEAS? TRAN', initgpib=False)
-            ratio = struct.unpack('>d', str[3:11])[0]
-            phase = struct.unpack('>d', str[14:])[0]
-            cmplx[i] = ratio * numpy.exp(1j* numpy.radians(phase))
-            time.sleep(0.010)
+        # keep the settings for all the readings, while letting
+        # other instruments use the bus between them
+        with self.prologix.device(self.gpib_address):
+            with self.prologix.transaction(self.gpib_address):
+                self.write('SYST:FORM FP64')
+                self.write("AVER:COUN 1")
+            for i in range(average):
+                ratio, phase = self.ask_transmission()
+                cmplx[i] = ratio * numpy.exp(1j* numpy.radians(phase))
+                time.sleep(0.010)
         return cmplx
 
     def measure_vector_averaged_transmission(self, average=10):
+        if self.block:
+            ratio, phase, sem = self.measure_block(average)
+            return ratio, phase
         cmplx = self._measure_vector_averaged_transmission(average=average)
         ratio = numpy.abs(cmplx.mean())
         phase = numpy.degrees(numpy.angle(cmplx.mean()))
@@ -76,7 +136,8 @@ class VectorVoltmeter(object):
                                    "FREQ:BAND 10",
                                    "TRIG:SOUR BUS",
                                    "SENS TRAN"]
-        for s in setup_for_analog_output:
-            self.write(s, initgpib=False)
-            time.sleep(0.010)
+        with self.prologix.device(self.gpib_address):
+            for s in setup_for_analog_output:
+                self.write(s, initgpib=False)
+                time.sleep(0.010)
         
@@ -1,5 +1,7 @@
 import serial
 from beampattern.utils.beampattern_exceptions import BeamPatternGeneralError, BeamPatternArgumentError
+from beampattern.utils.timing import phase
+from beampattern.utils.buffered_reader import BufferedReader
 from beampattern.logging import logger
 import numpy
 
@@ -19,9 +21,19 @@ class Fluke(object):
                                     parity=serial.PARITY_NONE,
                                     stopbits=serial.STOPBITS_ONE,
                                     timeout=3)
+        self.reader = BufferedReader(self._recv)
+
+    def _recv(self, size):
+        with phase('io'):
+            # wait for the first byte, then take whatever else has arrived
+            data = self.serial.read(1)
+            if data and self.serial.in_waiting:
+                data += self.serial.read(min(size, self.serial.in_waiting))
+        return data
 
     def write(self, text):
-        self.serial.write('%s\r\n' % text)
+        with phase('io'):
+            self.serial.write('%s\r\n' % text)
 
     def read(self):
         ret = self.raw_read()
@@ -37,14 +49,7 @@ class Fluke(object):
         return self.raw_read()
 
     def raw_read(self):
-        ret = ''
-        text = self.serial.read(1)
-        ret += text
-        while text != '\r':
-            text = self.serial.read(1)
-            if not text:
-                break
-            ret += text
+        ret = self.reader.read_until('\r')
         return ret.strip('\n').strip('\r')
 
 
@@ -0,0 +1,78 @@
+"""
+Simulated beam pattern range. install_simulator() replaces the
+gpib, serial and labjack modules with simulated backends and
+starts a simulated Prologix controller, so the map engines and
+drivers run unmodified without any hardware attached.
+"""
+
+import sys
+import types
+import atexit
+
+from beampattern.simulator.beam import SyntheticBeam
+from beampattern.simulator.clock import SimClock
+from beampattern.simulator import instruments
+from beampattern.simulator import fake_gpib, fake_serial, fake_ljm
+from beampattern.simulator.prologix_server import PrologixServer
+from beampattern.utils.beampattern_exceptions import BeamPatternGeneralError
+from beampattern.logging import logger
+
+logger.name = __name__
+
+# driver modules that bind the hardware modules at import time
+_driver_modules = ('beampattern.gpib_devices.myGpib',
+                   'beampattern.serial.fluke',
+                   'beampattern.labjack.labjack_t7')
+
+
+def install_simulator(time_scale=10.0, beam=None, seed=None,
+                      prologix_port=0):
+    """
+    Install the simulated range. Has to be called before any
+    of the map engines or drivers are imported. The clock runs
+    time_scale times faster than real time. Returns the
+    SimulatedRange so callers can inspect or change its state.
+    """
+    for name in _driver_modules:
+        if name in sys.modules:
+            raise BeamPatternGeneralError("install_simulator",
+                                          "%s already imported; install the simulator first" % name)
+    clock = SimClock(time_scale=time_scale)
+    clock.install()
+    sim_range = instruments.SimulatedRange(beam=beam, seed=seed)
+    sim_range.clock = clock
+
+    # linux-gpib bus
+    fake_gpib.reset()
+    fake_gpib.register('unidex11', 2, instruments.SimUnidex11(sim_range))
+    fake_gpib.register('hp83620a', 12, instruments.SimHP83620A(sim_range))
+    fake_gpib.register('hp3457a', 22, instruments.SimMultimeter(sim_range))
+    fake_gpib.register('hp3478a', 23, instruments.SimHP3478A(sim_range))
+    fake_gpib.register('8510C', 16, instruments.SimAnalyzer8510C(sim_range))
+    sys.modules['gpib'] = fake_gpib
+
+    # Fluke on USB serial
+    fake_serial.reset()
+    fake_serial.register('/dev/ttyUSB0', instruments.SimFluke287(sim_range))
+    sys.modules['serial'] = fake_serial
+
+    # LabJack
+    fake_ljm.attach(sim_range)
+    labjack = types.ModuleType('labjack')
+    labjack.ljm = fake_ljm
+    sys.modules['labjack'] = labjack
+    sys.modules['labjack.ljm'] = fake_ljm
+
+    # Prologix bus, with its own set of instruments
+    server = PrologixServer({2: instruments.SimUnidex11(sim_range),
+                             12: instruments.SimHP83620A(sim_range),
+                             15: instruments.SimVectorVoltmeter(sim_range)},
+                            port=prologix_port)
+    host, port = server.start()
+    atexit.register(server.stop)
+    from beampattern.prologix_gpib import prologix_gpib
+    prologix_gpib.DEFAULT_HOST = host
+    prologix_gpib.DEFAULT_PORT = port
+    sim_range.prologix_server = server
+    logger.info("Simulated range installed, time scale %g" % time_scale)
+    return sim_range
@@ -0,0 +1,49 @@
+"""
+Synthetic antenna beam used by the simulated range.
+Gopal Narayanan <gopal@astro.umass.edu>
+"""
+
+import numpy
+
+
+class SyntheticBeam(object):
+    """
+    A frequency dependent far-field beam with a Gaussian main lobe
+    and sinc-like sidelobes. The beam width scales inversely with
+    frequency from fwhm (degrees) at ref_freq (GHz). The complex
+    pattern carries a quadratic phase error across the aperture so
+    that vector instruments see a realistic phase pattern.
+    """
+    def __init__(self, fwhm=10.0, ref_freq=74.0, sidelobe_level=-18.0,
+                 phase_curvature=30.0, squint=0.0):
+        self.fwhm = fwhm
+        self.ref_freq = ref_freq
+        self.sidelobe_level = sidelobe_level   # dB below peak
+        self.phase_curvature = phase_curvature # degrees at the half power point
+        self.squint = squint                   # pointing offset in az, degrees
+
+    def fwhm_at(self, freq):
+        """Returns FWHM in degrees at freq (GHz)"""
+        return self.fwhm * self.ref_freq / freq
+
+    def pattern(self, az, el, freq):
+        """
+        Complex voltage pattern at (az, el) in degrees
+        and freq in GHz, normalized to unity on boresight
+        """
+        az = numpy.asarray(az, dtype=float) - self.squint
+        el = numpy.asarray(el, dtype=float)
+        fwhm = self.fwhm_at(freq)
+        theta = numpy.sqrt(az**2 + el**2)/fwhm
+        main = numpy.exp(-4.0*numpy.log(2.0)*theta**2)
+        # sinc sidelobes, tapered so they do not disturb the main lobe
+        side = 10**(self.sidelobe_level/20.0) * numpy.sinc(theta - 1.0) * \
+               (1.0 - numpy.exp(-4.0*numpy.log(2.0)*theta**2))
+        amp = main + side
+        phase = numpy.radians(self.phase_curvature) * 4.0 * theta**2 + \
+                numpy.radians(freq*7.0)
+        return amp * numpy.exp(1j*phase)
+
+    def power(self, az, el, freq):
+        """Normalized power pattern"""
+        return numpy.abs(self.pattern(az, el, freq))**2
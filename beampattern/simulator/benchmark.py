@@ -0,0 +1,168 @@
+"""
+Map throughput benchmarks. Each map engine is run over a
+standard grid against the simulated range, with a PhaseTimer
+splitting the time of the map into motion, settle, detector,
+io, file and plot phases. Times are simulated range seconds,
+so they estimate how long the map would take on the range.
+"""
+
+import os
+import json
+import shutil
+import tempfile
+import datetime
+
+from beampattern.map.scan_planning import position_grid
+from beampattern.utils.timing import PhaseTimer
+from beampattern.utils.beampattern_exceptions import BeamPatternArgumentError
+from beampattern.logging import logger
+
+logger.name = __name__
+
+STANDARD_GRIDS = {
+    'quick': {'xmin': -10.0, 'xmax': 10.0, 'xinc': 2.0,
+              'ymin': -10.0, 'ymax': 10.0, 'yinc': 2.0,
+              'freq': [72.0, 74.0]},
+    'standard': {'xmin': -30.0, 'xmax': 30.0, 'xinc': 1.0,
+                 'ymin': -30.0, 'ymax': 30.0, 'yinc': 1.0,
+                 'freq': [70.0, 71.0, 72.0, 73.0, 74.0, 75.0]},
+    }
+
+ENGINES = ('azimuth', 'cross', 'diagonal', 'phase', 'vector', 'digital')
+# 'raster' can also be asked for, but is not run by default as a
+# raster over the standard grid takes hours of range time, and so
+# can 'vector-pipe' and 'digital-pipe', the pipelined versions of
+# the vector engines
+PIPELINED = '-pipe'
+
+
+def _engine_setup(name):
+    """
+    Returns (config module, frequency section, map class,
+    map method name, method kwargs, class kwargs) for an engine.
+    Imports are done here so the simulator is installed first.
+    """
+    if name in ('vector' + PIPELINED, 'digital' + PIPELINED):
+        setup = _engine_setup(name[:-len(PIPELINED)])
+        setup[4]['pipeline'] = True
+        return setup
+    if name == 'azimuth':
+        from beampattern.utils import configuration
+        from beampattern.map.range_map import AzimuthMap
+        return (configuration, 'synth', AzimuthMap, 'make_map',
+                {'measure_ac_offset': False}, {})
+    if name in ('cross', 'diagonal', 'raster'):
+        from beampattern.utils import configuration
+        from beampattern.map.range_map_general import BeamMap
+        method = {'cross': 'make_cross_scan', 'diagonal': 'make_diagonal_scan',
+                  'raster': 'make_raster_map'}[name]
+        return (configuration, 'synth', BeamMap, method,
+                {'measure_ac_offset': False}, {})
+    if name == 'phase':
+        from beampattern.utils import phase_configuration
+        from beampattern.map.range_map_phase import AzimuthPhaseMap
+        return (phase_configuration, 'vna', AzimuthPhaseMap, 'make_map', {}, {})
+    if name in ('vector', 'digital'):
+        from beampattern.utils import vector_voltmeter_configuration
+        from beampattern.map.range_map_vector import AzimuthVectorMap
+        if name == 'vector':
+            return (vector_voltmeter_configuration, 'synthesizer', AzimuthVectorMap,
+                    'make_map', {}, {})
+        return (vector_voltmeter_configuration, 'synthesizer', AzimuthVectorMap,
+                'make_digital_map', {}, {'digital': True})
+    raise BeamPatternArgumentError("benchmark", "Unknown map engine %s" % name)
+
+
+def count_points(name, grid):
+    """Number of measurements (position x frequency x channel) in a map"""
+    naz = len(position_grid(grid['xmin'], grid['xmax'], grid['xinc']))
+    nel = len(position_grid(grid['ymin'], grid['ymax'], grid['yinc']))
+    nfreq = len(grid['freq'])
+    if name.endswith(PIPELINED):
+        name = name[:-len(PIPELINED)]
+    if name == 'cross':
+        return (naz + nel)*nfreq
+    if name == 'digital':
+        return naz*nfreq*8
+    if name == 'raster':
+        return naz*nel*nfreq
+    return naz*nfreq
+
+
+def run_engine(name, grid, workdir, loop_order=None):
+    """
+    Runs one map engine over grid, writing its data files and
+    its configuration, as benchmark.cfg, into workdir so the maps
+    can be read back. Returns a dictionary with the phase
+    breakdown and the map throughput.
+    """
+    cfgmod, freqsec, mapclass, method, kwargs, clskwargs = _engine_setup(name)
+    cfg = cfgmod.default_config()
+    for key in ('xmin', 'xmax', 'xinc'):
+        cfg['azimuth'][key] = grid[key]
+    for key in ('ymin', 'ymax', 'yinc'):
+        cfg['elevation'][key] = grid[key]
+    cfg[freqsec]['freq'] = list(grid['freq'])
+    if loop_order is not None and 'loop_order' in cfg[freqsec]:
+        cfg[freqsec]['loop_order'] = loop_order
+    cfg.filename = os.path.join(workdir, 'benchmark.cfg')
+    cfg.write()
+    filename = os.path.join(workdir, '%s.txt' % name)
+    amap = mapclass(cfg, filename, 'benchmark', 'benchmark.cfg', **clskwargs)
+    amap.open_devices()
+    timer = PhaseTimer()
+    timer.start()
+    try:
+        getattr(amap, method)(**kwargs)
+    finally:
+        timer.stop()
+    result = timer.summary()
+    points = count_points(name, grid)
+    result['engine'] = name
+    result['method'] = '%s.%s' % (mapclass.__name__, method)
+    result['points'] = points
+    result['points_per_minute'] = points/(result['elapsed']/60.0)
+    logger.info("%s: %d points in %.1f s, %.1f points/minute" % \
+                (name, points, result['elapsed'], result['points_per_minute']))
+    return result
+
+
+def run_benchmarks(engines=ENGINES, grid='quick', output=None,
+                   loop_order=None, keep_files=False):
+    """
+    Runs the given engines over a standard grid name (or a grid
+    dictionary) and writes the results as JSON to output if given.
+    Each engine runs in its own subdirectory of a temporary
+    directory, which is kept if keep_files is set. The simulator
+    has to be installed before this is called. Returns the
+    results dictionary.
+    """
+    if isinstance(grid, basestring):
+        if grid not in STANDARD_GRIDS:
+            raise BeamPatternArgumentError("benchmark", "Unknown grid %s" % grid)
+        grid_name, grid = grid, STANDARD_GRIDS[grid]
+    else:
+        grid_name = 'custom'
+    workdir = tempfile.mkdtemp(prefix='beampattern_bench_')
+    results = []
+    try:
+        for name in engines:
+            enginedir = os.path.join(workdir, name)
+            os.mkdir(enginedir)
+            results.append(run_engine(name, grid, enginedir, loop_order=loop_order))
+    finally:
+        if keep_files:
+            logger.info("Benchmark data files kept in %s" % workdir)
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+    report = {'timestamp': datetime.datetime.now().strftime("%Y%m%d_%H%M%S"),
+              'grid': grid_name,
+              'grid_params': grid,
+              'loop_order': loop_order,
+              'results': results}
+    if output is not None:
+        fp = open(output, 'w')
+        json.dump(report, fp, indent=2, sort_keys=True)
+        fp.close()
+        logger.info("Benchmark results written to %s" % output)
+    return report
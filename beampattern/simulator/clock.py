@@ -0,0 +1,59 @@
+"""
+Accelerated clock for running the simulated range faster
+than real time
+"""
+
+import time
+import threading
+
+
+class SimClock(object):
+    """
+    Speeds up sleeping by time_scale. Once installed,
+    time.sleep(secs) returns after secs/time_scale and time.time()
+    is advanced by the full secs, so every module that uses the
+    time module (drivers, map engines and the simulated
+    instruments) sees a consistent clock. Computation is not
+    accelerated, so host-side costs such as plotting show up at
+    their true size. Sleeps that overlap in several threads do not
+    add up: the clock is advanced to the latest of their deadlines,
+    as it would be on the range.
+    """
+    def __init__(self, time_scale=10.0):
+        if time_scale <= 0:
+            raise ValueError("time_scale should be > 0")
+        self.time_scale = float(time_scale)
+        self._real_time = time.time
+        self._real_sleep = time.sleep
+        self._skipped = 0.0
+        self._lock = threading.Lock()
+        self.installed = False
+
+    def time(self):
+        return self._real_time() + self._skipped
+
+    def sleep(self, secs):
+        if secs > 0:
+            deadline = self.time() + secs
+            self._real_sleep(secs/self.time_scale)
+            with self._lock:
+                self._skipped = max(self._skipped, deadline - self._real_time())
+
+    def real_time(self):
+        """Wall clock time, unaffected by the simulation"""
+        return self._real_time()
+
+    def install(self):
+        """Replace time.time and time.sleep with the simulated versions"""
+        with self._lock:
+            if not self.installed:
+                time.time = self.time
+                time.sleep = self.sleep
+                self.installed = True
+
+    def uninstall(self):
+        with self._lock:
+            if self.installed:
+                time.time = self._real_time
+                time.sleep = self._real_sleep
+                self.installed = False
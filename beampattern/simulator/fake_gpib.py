@@ -0,0 +1,164 @@
+"""
+Stand-in for the linux-gpib python bindings (the gpib module)
+that routes every call to the simulated instruments. The
+simulator installs this module as sys.modules['gpib'] before the
+drivers are imported, so myGpib and the device classes run
+unchanged against it.
+"""
+
+import time
+
+# timeout constants as in linux-gpib
+TNONE, T10us, T30us, T100us, T300us, T1ms, T3ms, T10ms, T30ms, \
+    T100ms, T300ms, T1s, T3s, T10s, T30s, T100s, T300s, T1000s = range(18)
+
+_timeout_secs = {TNONE: None, T10us: 10e-6, T30us: 30e-6, T100us: 100e-6,
+                 T300us: 300e-6, T1ms: 1e-3, T3ms: 3e-3, T10ms: 10e-3,
+                 T30ms: 30e-3, T100ms: 0.1, T300ms: 0.3, T1s: 1.0,
+                 T3s: 3.0, T10s: 10.0, T30s: 30.0, T100s: 100.0,
+                 T300s: 300.0, T1000s: 1000.0}
+
+# ibask options
+IbaPAD = 0x1
+IbaSAD = 0x2
+IbaTMO = 0x3
+
+CMPL = 1 << 8
+END = 1 << 13
+TIMO = 1 << 14
+ERR = 1 << 15
+
+
+class GpibError(Exception):
+    pass
+
+
+class _Descriptor(object):
+    def __init__(self, instrument, pad, sad=0, tmo=T10s):
+        self.instrument = instrument
+        self.pad = pad
+        self.sad = sad
+        self.tmo = tmo
+
+
+_names = {}        # config file name -> (pad, instrument)
+_pads = {}         # primary address -> instrument
+_descriptors = {}
+_status = {'ibsta': 0, 'ibcnt': 0}
+
+
+def register(name, pad, instrument):
+    """Attach a simulated instrument at a name and primary address"""
+    _names[name] = (pad, instrument)
+    _pads[pad] = instrument
+
+
+def reset():
+    _names.clear()
+    _pads.clear()
+    _descriptors.clear()
+
+
+def _open(instrument, pad, sad=0, tmo=T10s):
+    ud = len(_descriptors) + 16
+    _descriptors[ud] = _Descriptor(instrument, pad, sad, tmo)
+    return ud
+
+
+def _get(ud):
+    if ud not in _descriptors:
+        raise GpibError("invalid descriptor %s" % ud)
+    return _descriptors[ud]
+
+
+def _done(count, status=CMPL):
+    _status['ibcnt'] = count
+    _status['ibsta'] = status
+
+
+def find(name):
+    if name not in _names:
+        raise GpibError("find() failed: no device named %s" % name)
+    pad, instrument = _names[name]
+    return _open(instrument, pad)
+
+
+def dev(board, pad, sad=0, tmo=T10s, eot=1, eos=0):
+    if pad not in _pads:
+        raise GpibError("dev() failed: no listener at address %s" % pad)
+    return _open(_pads[pad], pad, sad, tmo)
+
+
+def close(ud):
+    _descriptors.pop(ud, None)
+
+
+def ask(ud, option):
+    desc = _get(ud)
+    if option == IbaPAD:
+        return desc.pad
+    if option == IbaSAD:
+        return desc.sad
+    if option == IbaTMO:
+        return desc.tmo
+    return 0
+
+
+def config(ud, option, value):
+    return 0
+
+
+def timeout(ud, value):
+    _get(ud).tmo = value
+
+
+def write(ud, text):
+    _get(ud).instrument.write(text)
+    _done(len(text), CMPL | END)
+
+
+def writebin(ud, text, length):
+    write(ud, text[:length])
+
+
+def read(ud, length=512):
+    desc = _get(ud)
+    ret = desc.instrument.read(length)
+    if not ret:
+        secs = _timeout_secs.get(desc.tmo)
+        if secs:
+            time.sleep(secs)
+        _done(0, TIMO | ERR)
+        raise GpibError("read() failed: A timeout occurred")
+    _done(len(ret), CMPL | END)
+    return ret
+
+readbin = read
+
+
+def trigger(ud):
+    _get(ud).instrument.trigger()
+
+
+def clear(ud):
+    _get(ud).instrument.output = ''
+
+
+def interface_clear(ud):
+    pass
+
+
+def serial_poll(ud):
+    return _get(ud).instrument.serial_poll()
+
+
+def wait(ud, mask):
+    pass
+
+
+def ibsta():
+    return _status['ibsta']
+
+
+def ibcnt():
+    return _status['ibcnt']
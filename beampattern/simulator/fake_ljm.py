@@ -0,0 +1,91 @@
+"""
+Stand-in for the LabJack LJM library (labjack.ljm) driving the
+digital lines of the simulated range
+"""
+
+import time
+
+_range = None
+_latency = 0.001   # seconds per Modbus transaction
+_inhibit = 0       # DIO_INHIBIT: lines a DIO_STATE write leaves alone
+
+
+class LJMError(Exception):
+    pass
+
+
+def attach(sim_range):
+    global _range
+    _range = sim_range
+
+
+def openS(deviceType="ANY", connectionType="ANY", identifier="ANY"):
+    if _range is None:
+        raise LJMError("LJME_DEVICE_NOT_FOUND")
+    return 1
+
+
+def close(handle):
+    pass
+
+
+def getHandleInfo(handle):
+    # device type T7, connection type ethernet, serial number,
+    # ip address, port, max bytes per MB
+    return (7, 3, 470010000, 3232236132, 502, 1040)
+
+
+def numberToIP(number):
+    return '.'.join([str((number >> shift) & 0xff) for shift in (24, 16, 8, 0)])
+
+
+def _write_state(state, inhibit):
+    # the range only has FIO0-7 wired
+    for line in range(len(_range.digital)):
+        if not inhibit & (1 << line):
+            _range.digital[line] = (int(state) >> line) & 1
+
+
+def _write(name, value):
+    global _inhibit
+    if name.startswith('FIO') and name[3:].isdigit():
+        _range.digital[int(name[3:])] = int(value)
+    elif name == 'FIO_STATE':
+        _write_state(value, 0)
+    elif name == 'DIO_STATE':
+        _write_state(value, _inhibit)
+    elif name == 'DIO_INHIBIT':
+        _inhibit = int(value)
+    elif name == 'DIO_DIRECTION':
+        pass
+    else:
+        raise LJMError("LJME_INVALID_NAME: %s" % name)
+
+
+def _read(name):
+    if name.startswith('FIO') and name[3:].isdigit():
+        return float(_range.digital[int(name[3:])])
+    if name in ('FIO_STATE', 'DIO_STATE'):
+        return float(sum([level << line for line, level in enumerate(_range.digital)]))
+    raise LJMError("LJME_INVALID_NAME: %s" % name)
+
+
+def eWriteName(handle, name, value):
+    time.sleep(_latency)
+    _write(name, value)
+
+
+def eWriteNames(handle, numFrames, aNames, aValues):
+    time.sleep(_latency)
+    for name, value in zip(aNames[:numFrames], aValues[:numFrames]):
+        _write(name, value)
+
+
+def eReadName(handle, name):
+    time.sleep(_latency)
+    return _read(name)
+
+
+def eReadNames(handle, numFrames, aNames):
+    time.sleep(_latency)
+    return [_read(name) for name in aNames[:numFrames]]
@@ -0,0 +1,67 @@
+"""
+Stand-in for pyserial (the serial module) that connects serial
+ports to simulated instruments, such as the Fluke 287 on
+/dev/ttyUSB0.
+"""
+
+import time
+
+FIVEBITS, SIXBITS, SEVENBITS, EIGHTBITS = 5, 6, 7, 8
+PARITY_NONE, PARITY_EVEN, PARITY_ODD = 'N', 'E', 'O'
+STOPBITS_ONE, STOPBITS_TWO = 1, 2
+
+
+class SerialException(IOError):
+    pass
+
+
+_ports = {}
+
+
+def register(port, instrument):
+    """Attach a simulated instrument to a serial port name"""
+    _ports[port] = instrument
+
+
+def reset():
+    _ports.clear()
+
+
+class Serial(object):
+    def __init__(self, port=None, baudrate=9600, bytesize=EIGHTBITS,
+                 parity=PARITY_NONE, stopbits=STOPBITS_ONE, timeout=None,
+                 **kwargs):
+        if port not in _ports:
+            raise SerialException("could not open port %s" % port)
+        self.port = port
+        self.baudrate = baudrate
+        self.timeout = timeout
+        self.instrument = _ports[port]
+        self.is_open = True
+
+    @property
+    def in_waiting(self):
+        return len(self.instrument.output)
+
+    def write(self, text):
+        if not self.is_open:
+            raise SerialException("port not open")
+        self.instrument.write(text)
+        return len(text)
+
+    def read(self, size=1):
+        if not self.is_open:
+            raise SerialException("port not open")
+        ret = self.instrument.read(size)
+        if not ret and self.timeout:
+            # nothing to send, so the read times out
+            time.sleep(self.timeout)
+        return ret
+
+    def flushInput(self):
+        self.instrument.output = ''
+
+    reset_input_buffer = flushInput
+
+    def close(self):
+        self.is_open = False
@@ -0,0 +1,432 @@
+"""
+Behavioural models of the range instruments. Each model accepts
+the same command strings the real instrument does and produces
+the same replies, with latencies that roughly match the hardware.
+All models share one SimulatedRange which holds the physical
+state: stage position, synthesizer settings and the antenna beam.
+"""
+
+import struct
+import time
+import threading
+import numpy
+
+from beampattern.simulator.beam import SyntheticBeam
+
+
+class SimStage(object):
+    """
+    Two axis stage that moves at constant velocity between
+    commanded positions. Positions are in degrees.
+    """
+    def __init__(self, home_velocity=10.0):
+        self.home_velocity = home_velocity
+        self._lock = threading.Lock()
+        self._axes = {}
+        for axis in ('X', 'Y'):
+            self._axes[axis] = {'start': 0.0, 'target': 0.0,
+                                't0': 0.0, 'velocity': 1.0}
+
+    def position(self, axis):
+        with self._lock:
+            ax = self._axes[axis]
+            dist = ax['target'] - ax['start']
+            if dist == 0.0:
+                return ax['target']
+            frac = (time.time() - ax['t0'])*ax['velocity']/abs(dist)
+            if frac >= 1.0:
+                return ax['target']
+            return ax['start'] + frac*dist
+
+    def moving(self, axis=None):
+        if axis is None:
+            return self.moving('X') or self.moving('Y')
+        return self.position(axis) != self._axes[axis]['target']
+
+    def move(self, axis, delta, velocity):
+        start = self.position(axis)
+        with self._lock:
+            ax = self._axes[axis]
+            ax['start'] = start
+            ax['target'] = start + delta
+            ax['t0'] = time.time()
+            ax['velocity'] = max(abs(velocity), 1e-6)
+
+    def home(self, axis):
+        self.move(axis, -self.position(axis), self.home_velocity)
+
+    def stop(self):
+        for axis in ('X', 'Y'):
+            pos = self.position(axis)
+            with self._lock:
+                self._axes[axis]['start'] = pos
+                self._axes[axis]['target'] = pos
+
+
+class SimulatedRange(object):
+    """
+    The physical state of the antenna range. The source
+    synthesizer drives a transmitter whose beam is seen by the
+    receiver mounted on the stage.
+    """
+    def __init__(self, beam=None, seed=None, detector_gain=6.5,
+                 detector_offset=0.05, noise=0.002):
+        if beam is None:
+            beam = SyntheticBeam()
+        self.beam = beam
+        self.stage = SimStage()
+        self.rng = numpy.random.RandomState(seed)
+        self.freq = 74.0e9          # Hz
+        self.mult = 18.0
+        self.power = 0.0            # dBm
+        self.rf_on = True
+        self.detector_gain = detector_gain      # volts at boresight for 0 dBm
+        self.detector_offset = detector_offset  # volts with the source off
+        self.noise = noise
+        self.digital = [1]*8        # LabJack FIO levels
+        self.channel_spacing = 2.0  # az offset between multiplexed feeds, degrees
+
+    def field(self, freq=None, channel=None):
+        """
+        Complex field seen by the receiver at the current stage
+        position, normalized so boresight at 0 dBm is unity
+        """
+        if freq is None:
+            freq = self.freq
+        az = self.stage.position('X')
+        el = self.stage.position('Y')
+        if channel is not None:
+            az = az - (channel - 3.5)*self.channel_spacing
+        if not self.rf_on:
+            return 0.0j
+        gain = 10**(self.power/20.0)
+        return gain * complex(self.beam.pattern(az, el, freq/1e9))
+
+    def selected_channel(self):
+        """
+        The multiplexed feed pulled low on the LabJack, None if
+        no single channel is selected
+        """
+        low = [i for i, level in enumerate(self.digital) if level == 0]
+        if len(low) == 1:
+            return low[0]
+        return None
+
+    def detector_voltage(self):
+        """Square law detector output in volts"""
+        power = abs(self.field())**2
+        volts = self.detector_offset + self.detector_gain*power
+        return volts + self.noise*self.rng.randn()
+
+    def complex_noise(self, scale=1.0):
+        return scale*self.noise*(self.rng.randn() + 1j*self.rng.randn())
+
+
+class SimInstrument(object):
+    """
+    Base class for the instrument models. Commands are passed to
+    handle() one at a time and replies are queued in the output
+    buffer until read.
+    """
+    latency = 0.002   # seconds per bus transaction
+    separator = None  # command separator within one write
+
+    def __init__(self, sim_range):
+        self.range = sim_range
+        self.output = ''
+        self.status = 0
+
+    def write(self, text):
+        time.sleep(self.latency)
+        text = text.strip()
+        if self.separator is None:
+            commands = [text]
+        else:
+            commands = [c.strip() for c in text.split(self.separator)]
+        for cmd in commands:
+            if cmd:
+                self.handle(cmd)
+
+    def read(self, length=512):
+        time.sleep(self.latency)
+        ret = self.output[:length]
+        self.output = self.output[length:]
+        return ret
+
+    def reply(self, text):
+        self.output += text
+
+    def trigger(self):
+        pass
+
+    def serial_poll(self):
+        return self.status
+
+    def handle(self, cmd):
+        pass
+
+
+class SimUnidex11(SimInstrument):
+    """Unidex 11 motion controller"""
+    step_size = {'X': 0.1/60., 'Y': 0.05/60.}
+
+    def handle(self, cmd):
+        args = cmd.split()
+        if cmd in ('C', 'O'):
+            self.range.stage.stop()
+        elif len(args) >= 3 and args[0] == 'I' and args[1] == 'H':
+            self.range.stage.home(args[2])
+        elif len(args) >= 4 and args[0] == 'I':
+            axis = args[1]
+            feedrate = int(args[2][1:])
+            numsteps = int(args[3][1:])
+            step = self.step_size[axis]
+            self.range.stage.move(axis, numsteps*step, feedrate*step)
+
+    def serial_poll(self):
+        time.sleep(self.latency)
+        if self.range.stage.moving():
+            return 0x20
+        return 0
+
+
+class SimHP83620A(SimInstrument):
+    """HP 83620A synthesizer"""
+    def handle(self, cmd):
+        r = self.range
+        if cmd == '*IDN?':
+            self.reply('HEWLETT-PACKARD,83620A,0,0\n')
+        elif cmd == 'FREQ:MULT?':
+            self.reply('%g\n' % r.mult)
+        elif cmd.startswith('FREQ:MULT '):
+            r.mult = float(cmd.split()[1])
+        elif cmd == 'FREQ:CW?':
+            self.reply('%.10g\n' % r.freq)
+        elif cmd.startswith('FREQ:CW '):
+            val, unit = cmd.split()[1:3]
+            scale = {'GHZ': 1e9, 'MHZ': 1e6, 'KHZ': 1e3, 'HZ': 1.0}[unit.upper()]
+            r.freq = float(val)*scale
+        elif cmd in ('POWER:STATE?', 'OUTPUT:STATE?'):
+            self.reply('%d\n' % int(r.rf_on))
+        elif cmd.startswith('POWER:STATE ') or cmd.startswith('OUTPUT:STATE '):
+            r.rf_on = cmd.split()[1] == 'ON'
+        elif cmd == 'SOUR:POW:LEVEL?':
+            self.reply('%g\n' % r.power)
+        elif cmd.startswith('SOUR:POW:LEVEL '):
+            r.power = float(cmd.split()[1])
+
+
+class SimMultimeter(SimInstrument):
+    """
+    HP3457A / HP3478A digital multimeter reading the detector.
+    Readings are produced when read, after their integration time.
+    TRIG SGL with the reading memory on (MEM FIFO) takes the
+    readings into memory instead, one integration time apart, to
+    be recalled with RMEM in the output format (ASCII or DREAL
+    binary). The ready bit of the status byte is clear until the
+    last of them is taken, and RMEM only returns those taken.
+    """
+    separator = ';'
+
+    def __init__(self, sim_range, idstr='HP3457A'):
+        SimInstrument.__init__(self, sim_range)
+        self.idstr = idstr
+        self.nplc = 10.0
+        self.nrdgs = 1
+        self.pending = 0
+        self.memory = None
+        self.busy_until = 0.0
+        self.oformat = 'ASCII'
+
+    def integration_time(self):
+        return self.nplc/60.0
+
+    def handle(self, cmd):
+        args = cmd.replace(',', ' ').split()
+        if cmd == 'ID?':
+            self.reply('%s\r\n' % self.idstr)
+        elif args[0] == 'NPLC':
+            self.nplc = float(args[1])
+        elif args[0] == 'NRDGS':
+            self.nrdgs = int(args[1])
+        elif args[0] == 'OFORMAT':
+            self.oformat = args[1]
+        elif args[0] == 'MEM':
+            if args[1] == 'OFF':
+                self.memory = None
+            else:
+                self.memory = []
+        elif cmd == 'TRIG SGL':
+            if self.memory is not None:
+                t = max(time.time(), self.busy_until)
+                for i in range(self.nrdgs):
+                    t += self.integration_time()
+                    self.memory.append((t, self.range.detector_voltage()))
+                self.busy_until = t
+            else:
+                self.pending += self.nrdgs
+        elif args[0] == 'RMEM':
+            first, count = int(args[1]), int(args[2])
+            now = time.time()
+            readings = [r for t, r in (self.memory or [])[first-1:first-1+count] if t <= now]
+            if self.oformat == 'DREAL':
+                self.reply(struct.pack('>%dd' % len(readings), *readings))
+            else:
+                self.reply(''.join(['%+.6E\r\n' % r for r in readings]))
+
+    def trigger(self):
+        time.sleep(self.latency)
+        self.pending += self.nrdgs
+
+    def serial_poll(self):
+        time.sleep(self.latency)
+        if time.time() >= self.busy_until:
+            return self.status | 0x10
+        return self.status
+
+    def read(self, length=512):
+        if not self.output and self.pending > 0:
+            self.pending -= 1
+            time.sleep(self.integration_time())
+            self.reply('%+.6E\r\n' % self.range.detector_voltage())
+        return SimInstrument.read(self, length)
+
+
+class SimHP3478A(SimMultimeter):
+    """HP3478A takes its settings as a run of letter codes"""
+    def __init__(self, sim_range):
+        SimMultimeter.__init__(self, sim_range, idstr='HP3478A')
+        self.nplc = 1.0
+
+    def handle(self, cmd):
+        # settings like F2R1Z1N5 and trigger modes T1/T3 need no reply
+        pass
+
+    def trigger(self):
+        time.sleep(self.latency)
+        self.pending += 1
+
+
+class SimAnalyzer8510C(SimInstrument):
+    """HP 8510C vector network analyzer in list frequency mode"""
+    separator = ';'
+
+    def __init__(self, sim_range):
+        SimInstrument.__init__(self, sim_range)
+        self.freq_list = []
+        self.editing = []
+        self.avg = 1
+        self.form = 'FORM5'
+        self.measure = 'S21'
+        self.opc = False
+
+    def sweep_time(self):
+        return 0.002*max(len(self.freq_list), 1)*self.avg
+
+    def _block(self, values):
+        countfmt, dtype = {'FORM2': ('>H', '>f4'), 'FORM3': ('>H', '>f8'),
+                           'FORM5': ('<H', '<f4')}[self.form]
+        values = numpy.asarray(values, dtype=dtype)
+        return '#A' + struct.pack(countfmt, values.nbytes) + values.tostring()
+
+    def handle(self, cmd):
+        if cmd == 'OPC?':
+            # reply once the next command has completed
+            self.opc = True
+            return
+        self._handle(cmd)
+        if self.opc:
+            self.opc = False
+            self.reply('1\n')
+
+    def _handle(self, cmd):
+        args = cmd.split()
+        if cmd == 'CLEL':
+            self.editing = []
+        elif args[0] == 'CENT':
+            self.editing.append(float(args[1])*1e9)
+        elif cmd == 'EDITDONE':
+            self.freq_list = sorted(set(self.editing))
+        elif cmd.startswith('FORM'):
+            self.form = cmd
+        elif cmd == 'OUTPFREL':
+            self.reply(self._block(self.freq_list))
+        elif args[0] == 'AVERON':
+            self.avg = int(args[1])
+        elif cmd[0] == 'S' and len(cmd) == 3 and cmd[1:].isdigit():
+            self.measure = cmd
+        elif cmd == 'SING':
+            time.sleep(self.sweep_time())
+        elif cmd == 'OUTPDATA':
+            data = []
+            for freq in self.freq_list:
+                if self.measure in ('S21', 'S12'):
+                    val = 0.005*self.range.field(freq=freq)
+                else:
+                    # reflection off the feed, independent of the beam
+                    val = 0.001*numpy.exp(1j*freq*1e-9)
+                val = val + self.range.complex_noise(1e-3)
+                data.extend([val.real, val.imag])
+            self.reply(self._block(data))
+
+
+class SimVectorVoltmeter(SimInstrument):
+    """HP 8508A vector voltmeter measuring B/A transmission"""
+    latency = 0.003
+
+    def __init__(self, sim_range):
+        SimInstrument.__init__(self, sim_range)
+        self.average = 1
+        self.samples = 1
+        self.armed = False
+        self.block = []
+        self.reading_time = 0.010
+
+    def _fp64(self, value):
+        return '#18' + struct.pack('>d', value)
+
+    def _reading(self):
+        val = self.range.field(channel=self.range.selected_channel())
+        return val + self.range.complex_noise(1.0/numpy.sqrt(self.average))
+
+    def handle(self, cmd):
+        args = cmd.split()
+        if cmd == '*IDN?':
+            self.reply('HEWLETT-PACKARD,8508A,0,0\n')
+        elif args[0] == 'AVER:COUN':
+            self.average = int(args[1])
+        elif args[0] == 'SAMP:COUN':
+            self.samples = int(args[1])
+        elif cmd == 'INIT':
+            self.armed = True
+        elif cmd == '*TRG' and self.armed:
+            # the triggered readings are buffered until fetched
+            self.armed = False
+            time.sleep(self.reading_time*self.average*self.samples)
+            self.block = [self._reading() for n in range(self.samples)]
+        elif cmd == 'FETC? TRAN':
+            self.reply(''.join(['%s%s' % (self._fp64(abs(val)),
+                                          self._fp64(numpy.degrees(numpy.angle(val))))
+                                for val in self.block]) + '\n')
+        elif cmd == 'MEAS? TRAN':
+            time.sleep(self.reading_time*self.average)
+            val = self._reading()
+            # ratio and phase come back as two adjacent definite blocks
+            self.reply('%s%s\n' % (self._fp64(abs(val)),
+                                   self._fp64(numpy.degrees(numpy.angle(val)))))
+
+
+class SimFluke287(SimInstrument):
+    """Fluke 287 handheld meter on its USB serial port"""
+    latency = 0.005
+
+    def __init__(self, sim_range):
+        SimInstrument.__init__(self, sim_range)
+        self.reading_time = 0.25
+
+    def handle(self, cmd):
+        if cmd == 'QM':
+            time.sleep(self.reading_time)
+            self.reply('0\r%.4f,VAC,NORMAL,NONE\r' % self.range.detector_voltage())
+        else:
+            self.reply('0\r')
@@ -0,0 +1,117 @@
+"""
+A TCP server that speaks the Prologix GPIB-ETHERNET protocol
+and forwards bus traffic to the simulated instruments, so the
+prologix_gpib drivers talk to it over a real socket.
+"""
+
+import SocketServer
+import socket
+import threading
+
+from beampattern.logging import logger
+
+logger.name = __name__
+
+
+class PrologixHandler(SocketServer.StreamRequestHandler):
+    """
+    Handles one controller connection. Lines starting with ++
+    are controller commands, everything else is sent to the
+    instrument at the currently selected address.
+    """
+    def setup(self):
+        SocketServer.StreamRequestHandler.setup(self)
+        self.address = None
+        self.auto = 0
+        self.thread = threading.current_thread()
+        self.server.connections.add(self)
+
+    def finish(self):
+        self.server.connections.discard(self)
+        SocketServer.StreamRequestHandler.finish(self)
+
+    def handle(self):
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                break
+            line = line.rstrip('\r\n')
+            if line.startswith('++'):
+                self.controller_command(line[2:].strip())
+            elif line:
+                instrument = self.server.instruments.get(self.address)
+                if instrument is not None:
+                    instrument.write(line)
+                    if self.auto:
+                        self.send_output(instrument)
+
+    def controller_command(self, cmd):
+        args = cmd.split()
+        if not args:
+            return
+        instruments = self.server.instruments
+        if args[0] == 'addr' and len(args) > 1:
+            self.address = int(args[1])
+        elif args[0] == 'auto' and len(args) > 1:
+            self.auto = int(args[1])
+        elif args[0] == 'read':
+            instrument = instruments.get(self.address)
+            if instrument is not None:
+                self.send_output(instrument)
+        elif args[0] == 'spoll':
+            if len(args) > 1:
+                addr = int(args[1])
+            else:
+                addr = self.address
+            instrument = instruments.get(addr)
+            status = 0
+            if instrument is not None:
+                status = instrument.serial_poll()
+            self.wfile.write('%d\n' % status)
+        elif args[0] == 'ver':
+            self.wfile.write('Prologix GPIB-ETHERNET Controller version 01.06.06.00 (simulated)\n')
+        elif args[0] == 'clr':
+            instrument = instruments.get(self.address)
+            if instrument is not None:
+                instrument.output = ''
+
+    def send_output(self, instrument):
+        data = instrument.read(len(instrument.output))
+        if data:
+            self.wfile.write(data)
+            self.wfile.flush()
+
+
+class PrologixServer(SocketServer.ThreadingTCPServer):
+    """
+    Threaded Prologix server. instruments maps GPIB primary
+    address to a simulated instrument.
+    """
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, instruments, host='127.0.0.1', port=0):
+        SocketServer.ThreadingTCPServer.__init__(self, (host, port),
+                                                 PrologixHandler)
+        self.instruments = instruments
+        self.connections = set()
+
+    def start(self):
+        """Serve in a background thread, returns (host, port)"""
+        thread = threading.Thread(target=self.serve_forever)
+        thread.daemon = True
+        thread.start()
+        host, port = self.server_address
+        logger.info("Simulated Prologix controller listening on %s:%d" % (host, port))
+        return host, port
+
+    def stop(self):
+        """Stop serving and close the open connections"""
+        self.shutdown()
+        for handler in list(self.connections):
+            try:
+                handler.request.shutdown(socket.SHUT_RDWR)
+            except socket.error:
+                pass
+            handler.thread.join(1.0)
+        self.server_close()
@@ -0,0 +1,82 @@
+"""
+Running instrument calls in the background. A Worker is a thread
+that runs the calls submitted to it one at a time, in order, and
+hands back a Future for each. One worker per instrument lets the
+slow waits of different instruments (a stage move, a detector
+integration) overlap while the calls to any one instrument stay
+in sequence.
+"""
+
+import sys
+import threading
+import Queue
+
+from beampattern.utils.beampattern_exceptions import BeamPatternGeneralError
+from beampattern.logging import logger
+
+logger.name = __name__
+
+
+class Future(object):
+    """
+    The pending result of a call run by a Worker
+    """
+    def __init__(self):
+        self._done = threading.Event()
+        self._result = None
+        self._exc_info = None
+
+    def set_result(self, result):
+        self._result = result
+        self._done.set()
+
+    def set_exception(self, exc_info):
+        self._exc_info = exc_info
+        self._done.set()
+
+    def done(self):
+        return self._done.is_set()
+
+    def result(self, timeout=None):
+        """
+        Waits for the call to finish and returns its result,
+        re-raising anything the call raised
+        """
+        if not self._done.wait(timeout):
+            raise BeamPatternGeneralError("Future", "Call did not finish in %s seconds" % timeout)
+        if self._exc_info is not None:
+            raise self._exc_info[0], self._exc_info[1], self._exc_info[2]
+        return self._result
+
+
+class Worker(threading.Thread):
+    """
+    A daemon thread running submitted calls in order
+    """
+    def __init__(self, name=None):
+        threading.Thread.__init__(self, name=name)
+        self.daemon = True
+        self.calls = Queue.Queue()
+        self.start()
+
+    def submit(self, fn, *args, **kwargs):
+        """Queue fn(*args, **kwargs), returns its Future"""
+        future = Future()
+        self.calls.put((future, fn, args, kwargs))
+        return future
+
+    def run(self):
+        while True:
+            call = self.calls.get()
+            if call is None:
+                break
+            future, fn, args, kwargs = call
+            try:
+                future.set_result(fn(*args, **kwargs))
+            except Exception:
+                future.set_exception(sys.exc_info())
+
+    def stop(self, timeout=None):
+        """Finish the queued calls and end the thread"""
+        self.calls.put(None)
+        self.join(timeout)
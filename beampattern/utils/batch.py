@@ -0,0 +1,132 @@
+"""
+Batch post-processing of map files. Each map is read, its beam
+integrals computed and its plots saved without any interaction,
+and the files are shared out over a pool of worker processes. The
+integrals of every file are collected into one summary table.
+
+Plots are drawn by the BeamPlot code in headless mode, on Agg
+canvases that each worker process reuses from file to file.
+"""
+
+import os
+import fnmatch
+import multiprocessing
+import traceback
+import pandas as pd
+
+from beampattern.utils.plots import BeamPlot
+from beampattern.utils.integrals import BeamMaps
+from beampattern.logging import logger
+
+logger.name = __name__
+
+# headless figures of this process, reused for every file
+_figures = {}
+
+
+def find_maps(directory, pattern='beamscan_*.txt'):
+    """
+    Returns the sorted paths of the map files in directory and
+    its subdirectories whose names match pattern
+    """
+    filenames = []
+    for root, dirs, files in os.walk(directory):
+        filenames.extend([os.path.join(root, name) for name in fnmatch.filter(files, pattern)])
+    return sorted(filenames)
+
+
+def plot_directory(filename, outdir=None, topdir=None):
+    """
+    Directory the plots of map filename are saved in: the
+    directory of the file, or with outdir the same path relative
+    to topdir (the directory the maps were found in) under outdir,
+    so maps of the same name in different subdirectories do not
+    overwrite each other's plots
+    """
+    directory = os.path.dirname(filename)
+    if outdir is None:
+        return directory
+    if topdir is None:
+        return outdir
+    return os.path.normpath(os.path.join(outdir, os.path.relpath(directory, topdir)))
+
+
+def process_map(filename, outdir=None, topdir=None, formats=('png',),
+                scales=('linear', 'log'), azel='az', radius=2.7, nooffset=False,
+                solid_angle=True):
+    """
+    The work done on each file of a batch. Returns the BeamMaps
+    summary of filename, and saves a plot for each of scales
+    ('linear', 'log') in each of formats as
+    <name>_<scale>.<format> in the plot_directory of the file
+    """
+    summary = BeamMaps([filename], azel=azel, nooffset=nooffset).summary(radius=radius,
+                                                                          solid_angle=solid_angle)
+    if formats and scales:
+        directory = plot_directory(filename, outdir, topdir)
+        if directory and not os.path.isdir(directory):
+            try:
+                os.makedirs(directory)
+            except OSError:
+                # made by another worker in the meantime
+                if not os.path.isdir(directory):
+                    raise
+        base = os.path.join(directory, os.path.splitext(os.path.basename(filename))[0])
+        bplot = BeamPlot(filename, headless=True, figures=_figures)
+        for scale in scales:
+            if scale == 'linear':
+                bplot.plot_linear(azel=azel, nooffset=nooffset)
+            else:
+                bplot.plot_log(azel=azel, nooffset=nooffset)
+            for fmt in formats:
+                bplot.fig.savefig('%s_%s.%s' % (base, scale, fmt))
+    return summary
+
+
+def _process_one(args):
+    """
+    Pool entry point. Returns (filename, summary, error) so that
+    one bad file does not end the batch
+    """
+    filename, kwargs = args
+    try:
+        return filename, process_map(filename, **kwargs), None
+    except Exception:
+        return filename, None, traceback.format_exc()
+
+
+def process_maps(filenames, processes=None, **kwargs):
+    """
+    Runs process_map (with kwargs) on each of filenames over a
+    pool of processes worker processes, one per CPU by default,
+    or in this process if processes is 1. Returns the summary
+    table of all the files, sorted by file and frequency, and a
+    dictionary of the error of each file that failed
+    """
+    tasks = [(filename, kwargs) for filename in filenames]
+    if processes == 1:
+        results = map(_process_one, tasks)
+        pool = None
+    else:
+        pool = multiprocessing.Pool(processes)
+        results = pool.imap_unordered(_process_one, tasks)
+    summaries = []
+    failed = {}
+    try:
+        for n, (filename, summary, error) in enumerate(results):
+            if error is None:
+                summaries.append(summary)
+                logger.info("Processed %s (%d of %d)" % (filename, n+1, len(tasks)))
+            else:
+                failed[filename] = error
+                logger.error("Could not process %s: %s" % (filename, error.strip().splitlines()[-1]))
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    if summaries:
+        table = pd.concat(summaries, ignore_index=True)
+        table = table.sort_values(['filename', 'frequency']).reset_index(drop=True)
+    else:
+        table = pd.DataFrame(columns=['filename', 'frequency'])
+    return table, failed
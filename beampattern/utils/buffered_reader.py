@@ -0,0 +1,133 @@
+"""
+Buffered, terminator aware reading for the instrument transports
+(linux-gpib, the Prologix socket and USB serial). The transport
+is read in large chunks, responses are split off at their
+terminator and anything left over is kept for the next call, so
+a response that arrives in pieces (a partial socket recv) or
+together with the next one is handled correctly, and a reading
+costs one transport call rather than one per byte.
+
+Responses may contain IEEE 488.2 definite length blocks
+(#<n><length><data>), whose binary data can hold terminator
+bytes; read_message() skips over them when looking for the
+terminator.
+"""
+
+from beampattern.utils.beampattern_exceptions import BeamPatternGeneralError
+from beampattern.logging import logger
+
+logger.name = __name__
+
+
+def block_length(data, start=0):
+    """
+    Total length of the definite length block header and data at
+    data[start:], or None if more bytes are needed to tell
+    """
+    if len(data) < start + 2:
+        return None
+    if data[start] != '#' or not data[start+1].isdigit() or data[start+1] == '0':
+        raise BeamPatternGeneralError("block_length", "No definite length block at byte %d" % start)
+    ndigits = int(data[start+1])
+    if len(data) < start + 2 + ndigits:
+        return None
+    return 2 + ndigits + int(data[start+2:start+2+ndigits])
+
+
+def definite_blocks(data):
+    """
+    Returns the payloads of the definite length blocks in a
+    response, skipping any separators between them
+    """
+    blocks = []
+    pos = data.find('#')
+    while pos >= 0:
+        length = block_length(data, pos)
+        if length is None or pos + length > len(data):
+            raise BeamPatternGeneralError("definite_blocks", "Truncated block at byte %d" % pos)
+        ndigits = int(data[pos+1])
+        blocks.append(data[pos+2+ndigits:pos+length])
+        pos = data.find('#', pos + length)
+    return blocks
+
+
+class BufferedReader(object):
+    """
+    Buffers the bytes of a transport. recv(size) should return up
+    to size bytes, waiting for at least one, and return '' (or
+    raise) when nothing arrives before the transport times out.
+    """
+    def __init__(self, recv, chunk=4096):
+        self.recv = recv
+        self.chunk = chunk
+        self.buffer = ''
+
+    def clear(self):
+        """Discards anything buffered, returning it"""
+        data, self.buffer = self.buffer, ''
+        return data
+
+    def _fill(self):
+        data = self.recv(self.chunk)
+        if not data:
+            raise BeamPatternGeneralError("BufferedReader", "Read timed out with %d bytes buffered" % \
+                                          len(self.buffer))
+        self.buffer += data
+
+    def read(self, size=None):
+        """
+        Returns up to size buffered bytes, reading the transport
+        once if nothing is buffered
+        """
+        if not self.buffer:
+            self._fill()
+        if size is None:
+            size = len(self.buffer)
+        data, self.buffer = self.buffer[:size], self.buffer[size:]
+        return data
+
+    def read_exactly(self, size):
+        while len(self.buffer) < size:
+            self._fill()
+        data, self.buffer = self.buffer[:size], self.buffer[size:]
+        return data
+
+    def read_until(self, term='\n'):
+        """Returns the bytes up to and including the next term"""
+        start = 0
+        while True:
+            idx = self.buffer.find(term, start)
+            if idx >= 0:
+                end = idx + len(term)
+                data, self.buffer = self.buffer[:end], self.buffer[end:]
+                return data
+            start = max(len(self.buffer) - len(term) + 1, 0)
+            self._fill()
+
+    def read_message(self, term='\n'):
+        """
+        Like read_until, but a term inside a definite length block
+        does not end the message
+        """
+        pos = 0
+        while True:
+            end = self.buffer.find(term, pos)
+            block = self.buffer.find('#', pos)
+            if block >= 0 and (end < 0 or block < end):
+                if block + 1 >= len(self.buffer):
+                    self._fill()
+                elif self.buffer[block+1] in '123456789':
+                    length = block_length(self.buffer, block)
+                    if length is None or block + length > len(self.buffer):
+                        self._fill()
+                    else:
+                        pos = block + length
+                else:
+                    pos = block + 1
+            elif end >= 0:
+                end += len(term)
+                data, self.buffer = self.buffer[:end], self.buffer[end:]
+                return data
+            else:
+                pos = max(len(self.buffer) - len(term) + 1, pos)
+                self._fill()
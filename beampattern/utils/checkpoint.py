@@ -0,0 +1,186 @@
+"""
+Checkpoint journal for map runs. While a map is taken every
+reading, every stage move and the instrument state that a map
+depends on (voltage offset, boresight power levels) is appended
+to a journal file next to the data file, one JSON record per
+line. The journal is fsync'ed periodically, so after a crash
+(a GPIB timeout say) the map can be resumed: readings already
+in the journal are not taken again, and if the last stage move
+had completed the stage position is still known and the stage
+need not be homed again.
+"""
+
+import os
+import json
+import time
+import threading
+
+from beampattern.utils.beampattern_exceptions import BeamPatternGeneralError
+from beampattern.logging import logger
+
+logger.name = __name__
+
+
+def journal_filename(filename):
+    """Name of the journal that goes with a map data file"""
+    return os.path.splitext(filename)[0] + '.journal'
+
+
+def _read_records(filename):
+    """Records in a journal file, dropping a partly written last line"""
+    records = []
+    fp = open(filename, 'r')
+    for line in fp.readlines():
+        try:
+            records.append(json.loads(line))
+        except ValueError:
+            logger.warning("Skipping corrupt journal line in %s" % filename)
+    fp.close()
+    return records
+
+
+def resume_info(filename):
+    """
+    Returns the start record of a journal: the data filename,
+    datetime_str, cfgfile, map method and its keyword arguments
+    """
+    if not os.path.exists(filename):
+        raise BeamPatternGeneralError("resume_info", "Journal %s not found" % filename)
+    for rec in _read_records(filename):
+        if rec['t'] == 'start':
+            return rec
+    raise BeamPatternGeneralError("resume_info", "Journal %s has no start record" % filename)
+
+
+class MapJournal(object):
+    """
+    Append-only journal of a map run. With a filename of None
+    nothing is recorded and there is nothing to resume from.
+    Records are flushed as they are written and fsync'ed at most
+    every fsync_interval seconds (and always for start and state
+    records).
+    """
+    def __init__(self, filename, fsync_interval=10.0):
+        self.filename = filename
+        self.fsync_interval = fsync_interval
+        self.fp = None
+        self.start = None
+        self.state = {}
+        self.points = {}
+        self.stage = None
+        self.completed = False
+        self._last_sync = 0.0
+        # stage records can come from a worker thread
+        self.lock = threading.Lock()
+
+    def load(self):
+        """Reads back the journal of an interrupted run"""
+        if self.filename is None or not os.path.exists(self.filename):
+            raise BeamPatternGeneralError("MapJournal", "No journal %s to resume from" % self.filename)
+        for rec in _read_records(self.filename):
+            kind = rec['t']
+            if kind == 'start':
+                self.start = rec
+            elif kind == 'state':
+                self.state.update(rec['state'])
+            elif kind == 'point':
+                self.points[(rec['s'], rec['j'], rec['i'])] = tuple(rec['v'])
+            elif kind == 'stage':
+                if rec['settled']:
+                    self.stage = (rec['az'], rec['el'])
+                else:
+                    # a move was in flight; position unknown
+                    self.stage = None
+            elif kind == 'done':
+                self.completed = True
+        if self.start is None:
+            raise BeamPatternGeneralError("MapJournal", "Journal %s has no start record" % self.filename)
+        if self.completed:
+            raise BeamPatternGeneralError("MapJournal", "Map in %s already completed" % self.filename)
+        logger.info("Resuming from %s: %d readings journaled, stage %s" % \
+                    (self.filename, len(self.points),
+                     'at az %.3f el %.3f' % self.stage if self.stage else 'position unknown'))
+
+    def record(self, kind, sync=False, **fields):
+        if self.filename is None or (self.start is None and kind != 'start'):
+            # only maps that can be resumed are journaled
+            return
+        fields['t'] = kind
+        with self.lock:
+            if self.fp is None:
+                self.fp = open(self.filename, 'a')
+            self.fp.write(json.dumps(fields) + '\n')
+            self.fp.flush()
+            now = time.time()
+            if sync or (now - self._last_sync) >= self.fsync_interval:
+                os.fsync(self.fp.fileno())
+                self._last_sync = now
+
+    def begin(self, filename, datetime_str, cfgfile, method, **kwargs):
+        """
+        Records the start of a map. When resuming, checks that the
+        map being run is the one in the journal instead. Returns
+        True when resuming
+        """
+        if self.start is not None:
+            if self.start['method'] != method or self.start['kwargs'] != kwargs:
+                raise BeamPatternGeneralError("MapJournal",
+                                              "Journal is for %s(%s), not %s(%s)" % \
+                                              (self.start['method'], self.start['kwargs'],
+                                               method, kwargs))
+            return True
+        self.start = {'filename': filename, 'datetime_str': datetime_str,
+                      'cfgfile': cfgfile, 'method': method, 'kwargs': kwargs}
+        self.record('start', sync=True, **self.start)
+        return False
+
+    def save_state(self, **state):
+        """Records instrument state, e.g. offset=.., rfpower=.."""
+        self.state.update(state)
+        self.record('state', sync=True, state=state)
+
+    def restore_state(self, obj, keys):
+        """
+        Sets the journaled values of keys as attributes of obj.
+        Returns False (setting nothing) unless all keys are journaled
+        """
+        if not all([key in self.state for key in keys]):
+            return False
+        for key in keys:
+            setattr(obj, key, self.state[key])
+        logger.info("Restored %s from journal" % ', '.join(keys))
+        return True
+
+    def point(self, section, j, i, values):
+        """Records the reading at position j, frequency i of a map section"""
+        values = tuple([float(v) for v in values])
+        self.points[(section, j, i)] = values
+        self.record('point', s=section, j=j, i=i, v=values)
+
+    def get(self, section, j, i):
+        """The journaled reading at position j, frequency i, or None"""
+        return self.points.get((section, j, i))
+
+    def row_done(self, section, j, nfreq):
+        for i in range(nfreq):
+            if (section, j, i) not in self.points:
+                return False
+        return True
+
+    def motion(self, pos_az, pos_el, settled):
+        """Stage motion hook: called by the Unidex11 drivers"""
+        if settled:
+            self.stage = (pos_az, pos_el)
+        else:
+            self.stage = None
+        self.record('stage', az=float(pos_az), el=float(pos_el), settled=settled)
+
+    def finish(self):
+        self.completed = True
+        self.record('done', sync=True)
+        self.close()
+
+    def close(self):
+        if self.fp is not None:
+            self.fp.close()
+            self.fp = None
@@ -39,12 +39,26 @@ fileloglevel  = integer(5, 50, default=10)
 consoleloglevel  = integer(5, 50, default=10)
 # comment is a long string which gets written to the output data file
 comment = string(max=150, default="BeamMap at 74 GHz")
+# output_format: 'ascii' writes the usual text data file, 'npz'
+# writes a binary numpy container (same name with a .npz extension)
+# holding the data at full precision along with the header and
+# configuration, and 'both' writes the two
+output_format = option('ascii', 'npz', 'both', default='ascii')
+# checkpoint: keep a journal of the map next to the data file, so
+# that an interrupted map can be continued with --resume
+checkpoint = boolean(default=True)
+# fsync_interval: seconds between forced writes of the journal to disk
+fsync_interval = float(0.0, 600.0, default=10.0)
 
 #general plot specific items
 [plot]
 #figsize is figure size in pixels (x,y)
 figsize = int_list(min=2, max=2, default=list(800, 600))
-#more plot configs to follow later
+# live: show the map as it is taken. The plot runs in its own
+# process so the stage and instruments never wait on it
+live = boolean(default=True)
+# refresh: minimum seconds between redraws of the live plot
+refresh = float(0.05, 10.0, default=0.5)
 
 [devices]
 # use the unidex11?
@@ -69,6 +83,19 @@ xinc = float(-180.0, 180.0, default=1.0)
 xmap_vel = float(0.1, 30.0, default=2.0)
 # xslew_vel: slew velocity in degrees/second
 xslew_vel = float(0.1, 30.0, default=5.0)
+# Adaptive maps (make_adaptive_map) start from the xinc grid and
+# split intervals where the beam changes fastest, down to xinc_min
+xinc_min = float(0.001, 180.0, default=0.1)
+# refine_threshold: change in level plus curvature (dB) across an
+# interval above which it is split
+refine_threshold = float(0.0, 100.0, default=3.0)
+# dynamic_range: dB below the peak treated as the sidelobe floor,
+# which is not refined any further
+dynamic_range = float(3.0, 120.0, default=40.0)
+# max_points: most positions an adaptive map may take (0: no limit)
+max_points = integer(0, 100000, default=0)
+# max_time: most seconds an adaptive map may run for (0: no limit)
+max_time = float(0.0, 1000000.0, default=0.0)
 
 [elevation]
 #This object contains configuration items specific to maps
@@ -80,6 +107,20 @@ ymax = float(-180.0, 180.0, default=90)
 # yinc: map step in degrees
 yinc = float(-180.0, 180.0, default=1.0)
 
+[unidex]
+# This object contains configuration items specific to
+# motion completion on the unidex11
+# poll_interval: seconds between serial polls of the motion bit
+poll_interval = float(0.01, 5.0, default=0.1)
+# motion_margin: seconds allowed beyond the expected move time
+# before a move is declared as failed
+motion_margin = float(0.0, 120.0, default=5.0)
+# home_timeout: seconds allowed for a home command to complete
+home_timeout = float(1.0, 300.0, default=30.0)
+# move_overhead: typical seconds a step costs beyond distance/velocity
+# (acceleration and polling). Used to pick the map loop order
+move_overhead = float(0.0, 10.0, default=0.3)
+
 [synth]
 # This object contains configuration items specfic to
 # frequency and frequency sweeps
@@ -87,6 +128,11 @@ yinc = float(-180.0, 180.0, default=1.0)
 freq = float_list(min=1, max=300, default=list(70.0, 71.0, 72.0, 73.0, 74.0, 75.0))
 # Frequency multiplier to use in the synthesizer
 mult = float(1.0, 20.0, default=18.0)
+# loop_order: 'position' moves the stage once and sweeps all the
+# frequencies at each point, 'frequency' tunes each frequency once
+# and sweeps the stage across the map for it, 'auto' picks the
+# ordering estimated to be faster
+loop_order = option('position', 'frequency', 'auto', default='position')
 
 [multi]
 # This object contains configuration items specific
@@ -101,6 +147,13 @@ range = float(-1.0, 300, default=10.0)
 # of range. for eg. if range is 30 V and you set resolution
 # to 0.001, you will get a resolution of 0.001*30/100. = 0.0003
 resolution = float(0.000001, 99.0, default=0.001)
+# burst: take the readings of each point in one go. On the HP3457A
+# they are stored in the reading memory and recalled in a single
+# binary transfer. The HP3478A has no reading memory, so it gives
+# no bulk transfer: it is only left in single trigger mode between
+# points, with one trigger and one read per reading. Off by default
+# until the 3457A sequence has been checked on the meter
+burst = boolean(default=False)
 
 [fluke]
 # This object contains configuration items specific
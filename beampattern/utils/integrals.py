@@ -1,69 +1,206 @@
 #!/usr/bin/python
 
 from beampattern.utils.configuration import Configuration
-from beampattern.utils.phase_configuration import ConfigurationPhase
-from beampattern.utils.beampattern_exceptions import BeamPatternGeneralError, BeamPatternArgumentError
-import matplotlib.pyplot as plt
-import re
-import os
+from beampattern.utils.mapfile import read_map
+from beampattern.map.scan_planning import cell_widths
 import numpy
 import pandas as pd
 
+
+def cut_angles(data, azel='az'):
+    """
+    Angle of each row of a cut map in degrees: the azimuth or
+    elevation of an az or el cut, or the distance from boresight
+    of a diagonal cut, negative on the negative azimuth side
+    """
+    if azel in ('az', 'el'):
+        return data[:, 0].copy()
+    angles = numpy.sqrt(data[:, 0]**2 + data[:, 1]**2)
+    angles[data[:, 0] < 0] *= -1
+    return angles
+
+
+def cut_values(data, nfreq, offset=0.0, azel='az', nooffset=False):
+    """
+    Detector values of a cut map as an (nrows, nfreq) array, with
+    the voltage offset removed in quadrature unless nooffset
+    """
+    first = 1 if azel in ('az', 'el') else 2
+    values = data[:, first:first + 2*nfreq:2]
+    if nooffset:
+        return values
+    with numpy.errstate(invalid='ignore'):
+        return numpy.sqrt(values**2 - offset**2)
+
+
+def load_cut(filename, azel='az', nooffset=False):
+    """
+    Reads a cut map. Returns (frequencies, angles, values) with
+    the rows sorted by angle, values as from cut_values
+    """
+    beammap = read_map(filename, Configuration)
+    data = numpy.atleast_2d(beammap.data)
+    angles = cut_angles(data, azel)
+    values = cut_values(data, len(beammap.frequencies), beammap.header.offset, azel, nooffset)
+    order = numpy.argsort(angles, kind='mergesort')
+    return numpy.asarray(beammap.frequencies, dtype=float), angles[order], values[order]
+
+
+class BeamMaps(object):
+    """
+    Batch analysis of many cut maps. Each file is read once and
+    the cuts are held as NaN padded arrays
+
+        frequencies  (nfiles, nfreq)
+        angles       (nfiles, npts) degrees from boresight
+        widths       (nfiles, npts) cell width of each point, degrees
+        values       (nfiles, npts, nfreq) offset corrected detector
+                     values, taken as power (square law detector)
+
+    so every metric below is computed for all the files and
+    frequencies at once. Files may have different grids and
+    frequency lists.
+
+    Integrals are either plain sums weighted by the cell widths
+    (solid_angle=False, the sums of BeamIntegral.integrate on an
+    evenly spaced map, in units of the step), or solid angle
+    integrals, weighting each point by |sin(theta)| dtheta as for
+    a beam symmetric about boresight.
+    """
+    def __init__(self, filenames, azel='az', nooffset=False):
+        self.filenames = list(filenames)
+        self.azel = azel
+        cuts = [load_cut(filename, azel=azel, nooffset=nooffset) for filename in self.filenames]
+        nfiles = len(cuts)
+        nfreq = max([len(cut[0]) for cut in cuts] or [0])
+        npts = max([len(cut[1]) for cut in cuts] or [0])
+        self.frequencies = numpy.empty((nfiles, nfreq))
+        self.frequencies.fill(numpy.nan)
+        self.angles = numpy.empty((nfiles, npts))
+        self.angles.fill(numpy.nan)
+        self.widths = numpy.zeros((nfiles, npts))
+        self.values = numpy.empty((nfiles, npts, nfreq))
+        self.values.fill(numpy.nan)
+        for k, (frequencies, angles, values) in enumerate(cuts):
+            self.frequencies[k, :len(frequencies)] = frequencies
+            self.angles[k, :len(angles)] = angles
+            self.widths[k, :len(angles)] = cell_widths(angles)
+            self.values[k, :len(angles), :len(frequencies)] = values
+
+    def _weights(self, solid_angle=True):
+        """Integration weight of each point, (nfiles, npts)"""
+        if not solid_angle:
+            return self.widths
+        with numpy.errstate(invalid='ignore'):
+            weights = numpy.pi*numpy.radians(self.widths)*numpy.abs(numpy.sin(numpy.radians(self.angles)))
+        return numpy.nan_to_num(weights)
+
+    def _inside(self, radii):
+        """Whether each point is within each radius, (nfiles, npts, nradii)"""
+        radii = numpy.atleast_1d(numpy.asarray(radii, dtype=float))
+        with numpy.errstate(invalid='ignore'):
+            return numpy.abs(self.angles)[:, :, numpy.newaxis] <= radii
+
+    def peak(self):
+        """Peak value of each file and frequency, (nfiles, nfreq)"""
+        peak = numpy.nan_to_num(self.values).max(axis=1) if self.values.shape[1] else \
+            numpy.zeros(self.frequencies.shape)
+        peak[peak <= 0] = numpy.nan
+        return peak
+
+    def total(self, solid_angle=True):
+        """Integral over the whole cut, (nfiles, nfreq)"""
+        weighted = self.values*self._weights(solid_angle)[:, :, numpy.newaxis]
+        return numpy.nansum(weighted, axis=1)
+
+    def encircled(self, radii, solid_angle=True):
+        """
+        Integral within each of radii degrees of boresight,
+        (nfiles, nfreq, nradii)
+        """
+        weighted = numpy.nan_to_num(self.values*self._weights(solid_angle)[:, :, numpy.newaxis])
+        return numpy.einsum('fpn,fpr->fnr', weighted, self._inside(radii).astype(float))
+
+    def beam_solid_angle(self):
+        """
+        Solid angle of the beam in steradians, the integral of the
+        peak normalized power over the sphere, (nfiles, nfreq)
+        """
+        return self.total(solid_angle=True)/self.peak()
+
+    def _frame(self, columns):
+        """
+        Tidy frame of (nfiles, nfreq) arrays, one row per file and
+        frequency present
+        """
+        ifile, ifreq = numpy.nonzero(~numpy.isnan(self.frequencies))
+        frame = pd.DataFrame({'filename': numpy.array(self.filenames, dtype=object)[ifile],
+                              'frequency': self.frequencies[ifile, ifreq]},
+                             columns=['filename', 'frequency'])
+        for name, array in columns:
+            frame[name] = array[ifile, ifreq]
+        return frame
+
+    def summary(self, radius=2.7, solid_angle=True):
+        """
+        Returns a frame with a row per file and frequency: the peak,
+        the integral within radius degrees (inner) and over the cut
+        (all), the beam solid angle, and the beam efficiency (the
+        fraction of the power within radius) and spillover
+        """
+        inner = self.encircled(radius, solid_angle)[:, :, 0]
+        total = self.total(solid_angle)
+        with numpy.errstate(invalid='ignore', divide='ignore'):
+            efficiency = inner/total
+            solid = self.beam_solid_angle()
+        return self._frame([('peak', self.peak()),
+                            ('inner', inner),
+                            ('all', total),
+                            ('solid_angle', solid),
+                            ('efficiency', efficiency),
+                            ('spillover', 1.0 - efficiency)])
+
+    def encircled_power(self, radii, solid_angle=True, normalize=True):
+        """
+        Returns the encircled power curves as a frame with a row per
+        file, frequency and radius. With normalize the curves are
+        fractions of the integral over the whole cut
+        """
+        radii = numpy.atleast_1d(numpy.asarray(radii, dtype=float))
+        curves = self.encircled(radii, solid_angle)
+        if normalize:
+            with numpy.errstate(invalid='ignore', divide='ignore'):
+                curves = curves/self.total(solid_angle)[:, :, numpy.newaxis]
+        ifile, ifreq = numpy.nonzero(~numpy.isnan(self.frequencies))
+        nradii = len(radii)
+        return pd.DataFrame({'filename': numpy.repeat(numpy.array(self.filenames, dtype=object)[ifile], nradii),
+                             'frequency': numpy.repeat(self.frequencies[ifile, ifreq], nradii),
+                             'radius': numpy.tile(radii, len(ifile)),
+                             'encircled': curves[ifile, ifreq].ravel()},
+                            columns=['filename', 'frequency', 'radius', 'encircled'])
+
+
 class BeamIntegral(object):
     def __init__(self, filename, markers=True,
-                 grid=True, plotfile=None):
+                 grid=True, plotfile=None, beammap=None):
         self.filename = filename
-        self._get_cfg_file()
-        self.cfg = self._get_configuration()
-        self.data = self._get_data()
-        self.header = self._get_header()
+        if beammap is None:
+            beammap = read_map(filename, Configuration)
+        self.map = beammap
+        self.cfgfile = self.map.header.cfgfile
+        self.datetime_str = self.map.header.datetime_str
+        self.cfg = self.map.cfg
+        self.header = self.map.header.text
+        self.offset = self.map.header.offset
         self.markers = markers
         self.grid = grid
         self.plotfile = plotfile
-        
-    def _get_cfg_file(self):
-        fp = open(self.filename, 'r')
-        first = fp.readline()
-        match = re.match('# Beammap Timestamp: (?P<datetime_str>\w+)', first)
-        if match:
-            self.datetime_str = match.groupdict()['datetime_str']
-        second = fp.readline().strip()
-        match = re.match('# Configfile: (?P<cfgfile>\w+\.\w+)', second)
-        if match:
-            self.cfgfile = match.groupdict()['cfgfile']
-        else:
-            raise BeamPatternGeneralError('get_cfg_file', "Could not parse config file from input file")
-        three = fp.readline().strip()
-        #match = re.match('# Comment: (?P<comment>[\w\s]*)', three)
-        #if match:
-        #    self.comment = match.groupdict()['comment']
-
-    def _get_configuration(self):
-        if self.cfgfile and os.path.exists(self.cfgfile):
-            config = Configuration(self.cfgfile)
-            return config.cfg
-        else:
-            raise BeamPatternGeneralError('get_configuration', "Could not parse configuration from config file")
-
-    def _get_data(self):
-        return numpy.loadtxt(self.filename, delimiter=',')
-
-    def _get_header(self):
-        fp = open(self.filename, 'r')
-        header = ''
-        for line in fp.readlines():
-            if line[0] == '#':
-                header += line
-            else:
-                break
-        fp.close()
-        try:
-            offstr = re.findall('Voltage offset: (?P<offset>\d+\.\d+)', header)[0]
-            self.offset = float(offstr)
-        except:
-            self.offset = 0.0
-        return header
     
+    @property
+    def data(self):
+        """The rows of the map (read so far, for a MapFollower)"""
+        return self.map.data
+
     def integrate(self, frequencies=None, 
                   radius=2.7, nooffset=False,
                   azel='az'):
@@ -71,31 +208,21 @@ class BeamIntegral(object):
         Given a radius calculate beam integral inside the radius and
         also the total integral
         """
+        freq_index = self.map.freq_index
         if frequencies is None:
-            frequencies = self.cfg['synth']['freq']
-        lisdic = []
-        for i, freq in enumerate(frequencies):
-            if freq in self.cfg['synth']['freq']:
-                dic = {}
-                dic['frequency'] = freq
-                if azel in ('az', 'el'):
-                    find = self.cfg['synth']['freq'].index(freq)*2 + 1
-                else:
-                    find = self.cfg['synth']['freq'].index(freq)*2 + 2
-                if not nooffset:
-                    ydata = numpy.sqrt(self.data[:, find]**2 - self.offset**2)
-                else:
-                    ydata = self.data[:, find]
-                if azel in ('az', 'el'):
-                    xdata = self.data[:, 0]
-                else:
-                    xdata = numpy.sqrt(self.data[:, 0]**2 + self.data[:, 1]**2)
-                    ind = numpy.where(self.data[:, 0] < 0)
-                    xdata[ind] = -xdata[ind]
-                idx = numpy.where(numpy.abs(xdata) <= radius)
-                dic['inner'] = numpy.nansum(ydata[idx])
-                dic['all'] = numpy.nansum(ydata)
-                lisdic.append(dic)
-                print freq, dic['inner'], dic['all']
-        return pd.DataFrame(lisdic)
+            frequencies = self.map.frequencies
+        frequencies = [freq for freq in frequencies if freq in freq_index]
+        values = cut_values(self.data, len(freq_index), self.offset, azel=azel, nooffset=nooffset)
+        values = values[:, [freq_index[freq] for freq in frequencies]]
+        xdata = cut_angles(self.data, azel)
+        if self.map.header.adaptive and len(xdata) > 1:
+            # unevenly spaced map: weight each point by its cell
+            # width in units of the coarsest step
+            values = values*(cell_widths(xdata)/numpy.abs(numpy.diff(xdata)).max())[:, numpy.newaxis]
+        inner = numpy.nansum(values[numpy.abs(xdata) <= radius], axis=0)
+        total = numpy.nansum(values, axis=0)
+        for freq, inn, tot in zip(frequencies, inner, total):
+            print freq, inn, tot
+        return pd.DataFrame({'frequency': frequencies, 'inner': inner, 'all': total},
+                            columns=['frequency', 'inner', 'all'])
     
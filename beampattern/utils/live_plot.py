@@ -0,0 +1,151 @@
+"""
+Live plot of a map while it is being acquired. The plot runs in
+a separate process so the map loop only puts samples on a queue
+and never waits on matplotlib. Each series (usually a frequency)
+is a single persistent Line2D whose data is replaced with
+set_data, and the figure is redrawn at most once per refresh
+interval, so the redraw cost does not grow with the number of
+points taken.
+"""
+
+import time
+import Queue
+import multiprocessing
+
+from beampattern.logging import logger
+
+logger.name = __name__
+
+NONINTERACTIVE_BACKENDS = ('agg', 'pdf', 'ps', 'svg', 'cairo', 'template')
+
+
+def _plot_loop(queue, labels, symbols, xlim, ylim, title, figsize,
+               refresh, baseline):
+    """Runs in the plotting process until told to stop"""
+    import matplotlib
+    import matplotlib.pyplot as plt
+    interactive = matplotlib.get_backend().lower() not in NONINTERACTIVE_BACKENDS
+    if interactive:
+        plt.ion()
+    fig = plt.figure(figsize=figsize)
+    ax = fig.add_subplot(111)
+    if baseline:
+        ax.plot(xlim, [0, 0], 'r-')
+    lines = []
+    for i, label in enumerate(labels):
+        line, = ax.plot([], [], symbols[i % len(symbols)], label=label)
+        lines.append(line)
+    ax.set_xlim(xlim)
+    ax.set_ylim(ylim)
+    if title:
+        ax.set_title(title)
+    if labels:
+        ax.legend(loc='upper right', fontsize='small', numpoints=1)
+    xdata = [[] for label in labels]
+    ydata = [[] for label in labels]
+    changed = set()
+    last_draw = 0.0
+    running = True
+    while running:
+        try:
+            msg = queue.get(timeout=refresh)
+        except Queue.Empty:
+            msg = None
+        force = False
+        while msg is not None:
+            kind = msg[0]
+            if kind == 'point':
+                i, x, y = msg[1:]
+                xdata[i].append(x)
+                ydata[i].append(y)
+                changed.add(i)
+            elif kind == 'line':
+                i, x, y = msg[1:]
+                xdata[i] = list(x)
+                ydata[i] = list(y)
+                changed.add(i)
+            elif kind == 'stop':
+                force = True
+                running = False
+            try:
+                msg = queue.get_nowait()
+            except Queue.Empty:
+                msg = None
+        now = time.time()
+        if changed and (force or now - last_draw >= refresh):
+            for i in changed:
+                lines[i].set_data(xdata[i], ydata[i])
+            changed.clear()
+            fig.canvas.draw_idle()
+            last_draw = now
+        if interactive:
+            fig.canvas.flush_events()
+    if interactive:
+        # keep the finished map up until the window is closed
+        # or the program exits
+        plt.ioff()
+        plt.show()
+
+
+class LivePlotter(object):
+    """
+    Live plot of one or more series. labels gives the legend
+    label of each series and symbols their matplotlib format
+    strings. add() and set_line() only queue data for the
+    plotting process. If enabled is False all methods do nothing.
+    """
+    def __init__(self, labels, xlim, ylim, symbols=('o',), title=None,
+                 figsize=None, refresh=0.5, baseline=True, enabled=True):
+        self.labels = list(labels)
+        self.xlim = tuple(xlim)
+        self.ylim = tuple(ylim)
+        self.symbols = list(symbols)
+        self.title = title
+        if figsize is not None:
+            # figsize in the config is in pixels
+            figsize = (figsize[0]/80.0, figsize[1]/80.0)
+        self.figsize = figsize
+        self.refresh = refresh
+        self.baseline = baseline
+        self.enabled = enabled
+        self.queue = None
+        self.process = None
+
+    def start(self):
+        if not self.enabled:
+            return self
+        self.queue = multiprocessing.Queue()
+        self.process = multiprocessing.Process(target=_plot_loop,
+                                               args=(self.queue, self.labels, self.symbols,
+                                                     self.xlim, self.ylim, self.title,
+                                                     self.figsize, self.refresh,
+                                                     self.baseline))
+        self.process.daemon = True
+        self.process.start()
+        return self
+
+    def add(self, index, x, y):
+        """Append point (x, y) to series index"""
+        if self.queue is not None:
+            self.queue.put(('point', index, float(x), float(y)))
+
+    def set_line(self, index, x, y):
+        """Replace the data of series index"""
+        if self.queue is not None:
+            self.queue.put(('line', index, [float(v) for v in x],
+                            [float(v) for v in y]))
+
+    def finish(self):
+        """
+        Draw the remaining points. The window stays open until
+        closed or the program exits.
+        """
+        if self.queue is not None:
+            self.queue.put(('stop',))
+            self.queue = None
+
+    def terminate(self):
+        self.finish()
+        if self.process is not None and self.process.is_alive():
+            self.process.terminate()
+        self.process = None
@@ -0,0 +1,489 @@
+"""
+Map data files. MapWriter writes the rows of a map either as
+the usual comma separated text file with a '#' header, as a
+binary npz container, or both. The npz container holds the
+data at full precision:
+
+    positions  (nrows, npos) stage positions of each row
+    values     (nrows, nvalues, ncols) measurements of each row,
+               one entry per frequency (or frequency and channel)
+    columns    names of the ncols quantities of each value
+    header     text header as written to the text file
+    config     the map configuration as JSON
+    plus any extra arrays the map engine passes as metadata
+    (frequencies, offsets, boresight power levels)
+
+The read functions accept either kind of file, so the plot and
+integral classes work unchanged on both.
+
+read_map() returns a MapFile: the header, configuration and data
+of a file read and parsed once, and kept in a small LRU cache
+keyed on the path and modification time, so that plotting or
+integrating the same map again does not read it again. A
+MapFollower does the same for a text file that is still being
+written, adding the rows to its data as they appear.
+"""
+
+import os
+import re
+import time
+import json
+import threading
+import numpy
+from cStringIO import StringIO
+from collections import OrderedDict
+
+from beampattern.utils import timing
+from beampattern.utils.beampattern_exceptions import BeamPatternGeneralError, BeamPatternArgumentError
+from beampattern.logging import logger
+
+logger.name = __name__
+
+OUTPUT_FORMATS = ('ascii', 'npz', 'both')
+FORMAT_VERSION = 1
+
+
+def npz_filename(filename):
+    """Name of the binary container that goes with a text data file"""
+    return os.path.splitext(filename)[0] + '.npz'
+
+
+def is_binary(filename):
+    return filename.endswith('.npz')
+
+
+class MapWriter(object):
+    """
+    Writes the rows of a map. Each row is begin_row() with the
+    stage positions, one add() per frequency with its ncols
+    values, and end_row(). posfmt formats the positions in the
+    text file. The npz file is written on close().
+    """
+    def __init__(self, filename, header, output_format='ascii',
+                 columns=('mean', 'std'), posfmt='%.3f', config=None,
+                 metadata=None):
+        if output_format not in OUTPUT_FORMATS:
+            raise BeamPatternArgumentError("MapWriter", "Unknown output format %s" % output_format)
+        self.filename = filename
+        self.header = header
+        self.output_format = output_format
+        self.columns = list(columns)
+        self.posfmt = posfmt
+        self.config = config
+        self.metadata = metadata or {}
+        self.positions = []
+        self.values = []
+        self._row = None
+        self.fp = None
+        if output_format in ('ascii', 'both'):
+            self.fp = timing.timed_open(filename, 'w')
+            self.fp.write(header)
+        if output_format in ('npz', 'both'):
+            self.npzfile = npz_filename(filename)
+        else:
+            self.npzfile = None
+
+    def begin_row(self, *positions):
+        if self.fp is not None and positions:
+            self.fp.write(self.posfmt % positions)
+        self.positions.append(positions)
+        self._row = []
+
+    def add(self, *values):
+        if len(values) != len(self.columns):
+            raise BeamPatternArgumentError("MapWriter", "Expected %d values, got %d" % \
+                                           (len(self.columns), len(values)))
+        if self.fp is not None:
+            self.fp.write(",%.6g"*len(values) % values)
+        self._row.append(values)
+
+    def end_row(self):
+        if self.fp is not None:
+            # flushed so that the map can be followed as it is taken
+            self.fp.write('\n')
+            self.fp.flush()
+        self.values.append(self._row)
+        self._row = None
+
+    def flush(self):
+        if self.fp is not None:
+            self.fp.flush()
+
+    def _save_npz(self):
+        nrows = len(self.values)
+        npos = len(self.positions[0]) if nrows else 0
+        arrays = {'positions': numpy.array(self.positions, dtype='float64').reshape(nrows, npos),
+                  'values': numpy.array(self.values, dtype='float64').reshape(nrows, -1,
+                                                                              len(self.columns)),
+                  'columns': numpy.array(self.columns),
+                  'header': numpy.array(self.header),
+                  'config': numpy.array(json.dumps(self.config)),
+                  'format_version': numpy.array(FORMAT_VERSION)}
+        for key, val in self.metadata.items():
+            arrays[key] = numpy.asarray(val)
+        with timing.phase('file'):
+            fp = open(self.npzfile, 'wb')
+            numpy.savez(fp, **arrays)
+            fp.close()
+        logger.info("Wrote binary map file %s" % self.npzfile)
+
+    def close(self):
+        if self.fp is not None:
+            self.fp.close()
+            self.fp = None
+        if self.npzfile is not None:
+            self._save_npz()
+
+
+def load_map(filename):
+    """
+    Returns a dictionary of all the arrays in an npz map file, with
+    the header and config unpacked to a string and a dictionary
+    """
+    if not is_binary(filename):
+        raise BeamPatternArgumentError("load_map", "%s is not an npz map file" % filename)
+    npz = numpy.load(filename)
+    try:
+        data = dict([(key, npz[key]) for key in npz.files])
+    finally:
+        npz.close()
+    data['header'] = str(data['header'])
+    data['config'] = json.loads(str(data['config']))
+    return data
+
+
+def read_header(filename):
+    """Returns the '#' header of a map file as text"""
+    if is_binary(filename):
+        return load_map(filename)['header']
+    fp = open(filename, 'r')
+    header = ''
+    for line in fp.readlines():
+        if line[0] == '#':
+            header += line
+        else:
+            break
+    fp.close()
+    return header
+
+
+def read_data(filename):
+    """
+    Returns the map data as a 2D array with the same columns as
+    the text file: positions then the values of each frequency
+    """
+    if is_binary(filename):
+        data = load_map(filename)
+        nrows = data['values'].shape[0]
+        return numpy.hstack((data['positions'], data['values'].reshape(nrows, -1)))
+    return numpy.loadtxt(filename, delimiter=',')
+
+
+def read_config(filename):
+    """
+    Returns the configuration stored in an npz map file, or None
+    for a text file (whose configuration is in its config file)
+    """
+    if is_binary(filename):
+        config = load_map(filename)['config']
+        if config is None:
+            raise BeamPatternGeneralError("read_config", "No configuration stored in %s" % filename)
+        return config
+    return None
+
+
+def read_cube(filename):
+    """
+    Returns a raster map as (elevations, azimuths, cube), where
+    cube has shape (nel, naz, nfreq, ncols) and holds each value
+    column (mean, std) at every grid point and frequency. Grid
+    points missing from the file are nan.
+    """
+    if is_binary(filename):
+        data = load_map(filename)
+        positions, values = data['positions'], data['values']
+        if 'azimuths' in data and 'elevations' in data:
+            azimuths, elevations = data['azimuths'], data['elevations']
+        else:
+            azimuths = numpy.unique(positions[:, 0])
+            elevations = numpy.unique(positions[:, 1])
+    else:
+        data = numpy.loadtxt(filename, delimiter=',', ndmin=2)
+        positions = data[:, :2]
+        # text files always have a mean and std column per frequency
+        values = data[:, 2:].reshape(data.shape[0], -1, 2)
+        azimuths = numpy.unique(positions[:, 0])
+        elevations = numpy.unique(positions[:, 1])
+    if positions.shape[1] != 2:
+        raise BeamPatternArgumentError("read_cube", "%s is not an az, el map" % filename)
+    cube = numpy.empty((len(elevations), len(azimuths)) + values.shape[1:])
+    cube.fill(numpy.nan)
+    jaz = numpy.searchsorted(azimuths, positions[:, 0])
+    jel = numpy.searchsorted(elevations, positions[:, 1])
+    cube[jel, jaz] = values
+    return elevations, azimuths, cube
+
+
+def _header_lines(lines):
+    """Splits lines into the '#' header lines and the rest"""
+    for n, line in enumerate(lines):
+        if line[:1] != '#':
+            return lines[:n], lines[n:]
+    return lines, []
+
+
+class MapHeader(object):
+    """
+    The '#' header of a map file, parsed. Entries missing from the
+    header are None, the offsets 0.0. adaptive is True for maps
+    taken by make_adaptive_map, whose positions are unevenly spaced
+    """
+    def __init__(self, text):
+        self.text = text
+        self.datetime_str = self._search('^# Beammap Timestamp: (\w+)')
+        self.cfgfile = self._search('^# Configfile: (\w+\.\w+)')
+        self.comment = self._search('^# Comment: (.*)$')
+        self.adaptive = re.search('^# Adaptive map:', text, re.M) is not None
+        self.offset = 0.0
+        self.offset_std = 0.0
+        match = re.search('Voltage offset: (?P<offset>[-+.\deE]+)( \+/- (?P<std>[-+.\deE]+))?', text)
+        if match:
+            self.offset = abs(float(match.group('offset')))
+            if match.group('std'):
+                self.offset_std = float(match.group('std'))
+
+    def _search(self, pattern):
+        match = re.search(pattern, self.text, re.M)
+        if match:
+            return match.group(1)
+        return None
+
+
+# configuration sections holding the frequency list, by map type
+FREQUENCY_SECTIONS = ('synth', 'vna', 'synthesizer')
+
+
+def _map_config(filename, header, config_class):
+    """
+    Reads the config file named in a text map header with
+    config_class, from the current directory or next to the map
+    """
+    cfgfile = header.cfgfile
+    if cfgfile is None:
+        raise BeamPatternGeneralError('get_cfg_file', "Could not parse config file from input file")
+    for path in (cfgfile, os.path.join(os.path.dirname(filename), cfgfile)):
+        if os.path.exists(path):
+            return config_class(path).cfg
+    raise BeamPatternGeneralError('get_configuration', "Could not parse configuration from config file")
+
+
+def _frequency_list(cfg):
+    """The frequency list of a map configuration"""
+    for section in FREQUENCY_SECTIONS:
+        if section in cfg:
+            return list(cfg[section]['freq'])
+    return []
+
+
+class MapFile(object):
+    """
+    A map file read once. header is a MapHeader, cfg the map
+    configuration (stored in an npz file, else read from the config
+    file named in the header with config_class, looked for in the
+    current directory and then next to the map file), data the
+    array returned by read_data(). frequencies is the frequency
+    list of the configuration and freq_index maps each frequency to
+    its position in it. columns names the values stored for each
+    frequency.
+
+    MapFiles are shared by the cache of read_map(), so their arrays
+    should not be changed in place.
+    """
+    def __init__(self, filename, config_class):
+        self.filename = filename
+        if is_binary(filename):
+            arrays = load_map(filename)
+            self.header = MapHeader(arrays['header'])
+            nrows = arrays['values'].shape[0]
+            self.data = numpy.hstack((arrays['positions'], arrays['values'].reshape(nrows, -1)))
+            self.columns = [str(col) for col in arrays['columns']]
+            self.cfg = arrays['config']
+            if self.cfg is None:
+                raise BeamPatternGeneralError("read_config", "No configuration stored in %s" % filename)
+        else:
+            fp = open(filename, 'r')
+            lines = fp.readlines()
+            fp.close()
+            header, body = _header_lines(lines)
+            self.header = MapHeader(''.join(header))
+            self.data = numpy.loadtxt(StringIO(''.join(body)), delimiter=',')
+            self.columns = ['mean', 'std']
+            self.cfg = _map_config(filename, self.header, config_class)
+        self.frequencies = _frequency_list(self.cfg)
+        self.freq_index = dict([(freq, i) for i, freq in enumerate(self.frequencies)])
+
+    @property
+    def datetime_str(self):
+        return self.header.datetime_str
+
+    def column(self, freq, first=1, group=0):
+        """
+        Index in data of the first value column of freq: the value
+        columns start after first position columns and hold a
+        group (measured parameter) of frequencies after another
+        """
+        if freq not in self.freq_index:
+            raise BeamPatternArgumentError("MapFile", "No frequency %s in %s" % (freq, self.filename))
+        return first + len(self.columns)*(group*len(self.frequencies) + self.freq_index[freq])
+
+
+class MapCache(object):
+    """
+    Least recently used cache of MapFiles keyed on the path,
+    modification time and size of the file, so a file that is
+    rewritten is read again
+    """
+    def __init__(self, size=32):
+        self.size = size
+        self.maps = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, filename, config_class):
+        stat = os.stat(filename)
+        key = (os.path.abspath(filename), stat.st_mtime, stat.st_size, config_class)
+        with self.lock:
+            mapfile = self.maps.pop(key, None)
+            if mapfile is not None:
+                self.maps[key] = mapfile
+                return mapfile
+        mapfile = MapFile(filename, config_class)
+        with self.lock:
+            self.maps[key] = mapfile
+            while len(self.maps) > self.size:
+                self.maps.popitem(last=False)
+        return mapfile
+
+    def clear(self):
+        with self.lock:
+            self.maps.clear()
+
+
+map_cache = MapCache()
+
+
+def read_map(filename, config_class):
+    """
+    Returns the MapFile of filename from the cache, reading it if
+    it is not there or has changed since
+    """
+    return map_cache.get(filename, config_class)
+
+
+class MapFollower(MapFile):
+    """
+    Follows a text map file while the map is being taken. poll()
+    reads only what has been appended since the last call, keeps a
+    partly written last line for the next call, and adds the new
+    rows to data, which grows in place instead of the file being
+    parsed again. Once the first row is in, the header, cfg,
+    frequencies, freq_index and column() are those of a MapFile,
+    so a follower can be handed to the plot and integral classes
+    as their beammap and they see the rows taken so far.
+    """
+    def __init__(self, filename, config_class):
+        if is_binary(filename):
+            raise BeamPatternArgumentError("MapFollower", "%s is only written when the map ends; "
+                                           "follow the text file" % filename)
+        self.filename = filename
+        self.config_class = config_class
+        self.columns = ['mean', 'std']
+        self._reset()
+
+    def _reset(self):
+        self.offset = 0
+        self.partial = ''
+        self.header_lines = []
+        self.header = None
+        self.cfg = None
+        self.frequencies = []
+        self.freq_index = {}
+        self._data = None
+        self.nrows = 0
+
+    @property
+    def data(self):
+        """The rows read so far"""
+        if self._data is None:
+            return numpy.empty((0, 0))
+        return self._data[:self.nrows]
+
+    def _start(self):
+        """The header is complete: parse it and read the configuration"""
+        self.header = MapHeader(''.join(self.header_lines))
+        self.cfg = _map_config(self.filename, self.header, self.config_class)
+        self.frequencies = _frequency_list(self.cfg)
+        self.freq_index = dict([(freq, i) for i, freq in enumerate(self.frequencies)])
+
+    def _append(self, rows):
+        """Adds rows to data, doubling its storage when full"""
+        if self._data is None:
+            self._data = numpy.empty((max(64, len(rows)), rows.shape[1]))
+        elif self.nrows + len(rows) > len(self._data):
+            grown = numpy.empty((max(2*len(self._data), self.nrows + len(rows)), self._data.shape[1]))
+            grown[:self.nrows] = self._data[:self.nrows]
+            self._data = grown
+        self._data[self.nrows:self.nrows+len(rows)] = rows
+        self.nrows += len(rows)
+
+    def poll(self):
+        """
+        Reads what has been written to the file since the last
+        call. Returns the new complete rows as an array, with no
+        rows if there are none yet. A file that has shrunk (was
+        written again) is read from the start
+        """
+        if not os.path.exists(self.filename):
+            return numpy.empty((0, self.data.shape[1]))
+        size = os.path.getsize(self.filename)
+        if size < self.offset:
+            logger.warning("%s has shrunk, reading it again" % self.filename)
+            self._reset()
+        fp = open(self.filename, 'r')
+        fp.seek(self.offset)
+        text = fp.read()
+        fp.close()
+        self.offset += len(text)
+        lines = (self.partial + text).split('\n')
+        self.partial = lines.pop()
+        rows = []
+        for line in lines:
+            if self.header is None:
+                if line[:1] == '#':
+                    self.header_lines.append(line + '\n')
+                    continue
+                self._start()
+            if line.strip():
+                rows.append(line)
+        if not rows:
+            return numpy.empty((0, self.data.shape[1]))
+        new = numpy.loadtxt(StringIO('\n'.join(rows)), delimiter=',', ndmin=2)
+        self._append(new)
+        return new
+
+    def follow(self, interval=1.0, idle_timeout=None):
+        """
+        Generator of the new rows of the file as they are written,
+        checking every interval seconds. Ends once nothing has been
+        added for idle_timeout seconds, or runs until closed if
+        idle_timeout is None
+        """
+        last = time.time()
+        while True:
+            new = self.poll()
+            if len(new):
+                last = time.time()
+                yield new
+            elif idle_timeout is not None and time.time() - last > idle_timeout:
+                return
+            else:
+                time.sleep(interval)
@@ -39,12 +39,21 @@ fileloglevel  = integer(5, 50, default=10)
 consoleloglevel  = integer(5, 50, default=10)
 # comment is a long string which gets written to the output data file
 comment = string(max=150, default="BeamMap at 74 GHz")
+# output_format: 'ascii' writes the usual text data file, 'npz'
+# writes a binary numpy container (same name with a .npz extension)
+# holding the data at full precision along with the header and
+# configuration, and 'both' writes the two
+output_format = option('ascii', 'npz', 'both', default='ascii')
 
 #general plot specific items
 [plot]
 #figsize is figure size in pixels (x,y)
 figsize = int_list(min=2, max=2, default=list(800, 600))
-#more plot configs to follow later
+# live: show the map as it is taken. The plot runs in its own
+# process so the stage and instruments never wait on it
+live = boolean(default=True)
+# refresh: minimum seconds between redraws of the live plot
+refresh = float(0.05, 10.0, default=0.5)
 
 [devices]
 # use the unidex11?
@@ -76,13 +85,34 @@ ymax = float(-180.0, 180.0, default=90)
 # yinc: map step in degrees
 yinc = float(0.1, 180.0, default=1.0)
 
+[unidex]
+# This object contains configuration items specific to
+# motion completion on the unidex11
+# poll_interval: seconds between serial polls of the motion bit
+poll_interval = float(0.01, 5.0, default=0.1)
+# motion_margin: seconds allowed beyond the expected move time
+# before a move is declared as failed
+motion_margin = float(0.0, 120.0, default=5.0)
+# home_timeout: seconds allowed for a home command to complete
+home_timeout = float(1.0, 300.0, default=30.0)
+
 [vna]
 # This object contains configuration items specfic to
 # frequency and frequency sweeps
 # freq is a list of floats
 freq = float_list(min=1, max=100, default=list(11.7, 12.0, 12.2))
-meas = string(max=3, default="S22")
+# meas: S-parameter to measure, or a list of them (e.g. S21, S12)
+# that are all swept at each map position and written as one
+# group of columns each
+meas = force_list(min=1, max=4, default=list("S22"))
 avg_value = integer(2, 4096, default=32)
+# data_format: binary format the sweep data is read out in. FORM3
+# is 64 bit floats, FORM2 and FORM5 are 32 bit floats (FORM5 in PC
+# byte order) and take half the bus time
+data_format = option('FORM2', 'FORM3', 'FORM5', default='FORM3')
+# max_retries: times a failed sweep readout is retried before
+# the map stops
+max_retries = integer(0, 100, default=3)
 """
 
 def default_config():
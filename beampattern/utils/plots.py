@@ -3,71 +3,82 @@
 from beampattern.utils.configuration import Configuration
 from beampattern.utils.phase_configuration import ConfigurationPhase
 from beampattern.utils.vector_voltmeter_configuration import ConfigurationVector
-from beampattern.utils.beampattern_exceptions import BeamPatternGeneralError, BeamPatternArgumentError
+from beampattern.utils.mapfile import read_map
 import matplotlib.pyplot as plt
-import re
-import os
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from cStringIO import StringIO
 import numpy
 
+
+def new_figure(headless=False, figures=None, kind=None):
+    """
+    Returns (fig, ax) for a plot. Interactive plots are pyplot
+    figures. Headless plots are drawn on their own Agg canvas
+    without pyplot (so they are safe in worker processes and need
+    no display); the figure kept in figures[kind] is cleared and
+    reused. New figures are kept in figures[kind]
+    """
+    if not headless:
+        plt.ion()
+        fig, ax = plt.subplots()
+        if figures is not None:
+            figures[kind] = fig
+        return fig, ax
+    fig = figures.get(kind) if figures is not None else None
+    if fig is None:
+        fig = Figure()
+        FigureCanvasAgg(fig)
+        if figures is not None:
+            figures[kind] = fig
+    else:
+        fig.clf()
+    return fig, fig.add_subplot(111)
+
+
+def show_figure(fig, plotfile=None, headless=False):
+    """Shows an interactive plot and saves it to plotfile if given"""
+    if not headless:
+        plt.draw()
+        plt.show()
+    if plotfile is not None:
+        fig.savefig(plotfile)
+
+
+def render_figure(fig, format='png', **kwargs):
+    """Returns fig rendered in format (png, pdf, svg) as a string"""
+    buf = StringIO()
+    fig.savefig(buf, format=format, **kwargs)
+    return buf.getvalue()
+
+
 class BeamPlot(object):
     def __init__(self, filename, markers=True,
-                 grid=True, plotfile=None):
+                 grid=True, plotfile=None, headless=False,
+                 figures=None, beammap=None):
         self.plot_symbols = ['o', 's', 'v', '^', '<', '>',
                              '1', '2', '3', '4', 'p', '*',
                              'h', 'H', '+', 'x', 'D', 'd']
         self.linestyles = ['-', '--', '-.', ':']
         self.filename = filename
-        self._get_cfg_file()
-        self.cfg = self._get_configuration()
-        self.data = self._get_data()
-        self.header = self._get_header()
+        if beammap is None:
+            beammap = read_map(filename, Configuration)
+        self.map = beammap
+        self.cfgfile = self.map.header.cfgfile
+        self.datetime_str = self.map.header.datetime_str
+        self.cfg = self.map.cfg
+        self.header = self.map.header.text
+        self.offset = self.map.header.offset
         self.markers = markers
         self.grid = grid
         self.plotfile = plotfile
+        self.headless = headless
+        self.figures = figures if figures is not None else {}
         self.lined = dict()
         
-    def _get_cfg_file(self):
-        fp = open(self.filename, 'r')
-        first = fp.readline()
-        match = re.match('# Beammap Timestamp: (?P<datetime_str>\w+)', first)
-        if match:
-            self.datetime_str = match.groupdict()['datetime_str']
-        second = fp.readline().strip()
-        match = re.match('# Configfile: (?P<cfgfile>\w+\.\w+)', second)
-        if match:
-            self.cfgfile = match.groupdict()['cfgfile']
-        else:
-            raise BeamPatternGeneralError('get_cfg_file', "Could not parse config file from input file")
-        three = fp.readline().strip()
-        #match = re.match('# Comment: (?P<comment>[\w\s]*)', three)
-        #if match:
-        #    self.comment = match.groupdict()['comment']
-
-    def _get_configuration(self):
-        if self.cfgfile and os.path.exists(self.cfgfile):
-            config = Configuration(self.cfgfile)
-            return config.cfg
-        else:
-            raise BeamPatternGeneralError('get_configuration', "Could not parse configuration from config file")
-
-    def _get_data(self):
-        return numpy.loadtxt(self.filename, delimiter=',')
-
-    def _get_header(self):
-        fp = open(self.filename, 'r')
-        header = ''
-        for line in fp.readlines():
-            if line[0] == '#':
-                header += line
-            else:
-                break
-        fp.close()
-        try:
-            offstr = re.findall('Voltage offset: (?P<offset>\d+\.\d+)', header)[0]
-            self.offset = float(offstr)
-        except:
-            self.offset = 0.0
-        return header
+    @property
+    def data(self):
+        return self.map.data
 
     def onpick(self, event):
         # on the pick event, find the orig line corresponding to the
@@ -88,11 +99,11 @@ class BeamPlot(object):
     def _plot_data(self, frequencies=None, linear=True,
                    ylim=None, xlim=None, title=None, 
                    azel='az', nooffset=False):
-        print title
-        plt.ion()
-        self.fig, ax = plt.subplots()
+        if not self.headless:
+            print title
+        self.fig, ax = new_figure(self.headless, self.figures, 'beam')
         if frequencies is None:
-            frequencies = self.cfg['synth']['freq']
+            frequencies = self.map.frequencies
             
         # if not linear:
         #     vmax = -10000.
@@ -103,11 +114,11 @@ class BeamPlot(object):
         #             vmax = cmax if cmax > vmax else vmax
         lines = []
         for i, freq in enumerate(frequencies):
-            if freq in self.cfg['synth']['freq']:
+            if freq in self.map.freq_index:
                 if azel in ('az', 'el'):
-                    find = self.cfg['synth']['freq'].index(freq)*2 + 1
+                    find = self.map.column(freq, first=1)
                 else:
-                    find = self.cfg['synth']['freq'].index(freq)*2 + 2
+                    find = self.map.column(freq, first=2)
                 lind = i % len(self.linestyles)
                 pind = i % len(self.plot_symbols)
                 if linear:
@@ -186,15 +197,17 @@ class BeamPlot(object):
             ax.set_title(title)
         if self.grid:
             ax.grid(True)
-        # Now connect the legends to lines
-        for legline, origline in zip(leg.get_lines(), lines):
-            legline.set_picker(5)  # 5 pts tolerance
-            self.lined[legline] = origline
-        self.fig.canvas.mpl_connect('pick_event', self.onpick)
-        plt.draw()
-        plt.show()
-        if self.plotfile is not None:
-            plt.savefig(self.plotfile)
+        if not self.headless:
+            # Now connect the legends to lines
+            for legline, origline in zip(leg.get_lines(), lines):
+                legline.set_picker(5)  # 5 pts tolerance
+                self.lined[legline] = origline
+            self.fig.canvas.mpl_connect('pick_event', self.onpick)
+        show_figure(self.fig, self.plotfile, self.headless)
+
+    def render(self, format='png', **kwargs):
+        """Returns the last plot rendered in format as a string"""
+        return render_figure(self.fig, format, **kwargs)
 
     def plot_linear(self, frequencies=None, xlim=None,
                     ylim=None, title=None, azel='az', nooffset=False):
@@ -212,229 +225,206 @@ class BeamPlot(object):
 
 class BeamPlotPhase(object):
     def __init__(self, filename, markers=True,
-                 grid=True, plotfile=None):
+                 grid=True, plotfile=None, headless=False,
+                 figures=None, beammap=None):
         self.plot_symbols = ['o', 's', 'v', '^', '<', '>',
                              '1', '2', '3', '4', 'p', '*',
                              'h', 'H', '+', 'x', 'D', 'd']
         self.linestyles = ['-', '--', '-.', ':']
         self.filename = filename
-        self._get_cfg_file()
-        self.cfg = self._get_configuration()
-        self.data = self._get_data()
-        self.header = self._get_header()
+        if beammap is None:
+            beammap = read_map(filename, ConfigurationPhase)
+        self.map = beammap
+        self.cfgfile = self.map.header.cfgfile
+        self.datetime_str = self.map.header.datetime_str
+        self.cfg = self.map.cfg
+        self.measures = self._get_measures()
+        self.header = self.map.header.text
         self.markers = markers
         self.grid = grid
         self.plotfile = plotfile
+        self.headless = headless
+        self.figures = figures if figures is not None else {}
         
-    def _get_cfg_file(self):
-        fp = open(self.filename, 'r')
-        first = fp.readline()
-        match = re.match('# Beammap Timestamp: (?P<datetime_str>\w+)', first)
-        if match:
-            self.datetime_str = match.groupdict()['datetime_str']
-        second = fp.readline().strip()
-        match = re.match('# Configfile: (?P<cfgfile>\w+\.\w+)', second)
-        if match:
-            self.cfgfile = match.groupdict()['cfgfile']
-        else:
-            raise BeamPatternGeneralError('get_cfg_file', "Could not parse config file from input file")
-        three = fp.readline().strip()
+    @property
+    def data(self):
+        return self.map.data
 
-    def _get_configuration(self):
-        if self.cfgfile and os.path.exists(self.cfgfile):
-            config = ConfigurationPhase(self.cfgfile)
-            return config.cfg
-        else:
-            raise BeamPatternGeneralError('get_configuration', "Could not parse configuration from config file")
+    def _get_measures(self):
+        meas = self.cfg['vna']['meas']
+        if isinstance(meas, basestring):
+            meas = [meas]
+        return list(meas)
 
-    def _get_data(self):
-        return numpy.loadtxt(self.filename, delimiter=',')
+    def _traces(self, frequencies, measures):
+        """
+        Returns (label, complex data) for each measured parameter
+        and frequency asked for. Each parameter is a group of
+        real, imag columns per frequency, in the order measured
+        """
+        if frequencies is None:
+            frequencies = self.map.frequencies
+        if measures is None:
+            measures = self.measures
+        traces = []
+        for meas in measures:
+            if meas not in self.measures:
+                continue
+            for freq in frequencies:
+                if freq in self.map.freq_index:
+                    find = self.map.column(freq, group=self.measures.index(meas))
+                    cdata = self.data[:, find] + 1j * self.data[:, find+1]
+                    if len(self.measures) > 1:
+                        label = '%s %.1f GHz' % (meas, freq)
+                    else:
+                        label = '%.1f GHz' % freq
+                    traces.append((label, cdata))
+        return traces
 
-    def _get_header(self):
-        fp = open(self.filename, 'r')
-        header = ''
-        for line in fp.readlines():
-            if line[0] == '#':
-                header += line
-            else:
-                break
-        fp.close()
-        return header
-    
     def _plot_data_amp(self, frequencies=None, linear=True,
-                       options=None):
+                       options=None, measures=None):
         title = options.title
-        print title
-        plt.ion()
-        plt.figure()
-        if frequencies is None:
-            frequencies = self.cfg['vna']['freq']
-        for i, freq in enumerate(frequencies):
-            if freq in self.cfg['vna']['freq']:
-                find = self.cfg['vna']['freq'].index(freq)*2 + 1
-                lind = i % len(self.linestyles)
-                pind = i % len(self.plot_symbols)
-                cdata = self.data[:, find] + 1j * self.data[:, find+1]
-                if linear:
-                    ydata = numpy.abs(cdata)
-                else:
-                    arg = numpy.abs(cdata)/numpy.abs(cdata).max()
-                    ind = numpy.where(arg <= 0.0)
-                    ydata = 10.0 * numpy.log10(arg)
-                    ydata[ind] = numpy.nan
-                if self.markers:
-                    plt.plot(self.data[:, 0], ydata,
-                             linestyle=self.linestyles[lind],
-                             marker=self.plot_symbols[pind],
-                             markersize=3,
-                             label='%.1f GHz' % freq)
-                else:
-                    plt.plot(self.data[:, 0], ydata,
-                             linestyle=self.linestyles[lind],
-                             label='%.1f GHz' % freq)
+        if not self.headless:
+            print title
+        fig, ax = new_figure(self.headless, self.figures, 'amp')
+        for i, (label, cdata) in enumerate(self._traces(frequencies, measures)):
+            lind = i % len(self.linestyles)
+            pind = i % len(self.plot_symbols)
+            if linear:
+                ydata = numpy.abs(cdata)
+            else:
+                arg = numpy.abs(cdata)/numpy.abs(cdata).max()
+                ind = numpy.where(arg <= 0.0)
+                ydata = 10.0 * numpy.log10(arg)
+                ydata[ind] = numpy.nan
+            if self.markers:
+                ax.plot(self.data[:, 0], ydata,
+                        linestyle=self.linestyles[lind],
+                        marker=self.plot_symbols[pind],
+                        markersize=3,
+                        label=label)
+            else:
+                ax.plot(self.data[:, 0], ydata,
+                        linestyle=self.linestyles[lind],
+                        label=label)
         if options.xlimamp is None:
-            plt.xlim(self.cfg['azimuth']['xmin'], self.cfg['azimuth']['xmax'])
+            ax.set_xlim(self.cfg['azimuth']['xmin'], self.cfg['azimuth']['xmax'])
         else:
-            plt.xlim(options.xlimamp[0], options.xlimamp[1])
+            ax.set_xlim(options.xlimamp[0], options.xlimamp[1])
         if options.ylimamp is not None:
-            plt.ylim(options.ylimamp[0], options.ylimamp[1])
-        plt.xlabel('Azimuth (deg)')
+            ax.set_ylim(options.ylimamp[0], options.ylimamp[1])
+        ax.set_xlabel('Azimuth (deg)')
         if linear:
-            plt.ylabel('Beam Voltage (linear)')
+            ax.set_ylabel('Beam Voltage (linear)')
         else:
-            plt.ylabel('Beam Voltage (log)')
-        plt.legend(loc='best')
+            ax.set_ylabel('Beam Voltage (log)')
+        ax.legend(loc='best')
         if title is None:
-            plt.title('%s; %s' % (self.cfg['general']['comment'], self.datetime_str))
+            ax.set_title('%s; %s' % (self.cfg['general']['comment'], self.datetime_str))
         else:
-            plt.title(title)
+            ax.set_title(title)
         if self.grid:
-            plt.grid(True)
-        plt.draw()
-        plt.show()
+            ax.grid(True)
+        ampfile = None
         if self.plotfile is not None:
             ampfile = 'amp_' + self.plotfile
-            plt.savefig(ampfile)
+        show_figure(fig, ampfile, self.headless)
 
     def _plot_data_phase(self, frequencies=None, 
-                         options=None):
+                         options=None, measures=None):
         title = options.title
-        print title
-        plt.ion()
-        plt.figure()
-        if frequencies is None:
-            frequencies = self.cfg['vna']['freq']
-        for i, freq in enumerate(frequencies):
-            if freq in self.cfg['vna']['freq']:
-                find = self.cfg['vna']['freq'].index(freq)*2 + 1
-                lind = i % len(self.linestyles)
-                pind = i % len(self.plot_symbols)
-                cdata = self.data[:, find] + 1j * self.data[:, find+1]
-                if self.markers:
-                    plt.plot(self.data[:, 0], numpy.degrees(numpy.angle(cdata)),
-                             linestyle=self.linestyles[lind],
-                             marker=self.plot_symbols[pind],
-                             markersize=3,
-                             label='%.1f GHz' % freq)
-                else:
-                    plt.plot(self.data[:, 0], numpy.degrees(numpy.angle(cdata)),
-                             linestyle=self.linestyles[lind],
-                             label='%.1f GHz' % freq)
+        if not self.headless:
+            print title
+        fig, ax = new_figure(self.headless, self.figures, 'phase')
+        for i, (label, cdata) in enumerate(self._traces(frequencies, measures)):
+            lind = i % len(self.linestyles)
+            pind = i % len(self.plot_symbols)
+            if self.markers:
+                ax.plot(self.data[:, 0], numpy.degrees(numpy.angle(cdata)),
+                        linestyle=self.linestyles[lind],
+                        marker=self.plot_symbols[pind],
+                        markersize=3,
+                        label=label)
+            else:
+                ax.plot(self.data[:, 0], numpy.degrees(numpy.angle(cdata)),
+                        linestyle=self.linestyles[lind],
+                        label=label)
         if options.xlimphase is None:
-            plt.xlim(self.cfg['azimuth']['xmin'], self.cfg['azimuth']['xmax'])
+            ax.set_xlim(self.cfg['azimuth']['xmin'], self.cfg['azimuth']['xmax'])
         else:
-            plt.xlim(options.xlimphase[0], options.xlimphase[1])
+            ax.set_xlim(options.xlimphase[0], options.xlimphase[1])
         if options.ylimphase is not None:
-            plt.ylim(options.ylimphase[0], options.ylimphase[1])
-        plt.xlabel('Azimuth (deg)')
-        plt.ylabel('Beam Phase (deg)')
-        plt.legend(loc='best')
+            ax.set_ylim(options.ylimphase[0], options.ylimphase[1])
+        ax.set_xlabel('Azimuth (deg)')
+        ax.set_ylabel('Beam Phase (deg)')
+        ax.legend(loc='best')
         if title is None:
-            plt.title('%s; %s' % (self.cfg['general']['comment'], self.datetime_str))
+            ax.set_title('%s; %s' % (self.cfg['general']['comment'], self.datetime_str))
         else:
-            plt.title(title)
+            ax.set_title(title)
         if self.grid:
-            plt.grid(True)
-        plt.draw()
-        plt.show()
+            ax.grid(True)
+        phasefile = None
         if self.plotfile is not None:
             phasefile = 'phase_' + self.plotfile
-            plt.savefig(phasefile)
+        show_figure(fig, phasefile, self.headless)
 
-    def plot_linear(self, frequencies=None, options=None):
+    def render(self, kind='amp', format='png', **kwargs):
+        """
+        Returns the last amplitude (kind 'amp') or phase ('phase')
+        plot rendered in format as a string
+        """
+        return render_figure(self.figures[kind], format, **kwargs)
+
+    def plot_linear(self, frequencies=None, options=None, measures=None):
         self._plot_data_amp(frequencies=frequencies,
-                            linear=True, options=options)
+                            linear=True, options=options, measures=measures)
         self._plot_data_phase(frequencies=frequencies,
-                              options=options)
+                              options=options, measures=measures)
 
-    def plot_log(self, frequencies=None, options=None):
+    def plot_log(self, frequencies=None, options=None, measures=None):
         self._plot_data_amp(frequencies=frequencies,
-                            linear=False, options=options)
+                            linear=False, options=options, measures=measures)
         self._plot_data_phase(frequencies=frequencies,
-                              options=options)
+                              options=options, measures=measures)
 
 class BeamPlotVector(object):
     def __init__(self, filename, markers=True,
-                 grid=True, plotfile=None):
+                 grid=True, plotfile=None, headless=False,
+                 figures=None, beammap=None):
         self.plot_symbols = ['o', 's', 'v', '^', '<', '>',
                              '1', '2', '3', '4', 'p', '*',
                              'h', 'H', '+', 'x', 'D', 'd']
         self.linestyles = ['-', '--', '-.', ':']
         self.filename = filename
-        self._get_cfg_file()
-        self.cfg = self._get_configuration()
-        self.data = self._get_data()
-        self.header = self._get_header()
+        if beammap is None:
+            beammap = read_map(filename, ConfigurationVector)
+        self.map = beammap
+        self.cfgfile = self.map.header.cfgfile
+        self.datetime_str = self.map.header.datetime_str
+        self.cfg = self.map.cfg
+        self.header = self.map.header.text
         self.markers = markers
         self.grid = grid
         self.plotfile = plotfile
+        self.headless = headless
+        self.figures = figures if figures is not None else {}
         
-    def _get_cfg_file(self):
-        fp = open(self.filename, 'r')
-        first = fp.readline()
-        match = re.match('# Beammap Timestamp: (?P<datetime_str>\w+)', first)
-        if match:
-            self.datetime_str = match.groupdict()['datetime_str']
-        second = fp.readline().strip()
-        match = re.match('# Configfile: (?P<cfgfile>\w+\.\w+)', second)
-        if match:
-            self.cfgfile = match.groupdict()['cfgfile']
-        else:
-            raise BeamPatternGeneralError('get_cfg_file', "Could not parse config file from input file")
-        three = fp.readline().strip()
-
-    def _get_configuration(self):
-        if self.cfgfile and os.path.exists(self.cfgfile):
-            config = ConfigurationVector(self.cfgfile)
-            return config.cfg
-        else:
-            raise BeamPatternGeneralError('get_configuration', "Could not parse configuration from config file")
+    @property
+    def data(self):
+        return self.map.data
 
-    def _get_data(self):
-        return numpy.loadtxt(self.filename, delimiter=',')
-
-    def _get_header(self):
-        fp = open(self.filename, 'r')
-        header = ''
-        for line in fp.readlines():
-            if line[0] == '#':
-                header += line
-            else:
-                break
-        fp.close()
-        return header
-    
     def _plot_data_amp(self, frequencies=None, linear=True,
                        options=None):
         title = options.title
-        print title
-        plt.ion()
-        plt.figure()
+        if not self.headless:
+            print title
+        fig, ax = new_figure(self.headless, self.figures, 'amp')
         if frequencies is None:
-            frequencies = self.cfg['synthesizer']['freq']
+            frequencies = self.map.frequencies
         for i, freq in enumerate(frequencies):
-            if freq in self.cfg['synthesizer']['freq']:
-                find = self.cfg['synthesizer']['freq'].index(freq)*2 + 1
+            if freq in self.map.freq_index:
+                find = self.map.column(freq)
                 lind = i % len(self.linestyles)
                 pind = i % len(self.plot_symbols)
                 cdata = self.data[:, find] * numpy.exp(1j * numpy.radians(self.data[:, find+1]))
@@ -446,84 +436,89 @@ class BeamPlotVector(object):
                     ydata = 10.0 * numpy.log10(arg)
                     ydata[ind] = numpy.nan
                 if self.markers:
-                    plt.plot(self.data[:, 0], ydata,
-                             linestyle=self.linestyles[lind],
-                             marker=self.plot_symbols[pind],
-                             markersize=3,
-                             label='%.2f GHz' % freq)
+                    ax.plot(self.data[:, 0], ydata,
+                            linestyle=self.linestyles[lind],
+                            marker=self.plot_symbols[pind],
+                            markersize=3,
+                            label='%.2f GHz' % freq)
                 else:
-                    plt.plot(self.data[:, 0], ydata,
-                             linestyle=self.linestyles[lind],
-                             label='%.2f GHz' % freq)
+                    ax.plot(self.data[:, 0], ydata,
+                            linestyle=self.linestyles[lind],
+                            label='%.2f GHz' % freq)
         if options.xlimamp is None:
-            plt.xlim(self.cfg['azimuth']['xmin'], self.cfg['azimuth']['xmax'])
+            ax.set_xlim(self.cfg['azimuth']['xmin'], self.cfg['azimuth']['xmax'])
         else:
-            plt.xlim(options.xlimamp[0], options.xlimamp[1])
+            ax.set_xlim(options.xlimamp[0], options.xlimamp[1])
         if options.ylimamp is not None:
-            plt.ylim(options.ylimamp[0], options.ylimamp[1])
-        plt.xlabel('Azimuth (deg)')
+            ax.set_ylim(options.ylimamp[0], options.ylimamp[1])
+        ax.set_xlabel('Azimuth (deg)')
         if linear:
-            plt.ylabel('Beam Ratio (linear)')
+            ax.set_ylabel('Beam Ratio (linear)')
         else:
-            plt.ylabel('Beam Ratio (log)')
-        plt.legend(loc='best')
+            ax.set_ylabel('Beam Ratio (log)')
+        ax.legend(loc='best')
         if title is None:
-            plt.title('%s; %s' % (self.cfg['general']['comment'], self.datetime_str))
+            ax.set_title('%s; %s' % (self.cfg['general']['comment'], self.datetime_str))
         else:
-            plt.title(title)
+            ax.set_title(title)
         if self.grid:
-            plt.grid(True)
-        plt.draw()
-        plt.show()
+            ax.grid(True)
+        ampfile = None
         if self.plotfile is not None:
             ampfile = 'amp_' + self.plotfile
-            plt.savefig(ampfile)
+        show_figure(fig, ampfile, self.headless)
 
     def _plot_data_phase(self, frequencies=None, 
                          options=None):
         title = options.title
-        print title
-        plt.ion()
-        plt.figure()
+        if not self.headless:
+            print title
+        fig, ax = new_figure(self.headless, self.figures, 'phase')
         if frequencies is None:
-            frequencies = self.cfg['synthesizer']['freq']
+            frequencies = self.map.frequencies
         for i, freq in enumerate(frequencies):
-            if freq in self.cfg['synthesizer']['freq']:
-                find = self.cfg['synthesizer']['freq'].index(freq)*2 + 1
+            if freq in self.map.freq_index:
+                find = self.map.column(freq)
                 lind = i % len(self.linestyles)
                 pind = i % len(self.plot_symbols)
                 cdata = self.data[:, find] * numpy.exp(1j * numpy.radians(self.data[:, find+1]))                
                 #cdata = self.data[:, find] + 1j * self.data[:, find+1]
                 if self.markers:
-                    plt.plot(self.data[:, 0], numpy.degrees(numpy.angle(cdata)),
-                             linestyle=self.linestyles[lind],
-                             marker=self.plot_symbols[pind],
-                             markersize=3,
-                             label='%.2f GHz' % freq)
+                    ax.plot(self.data[:, 0], numpy.degrees(numpy.angle(cdata)),
+                            linestyle=self.linestyles[lind],
+                            marker=self.plot_symbols[pind],
+                            markersize=3,
+                            label='%.2f GHz' % freq)
                 else:
-                    plt.plot(self.data[:, 0], numpy.degrees(numpy.angle(cdata)),
-                             linestyle=self.linestyles[lind],
-                             label='%.2f GHz' % freq)
+                    ax.plot(self.data[:, 0], numpy.degrees(numpy.angle(cdata)),
+                            linestyle=self.linestyles[lind],
+                            label='%.2f GHz' % freq)
         if options.xlimphase is None:
-            plt.xlim(self.cfg['azimuth']['xmin'], self.cfg['azimuth']['xmax'])
+            ax.set_xlim(self.cfg['azimuth']['xmin'], self.cfg['azimuth']['xmax'])
         else:
-            plt.xlim(options.xlimphase[0], options.xlimphase[1])
+            ax.set_xlim(options.xlimphase[0], options.xlimphase[1])
         if options.ylimphase is not None:
-            plt.ylim(options.ylimphase[0], options.ylimphase[1])
-        plt.xlabel('Azimuth (deg)')
-        plt.ylabel('Beam Phase (deg)')
-        plt.legend(loc='best')
+            ax.set_ylim(options.ylimphase[0], options.ylimphase[1])
+        ax.set_xlabel('Azimuth (deg)')
+        ax.set_ylabel('Beam Phase (deg)')
+        ax.legend(loc='best')
         if title is None:
-            plt.title('%s; %s' % (self.cfg['general']['comment'], self.datetime_str))
+            ax.set_title('%s; %s' % (self.cfg['general']['comment'], self.datetime_str))
         else:
-            plt.title(title)
+            ax.set_title(title)
         if self.grid:
-            plt.grid(True)
-        plt.draw()
-        plt.show()
+            ax.grid(True)
+        phasefile = None
         if self.plotfile is not None:
             phasefile = 'phase_' + self.plotfile
-            plt.savefig(phasefile)
+        show_figure(fig, phasefile, self.headless)
+
+    def render(self, kind='amp', format='png', **kwargs):
+        """
+        Returns the last amplitude (kind 'amp') or phase ('phase')
+        plot rendered in format as a string
+        """
+        return render_figure(self.figures[kind], format, **kwargs)
 
     def plot_linear(self, frequencies=None, options=None):
         self._plot_data_amp(frequencies=frequencies,
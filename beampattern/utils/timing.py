@@ -0,0 +1,170 @@
+"""
+Per-phase time accounting for map runs. The map engines and
+drivers mark the phases of a map (stage motion, synthesizer
+settling, detector integration, bus I/O, file writes and plot
+redraws) with the phase() context manager. When a PhaseTimer is
+active the time spent in each phase is accumulated; otherwise
+phase() does nothing.
+
+Phases nest and time is attributed exclusively, to the innermost
+phase. The exceptions are motion and detector: the bus traffic
+while waiting on the stage or on a reading (serial polls, the
+blocking read of a measurement) is bounded by the instrument, not
+the bus, so it is counted as motion or detector time.
+
+Phases entered from other threads (the workers of a pipelined map
+loop) are accounted in the same way but kept apart as background
+time, since they overlap the phases of the map thread.
+"""
+
+import time
+import threading
+from contextlib import contextmanager
+
+PHASES = ('motion', 'settle', 'detector', 'io', 'file', 'plot')
+ABSORBING = ('motion', 'detector')
+
+_active = None
+
+
+class PhaseTimer(object):
+    """
+    Accumulates exclusive time per phase name. Phases entered
+    from the thread that started the timer go to totals, those
+    from any other thread to background.
+    """
+    def __init__(self):
+        self.totals = {}
+        self.counts = {}
+        self.background = {}
+        self.background_counts = {}
+        self.t_start = None
+        self.t_stop = None
+        self._stacks = {}
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        global _active
+        self.totals = dict([(name, 0.0) for name in PHASES])
+        self.counts = dict([(name, 0) for name in PHASES])
+        self.background = dict([(name, 0.0) for name in PHASES])
+        self.background_counts = dict([(name, 0) for name in PHASES])
+        self._stacks = {}
+        self._thread = threading.current_thread()
+        self.t_stop = None
+        self.t_start = time.time()
+        _active = self
+
+    def stop(self):
+        global _active
+        self.t_stop = time.time()
+        if _active is self:
+            _active = None
+
+    def _stack(self):
+        """The phase stack of the calling thread"""
+        thread = threading.current_thread()
+        with self._lock:
+            return self._stacks.setdefault(thread, [])
+
+    def enter(self, name):
+        stack = self._stack()
+        if stack and stack[-1][0] in ABSORBING + (None,):
+            # counted as part of the enclosing phase
+            stack.append([None, None, None])
+        else:
+            stack.append([name, time.time(), 0.0])
+
+    def exit(self):
+        stack = self._stack()
+        name, t0, child = stack.pop()
+        if name is None:
+            return
+        elapsed = time.time() - t0
+        if threading.current_thread() is self._thread:
+            totals, counts = self.totals, self.counts
+        else:
+            totals, counts = self.background, self.background_counts
+        with self._lock:
+            totals[name] = totals.get(name, 0.0) + elapsed - child
+            counts[name] = counts.get(name, 0) + 1
+        if stack:
+            stack[-1][2] += elapsed
+
+    def elapsed(self):
+        if self.t_start is None:
+            return 0.0
+        if self.t_stop is None:
+            return time.time() - self.t_start
+        return self.t_stop - self.t_start
+
+    def summary(self):
+        """
+        Returns a dictionary with the total elapsed time, the
+        exclusive time and entry count of each phase, and the
+        unaccounted remainder as 'other'. Phases taken on other
+        threads are listed the same way under 'background'.
+        """
+        total = self.elapsed()
+        phases = {}
+        for name in self.totals:
+            phases[name] = {'seconds': self.totals[name],
+                            'count': self.counts[name]}
+        phases['other'] = {'seconds': total - sum(self.totals.values()),
+                           'count': 0}
+        background = {}
+        for name in self.background:
+            if self.background_counts[name]:
+                background[name] = {'seconds': self.background[name],
+                                    'count': self.background_counts[name]}
+        return {'elapsed': total, 'phases': phases, 'background': background}
+
+
+def active_timer():
+    return _active
+
+
+@contextmanager
+def phase(name):
+    """Attribute the time spent in the block to phase name"""
+    timer = _active
+    if timer is None:
+        yield
+        return
+    timer.enter(name)
+    try:
+        yield
+    finally:
+        timer.exit()
+
+
+def settle(secs):
+    """Sleep secs while waiting on an instrument to settle"""
+    with phase('settle'):
+        time.sleep(secs)
+
+
+class TimedFile(object):
+    """File wrapper that books writes to the file phase"""
+    def __init__(self, fp):
+        self.fp = fp
+
+    def write(self, text):
+        with phase('file'):
+            self.fp.write(text)
+
+    def flush(self):
+        with phase('file'):
+            self.fp.flush()
+
+    def close(self):
+        with phase('file'):
+            self.fp.close()
+
+    def __getattr__(self, attr):
+        return getattr(self.fp, attr)
+
+
+def timed_open(filename, mode='w'):
+    return TimedFile(open(filename, mode))
@@ -0,0 +1,80 @@
+"""
+Motion handling shared by the Unidex 11 drivers (linux-gpib and
+Prologix). The drivers provide status_byte(), the serial poll
+status byte of the controller, and keep expected_move_time,
+pos_az and pos_el up to date; this mixin waits on the motion bit
+and tells the on_motion hook when the stage starts and stops.
+"""
+
+import time
+
+from beampattern.utils.beampattern_exceptions import BeamPatternGeneralError
+from beampattern.utils.timing import phase
+from beampattern.logging import logger
+
+logger.name = __name__
+
+MOTION = 0x20   # status byte: command (move) in progress
+
+
+class UnidexMotion(object):
+    """Mixin waiting on the motion bit of a Unidex 11"""
+    poll_interval = 0.1   # seconds between serial polls
+    rise_window = 0.25    # seconds allowed for the motion bit to come up
+    motion_margin = 5.0   # extra seconds allowed over expected move time
+    home_timeout = 30.0   # homing can start from anywhere in range
+    expected_move_time = None
+    on_motion = None      # called as on_motion(pos_az, pos_el, settled)
+
+    def command_in_progress(self):
+        """
+        Returns True if some command is
+        in progress
+        """
+        return bool(self.status_byte() & MOTION)
+
+    def wait_for_motion(self, timeout=None, poll_interval=None):
+        """
+        Blocks until the controller has finished the last move.
+        The motion bit may come up some time after the command is
+        written, so a clear bit only means done once the bit has
+        been seen set, or once the expected move time (and at
+        least rise_window) has passed. If timeout is None it is
+        derived from the last commanded move (or the homing
+        timeout after a home command). Returns the time waited
+        in seconds.
+        """
+        if poll_interval is None:
+            poll_interval = self.poll_interval
+        if timeout is None:
+            if self.expected_move_time is None:
+                timeout = self.home_timeout
+            else:
+                timeout = 1.5*self.expected_move_time + self.motion_margin
+        not_before = max(self.rise_window, self.expected_move_time or 0.0)
+        with phase('motion'):
+            t0 = time.time()
+            seen = False
+            while True:
+                elapsed = time.time() - t0
+                if self.command_in_progress():
+                    seen = True
+                elif seen or elapsed >= not_before:
+                    break
+                if elapsed > timeout:
+                    logger.error("Motion not complete after %.2f seconds" % timeout)
+                    raise BeamPatternGeneralError("wait_for_motion",
+                                                  "Motion not complete after %.2f seconds" % timeout)
+                time.sleep(poll_interval)
+        elapsed = time.time() - t0
+        logger.debug("Motion complete in %.2f seconds" % elapsed)
+        self._notify_motion(True)
+        return elapsed
+
+    def _notify_motion(self, settled):
+        """
+        Tells the on_motion hook that a move is starting (settled
+        False) or that the stage has stopped at pos_az, pos_el
+        """
+        if self.on_motion is not None:
+            self.on_motion(self.pos_az, self.pos_el, settled)
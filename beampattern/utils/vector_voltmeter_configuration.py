@@ -39,12 +39,26 @@ fileloglevel  = integer(5, 50, default=10)
 consoleloglevel  = integer(5, 50, default=10)
 # comment is a long string which gets written to the output data file
 comment = string(max=150, default="BeamMap at 74 GHz")
+# output_format: 'ascii' writes the usual text data file, 'npz'
+# writes a binary numpy container (same name with a .npz extension)
+# holding the data at full precision along with the header and
+# configuration, and 'both' writes the two
+output_format = option('ascii', 'npz', 'both', default='ascii')
+# checkpoint: keep a journal of the map next to the data file, so
+# that an interrupted map can be continued with --resume
+checkpoint = boolean(default=True)
+# fsync_interval: seconds between forced writes of the journal to disk
+fsync_interval = float(0.0, 600.0, default=10.0)
 
 #general plot specific items
 [plot]
 #figsize is figure size in pixels (x,y)
 figsize = int_list(min=2, max=2, default=list(800, 600))
-#more plot configs to follow later
+# live: show the map as it is taken. The plot runs in its own
+# process so the stage and instruments never wait on it
+live = boolean(default=True)
+# refresh: minimum seconds between redraws of the live plot
+refresh = float(0.05, 10.0, default=0.5)
 
 [devices]
 # use the unidex11?
@@ -65,6 +79,19 @@ xinc = float(0.1, 180.0, default=1.0)
 xmap_vel = float(0.1, 30.0, default=2.0)
 # xslew_vel: slew velocity in degrees/second
 xslew_vel = float(0.1, 30.0, default=5.0)
+# Adaptive maps (make_adaptive_map) start from the xinc grid and
+# split intervals where the beam changes fastest, down to xinc_min
+xinc_min = float(0.001, 180.0, default=0.1)
+# refine_threshold: change in level plus curvature (dB) across an
+# interval above which it is split
+refine_threshold = float(0.0, 100.0, default=3.0)
+# dynamic_range: dB below the peak treated as the sidelobe floor,
+# which is not refined any further
+dynamic_range = float(3.0, 120.0, default=40.0)
+# max_points: most positions an adaptive map may take (0: no limit)
+max_points = integer(0, 100000, default=0)
+# max_time: most seconds an adaptive map may run for (0: no limit)
+max_time = float(0.0, 1000000.0, default=0.0)
 
 [elevation]
 #This object contains configuration items specific to maps
@@ -76,10 +103,40 @@ ymax = float(-180.0, 180.0, default=90)
 # yinc: map step in degrees
 yinc = float(0.1, 180.0, default=1.0)
 
+[unidex]
+# This object contains configuration items specific to
+# motion completion on the unidex11
+# poll_interval: seconds between serial polls of the motion bit
+poll_interval = float(0.01, 5.0, default=0.1)
+# motion_margin: seconds allowed beyond the expected move time
+# before a move is declared as failed
+motion_margin = float(0.0, 120.0, default=5.0)
+# home_timeout: seconds allowed for a home command to complete
+home_timeout = float(1.0, 300.0, default=30.0)
+# move_overhead: typical seconds a step costs beyond distance/velocity
+# (acceleration and polling). Used to pick the map loop order
+move_overhead = float(0.0, 10.0, default=0.3)
+
 [synthesizer]
 # This object contains configuration items specific to 
 # setting frequencies in synth
 freq = float_list(min=1, max=100, default=list(11.7, 12.0, 12.2))
+# loop_order: 'position' moves the stage once and sweeps all the
+# frequencies at each point, 'frequency' tunes each frequency once
+# and sweeps the stage across the map for it, 'auto' picks the
+# ordering estimated to be faster
+loop_order = option('position', 'frequency', 'auto', default='position')
+
+[dio]
+# settle: seconds to wait after switching the digital channel
+# lines of a digital map
+settle = float(0.0, 5.0, default=0.050)
+# loop_order: at each position of a digital map, 'frequency' takes
+# every channel at one frequency before retuning, 'channel' every
+# frequency on one channel before switching, and 'auto' picks the
+# faster from the measured retune and switch times. The columns of
+# the data file are in the same order either way
+loop_order = option('frequency', 'channel', 'auto', default='auto')
 
 [vector_voltmeter]
 # This object contains configuration items specfic to
@@ -87,6 +144,11 @@ freq = float_list(min=1, max=100, default=list(11.7, 12.0, 12.2))
 # freq is a list of floats
 meas = string(max=10, default="TRAN")
 avg_value = integer(1, 4096, default=3)
+# block: take the avg_value readings of an averaged measurement as
+# one bus triggered block, fetched in a single transfer, rather
+# than one query per reading. Off by default until the trigger and
+# fetch sequence has been checked on the 8508A
+block = boolean(default=False)
 """
 
 def default_config():
@@ -0,0 +1,106 @@
+"""
+Tests of the terminator and block aware transport buffering
+"""
+
+import unittest
+
+from beampattern.utils.buffered_reader import BufferedReader, block_length, \
+     definite_blocks
+from beampattern.utils.beampattern_exceptions import BeamPatternGeneralError
+
+
+class FakeTransport(object):
+    """Hands out the given pieces, one per recv call, then ''"""
+    def __init__(self, pieces):
+        self.pieces = list(pieces)
+        self.calls = 0
+
+    def recv(self, size):
+        self.calls += 1
+        if not self.pieces:
+            return ''
+        piece = self.pieces.pop(0)
+        if len(piece) > size:
+            piece, rest = piece[:size], piece[size:]
+            self.pieces.insert(0, rest)
+        return piece
+
+
+def reader(pieces, chunk=4096):
+    transport = FakeTransport(pieces)
+    return BufferedReader(transport.recv, chunk=chunk), transport
+
+
+class BlockTest(unittest.TestCase):
+    def test_block_length(self):
+        self.assertEqual(block_length('#15abcde'), 8)
+        self.assertEqual(block_length('xx#210' + 'a'*10, 2), 14)
+
+    def test_block_length_needs_more(self):
+        self.assertEqual(block_length('#'), None)
+        self.assertEqual(block_length('#3'), None)
+
+    def test_not_a_block(self):
+        self.assertRaises(BeamPatternGeneralError, block_length, 'abc')
+        self.assertRaises(BeamPatternGeneralError, block_length, '#0')
+
+    def test_definite_blocks(self):
+        self.assertEqual(definite_blocks('#13a\nb,#12\n\n\n'), ['a\nb', '\n\n'])
+
+    def test_truncated_block(self):
+        self.assertRaises(BeamPatternGeneralError, definite_blocks, '#15abc')
+
+
+class BufferedReaderTest(unittest.TestCase):
+    def test_read_until_carries_leftover(self):
+        rdr, transport = reader(['1.0\n2.0\n3.'])
+        self.assertEqual(rdr.read_until(), '1.0\n')
+        self.assertEqual(rdr.read_until(), '2.0\n')
+        self.assertEqual(transport.calls, 1)
+        self.assertEqual(rdr.buffer, '3.')
+
+    def test_read_until_split_terminator(self):
+        rdr, transport = reader(['abc\r', '\ndef\r\n'])
+        self.assertEqual(rdr.read_until('\r\n'), 'abc\r\n')
+        self.assertEqual(rdr.read_until('\r\n'), 'def\r\n')
+
+    def test_message_with_terminator_in_block(self):
+        payload = 'a\nb\n'
+        rdr, transport = reader(['#14' + payload + '\nnext\n'])
+        self.assertEqual(rdr.read_message(), '#14' + payload + '\n')
+        self.assertEqual(rdr.read_message(), 'next\n')
+
+    def test_message_block_split_across_reads(self):
+        # split inside the header, the length and the data
+        pieces = ['HDR,#', '2', '1', '0\n\n\n\n', '\n\n\n\n\n\n', '\n']
+        rdr, transport = reader(pieces)
+        self.assertEqual(rdr.read_message(), 'HDR,#210' + '\n'*10 + '\n')
+        self.assertEqual(transport.calls, len(pieces))
+        self.assertEqual(rdr.buffer, '')
+
+    def test_message_hash_outside_block(self):
+        rdr, transport = reader(['#x\n'])
+        self.assertEqual(rdr.read_message(), '#x\n')
+
+    def test_read_exactly_across_chunks(self):
+        rdr, transport = reader(['abcdefghij'*3], chunk=4)
+        self.assertEqual(rdr.read_exactly(10), 'abcdefghij')
+        self.assertEqual(transport.calls, 3)
+        self.assertEqual(rdr.buffer, 'ab')
+        self.assertEqual(rdr.read_exactly(2), 'ab')
+        self.assertEqual(transport.calls, 3)
+
+    def test_read_returns_buffered_first(self):
+        rdr, transport = reader(['abc\ndef'])
+        rdr.read_until()
+        self.assertEqual(rdr.read(), 'def')
+        self.assertEqual(transport.calls, 1)
+
+    def test_timeout(self):
+        rdr, transport = reader(['partial'])
+        self.assertRaises(BeamPatternGeneralError, rdr.read_until)
+        self.assertEqual(rdr.clear(), 'partial')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+"""
+Tests of the serial poll status byte, which linux-gpib hands
+back as a one character string
+"""
+
+import sys
+import types
+import unittest
+
+
+class FakeGpib(object):
+    """The parts of the linux-gpib module the drivers use"""
+    T10s = 13
+    IbaPAD = 1
+    IbaSAD = 2
+    IbaTMO = 3
+
+    class GpibError(Exception):
+        pass
+
+    def __init__(self):
+        self.polls = []
+        self.output = ''
+
+    def find(self, name):
+        return 0
+
+    def dev(self, board, pad, sad=0, tmo=13, eot=1, eos=0):
+        return 0
+
+    def close(self, ud):
+        pass
+
+    def ask(self, ud, option):
+        return 0
+
+    def write(self, ud, text):
+        self.output = 'HP3457A\r\n'
+
+    def read(self, ud, size):
+        text, self.output = self.output[:size], self.output[size:]
+        return text
+
+    def trigger(self, ud):
+        pass
+
+    def serial_poll(self, ud):
+        if len(self.polls) > 1:
+            return self.polls.pop(0)
+        return self.polls[0]
+
+
+try:
+    import gpib
+except ImportError:
+    fake = types.ModuleType('gpib')
+    fake.__dict__.update([(name, getattr(FakeGpib, name))
+                          for name in ('T10s', 'IbaPAD', 'IbaSAD', 'IbaTMO', 'GpibError')])
+    sys.modules['gpib'] = fake
+
+from beampattern.gpib_devices import myGpib
+from beampattern.gpib_devices import hp3457a_multimeter
+
+
+class SerialPollTest(unittest.TestCase):
+    def setUp(self):
+        self.real_gpib = myGpib.gpib
+        self.fake = FakeGpib()
+        myGpib.gpib = self.fake
+
+    def tearDown(self):
+        myGpib.gpib = self.real_gpib
+
+    def test_str_status_byte(self):
+        self.fake.polls = ['\x50']
+        dev = myGpib.Gpib(0)
+        self.assertEqual(dev.serial_poll(), 0x50)
+        self.assertEqual(dev.spb, 0x50)
+
+    def test_int_status_byte(self):
+        self.fake.polls = [0x10]
+        self.assertEqual(myGpib.Gpib(0).serial_poll(), 0x10)
+
+    def test_multimeter_waits_for_ready(self):
+        dmm = hp3457a_multimeter.Multimeter(poll_interval=0.001)
+        self.assertEqual(dmm.idstr, 'HP3457A')
+        self.fake.polls = ['\x10', '\x00', '\x00', '\x10']
+        dmm.wait_for_readings(1)
+        self.assertEqual(self.fake.polls, ['\x10'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+"""
+Tests of the cut integrals of BeamIntegral
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+import numpy
+
+from beampattern.utils.configuration import Configuration
+from beampattern.utils.integrals import BeamIntegral
+from beampattern.map.scan_planning import position_grid, cell_widths
+
+HEADER = "# Beammap Timestamp: 20260101_120000\n# Configfile: integral.cfg\n"
+ADAPTIVE = "# Adaptive map: %d positions in 3 passes; xinc_min: 0.250 deg\n"
+
+
+def beam_values(azimuths):
+    """Gaussian beams of 2 and 3 degrees, for the six frequencies"""
+    azimuths = numpy.asarray(azimuths)[:, numpy.newaxis]
+    return numpy.exp(-0.5*(azimuths/numpy.array([2.0, 3.0]*3))**2)
+
+
+class BeamIntegralTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(prefix='beampattern_test_')
+        Configuration(os.path.join(self.tmpdir, 'integral.cfg'))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+    def write_map(self, azimuths, header=HEADER):
+        filename = os.path.join(self.tmpdir, 'beamscan_integral.txt')
+        fp = open(filename, 'w')
+        fp.write(header)
+        for az, values in zip(azimuths, beam_values(azimuths)):
+            fp.write(','.join(['%.6f' % az] + ['%.6f,0.0' % v for v in values]) + '\n')
+        fp.close()
+        return BeamIntegral(filename)
+
+    def test_clipped_regular_grid(self):
+        # the last step of the grid is clipped to 2 degrees
+        azimuths = position_grid(-10.0, 10.0, 3.0)
+        frame = self.write_map(azimuths).integrate(radius=9.5)
+        values = beam_values(azimuths)
+        numpy.testing.assert_allclose(frame['inner'], values[numpy.abs(azimuths) <= 9.5].sum(axis=0),
+                                      rtol=1e-5)
+        numpy.testing.assert_allclose(frame['all'], values.sum(axis=0), rtol=1e-5)
+
+    def test_adaptive_map_weighted(self):
+        azimuths = numpy.array([-4.0, -2.0, -1.0, -0.5, 0.0, 0.5, 1.0, 2.0, 4.0])
+        frame = self.write_map(azimuths, HEADER + ADAPTIVE % len(azimuths)).integrate(radius=10.0)
+        values = beam_values(azimuths)
+        weights = cell_widths(azimuths)/2.0
+        numpy.testing.assert_allclose(frame['all'], (values*weights[:, numpy.newaxis]).sum(axis=0),
+                                      rtol=1e-5)
+        self.assertTrue(numpy.all(frame['all'] < values.sum(axis=0)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+"""
+Tests of MapFollower, reading a map file while it is written
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+import numpy
+
+from beampattern.utils.configuration import Configuration
+from beampattern.utils.mapfile import MapFollower
+
+HEADER = "# Beammap Timestamp: 20260101_120000\n# Configfile: follow.cfg\n"
+
+
+def row_text(rows):
+    return ''.join([','.join(['%g' % v for v in row]) + '\n' for row in rows])
+
+
+class MapFollowerTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(prefix='beampattern_test_')
+        Configuration(os.path.join(self.tmpdir, 'follow.cfg'))
+        self.filename = os.path.join(self.tmpdir, 'beamscan_follow.txt')
+        self.follower = MapFollower(self.filename, Configuration)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+    def write(self, text, mode='a'):
+        fp = open(self.filename, mode)
+        fp.write(text)
+        fp.close()
+
+    def test_missing_file(self):
+        self.assertEqual(len(self.follower.poll()), 0)
+
+    def test_header_only(self):
+        self.write(HEADER)
+        self.assertEqual(len(self.follower.poll()), 0)
+        self.assertEqual(self.follower.header, None)
+        self.assertEqual(self.follower.data.shape[0], 0)
+        self.write(row_text([[-2.0, 1.0, 0.1]]))
+        new = self.follower.poll()
+        self.assertEqual(new.tolist(), [[-2.0, 1.0, 0.1]])
+        self.assertEqual(self.follower.header.cfgfile, 'follow.cfg')
+        self.assertTrue(len(self.follower.frequencies) > 0)
+
+    def test_partial_last_line(self):
+        self.write(HEADER + "-2,1,0.1\n-1,2,")
+        self.assertEqual(self.follower.poll().tolist(), [[-2.0, 1.0, 0.1]])
+        self.assertEqual(self.follower.partial, "-1,2,")
+        self.assertEqual(len(self.follower.poll()), 0)
+        self.write("0.2\n")
+        self.assertEqual(self.follower.poll().tolist(), [[-1.0, 2.0, 0.2]])
+        self.assertEqual(self.follower.data.tolist(), [[-2.0, 1.0, 0.1], [-1.0, 2.0, 0.2]])
+
+    def test_file_shrinks(self):
+        self.write(HEADER + row_text([[k, k, k] for k in range(5)]))
+        self.assertEqual(len(self.follower.poll()), 5)
+        self.write(HEADER + row_text([[9, 9, 9]]), mode='w')
+        self.assertEqual(self.follower.poll().tolist(), [[9.0, 9.0, 9.0]])
+        self.assertEqual(self.follower.data.tolist(), [[9.0, 9.0, 9.0]])
+
+    def test_growth(self):
+        rows = numpy.arange(3*300, dtype=float).reshape(300, 3)
+        self.write(HEADER + row_text(rows[:64]))
+        self.follower.poll()
+        self.assertEqual(len(self.follower._data), 64)
+        self.write(row_text(rows[64:65]))
+        self.follower.poll()
+        self.assertEqual(len(self.follower._data), 128)
+        self.write(row_text(rows[65:]))
+        self.assertEqual(len(self.follower.poll()), 235)
+        self.assertEqual(len(self.follower._data), 300)
+        self.assertEqual(self.follower.nrows, 300)
+        numpy.testing.assert_array_equal(self.follower.data, rows)
+
+
+if __name__ == '__main__':
+    unittest.main()
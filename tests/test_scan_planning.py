@@ -0,0 +1,136 @@
+"""
+Tests of the scan planning helpers shared by the map engines
+"""
+
+import time
+import unittest
+import numpy
+
+from beampattern.map.scan_planning import position_grid, serpentine_indices, \
+     frequency_outer_scan, scan_start, choose_loop_order, refine_positions, \
+     adaptive_scan, db_levels
+
+
+class GridTest(unittest.TestCase):
+    def test_position_grid_clips(self):
+        numpy.testing.assert_allclose(position_grid(-1.0, 1.0, 0.8), [-1.0, -0.2, 0.6, 1.0])
+
+    def test_serpentine(self):
+        sweeps = [list(s) for s in serpentine_indices(3, 3)]
+        self.assertEqual(sweeps, [[0, 1, 2], [2, 1, 0], [0, 1, 2]])
+
+
+class FrequencyOuterTest(unittest.TestCase):
+    def scan(self, npos, nfreq, done=None):
+        calls = []
+        rows = []
+        results = frequency_outer_scan(npos, nfreq,
+                                       lambda i: calls.append(('tune', i)),
+                                       lambda j: calls.append(('move', j)),
+                                       lambda i, j: (i, j), done=done,
+                                       emit=lambda j, row: rows.append((j, list(row))))
+        return calls, rows, results
+
+    def test_rows_emitted_in_order(self):
+        for nfreq in (1, 2, 3, 4):
+            calls, rows, results = self.scan(4, nfreq)
+            self.assertEqual([j for j, row in rows], range(4))
+            for j, row in rows:
+                self.assertEqual(row, [(i, j) for i in range(nfreq)])
+            first_move = [c for c in calls if c[0] == 'move'][0]
+            self.assertEqual(first_move[1], scan_start(4, nfreq, 'frequency'))
+
+    def test_done_points_not_retaken(self):
+        done = lambda i, j: ('saved', i, j) if j < 2 else None
+        calls, rows, results = self.scan(4, 2, done=done)
+        self.assertEqual(sorted([j for kind, j in calls if kind == 'move']), [2, 2, 3, 3])
+        self.assertEqual(rows[0], (0, [('saved', 0, 0), ('saved', 1, 0)]))
+
+    def test_choose_loop_order(self):
+        tuned = []
+        retune = lambda freq: tuned.append(freq)
+        positions = numpy.arange(10.0)
+        self.assertEqual(choose_loop_order('position', positions, [1.0, 2.0], retune,
+                                           1.0, 0.5, 1.0), 'position')
+        self.assertEqual(tuned, [])
+        # slow retunes favour sweeping the map once per frequency
+        self.assertEqual(choose_loop_order('auto', positions, [1.0, 2.0], retune,
+                                           10.0, 0.0, 5.0), 'frequency')
+        # a slow stage favours taking all frequencies at each position
+        self.assertEqual(choose_loop_order('auto', positions, [1.0, 2.0], retune,
+                                           0.1, 5.0, 0.01), 'position')
+        self.assertEqual(tuned, [1.0, 1.0])
+
+
+class AdaptiveTest(unittest.TestCase):
+    def test_refine_flat(self):
+        positions = numpy.arange(5.0)
+        self.assertEqual(len(refine_positions(positions, numpy.zeros(5), 0.1, 1.0)), 0)
+
+    def test_refine_picks_steps(self):
+        positions = numpy.arange(5.0)
+        levels = numpy.array([0.0, 0.0, -10.0, -10.0, -10.0])
+        new = refine_positions(positions, levels, 0.1, 3.0)
+        self.assertEqual(new[0], 1.5)
+        self.assertEqual(refine_positions(positions, levels, 0.1, 3.0, max_new=1).tolist(), [1.5])
+
+    def test_refine_min_step(self):
+        positions = numpy.array([0.0, 0.1, 0.2])
+        levels = numpy.array([0.0, -20.0, 0.0])
+        self.assertEqual(len(refine_positions(positions, levels, 0.1, 1.0)), 0)
+
+    def test_refine_series(self):
+        positions = numpy.arange(3.0)
+        levels = numpy.array([[0.0, 0.0], [0.0, -10.0], [0.0, -10.0]])
+        self.assertEqual(refine_positions(positions, levels, 0.1, 5.0)[0], 0.5)
+
+    def test_adaptive_scan(self):
+        beam = lambda x: numpy.exp(-0.5*(x/1.0)**2)
+        taken = []
+
+        def take(positions):
+            taken.extend(positions)
+            return [beam(p) for p in positions]
+
+        coarse = numpy.arange(-8.0, 8.5, 2.0)
+        positions, values, npasses = adaptive_scan(coarse, take,
+                                                   lambda v: db_levels(v, 30.0),
+                                                   0.25, 3.0)
+        self.assertTrue(npasses > 1)
+        self.assertEqual(len(taken), len(set(taken)))
+        self.assertTrue(numpy.all(numpy.diff(positions) > 0))
+        numpy.testing.assert_allclose(values, beam(positions))
+        # points are added where the beam changes, not on the floor
+        inner = positions[numpy.abs(positions) <= 3.0]
+        outer = positions[numpy.abs(positions) > 5.0]
+        self.assertTrue(numpy.diff(inner).min() < 2.0)
+        self.assertTrue(numpy.diff(outer).min() >= 2.0 or len(outer) < 2)
+
+    def test_adaptive_scan_point_budget(self):
+        take = lambda positions: [numpy.exp(-p**2) for p in positions]
+        positions, values, npasses = adaptive_scan(numpy.arange(-4.0, 4.5, 1.0), take,
+                                                   lambda v: db_levels(v, 30.0),
+                                                   0.01, 1.0, max_points=12)
+        self.assertEqual(len(positions), 12)
+
+    def test_adaptive_scan_time_budget(self):
+        take = lambda positions: [numpy.exp(-p**2) for p in positions]
+        coarse = numpy.arange(-4.0, 4.5, 1.0)
+        args = (lambda v: db_levels(v, 30.0), 0.01, 1.0)
+        # a take too quick to time leaves the budget unused
+        real_time = time.time
+        time.time = lambda: 100.0
+        try:
+            positions, values, npasses = adaptive_scan(coarse, take, *args, max_time=1.0)
+        finally:
+            time.time = real_time
+        self.assertTrue(npasses > 1)
+        # a spent budget stops refining after the coarse pass
+        slow = lambda positions: time.sleep(0.02) or take(positions)
+        positions, values, npasses = adaptive_scan(coarse, slow, *args, max_time=0.01)
+        self.assertEqual(npasses, 1)
+        self.assertEqual(len(positions), len(coarse))
+
+
+if __name__ == '__main__':
+    unittest.main()